@@ -6,15 +6,76 @@
 
 from typing import Optional, Dict, List, Tuple
 
+import numpy as np
 from pydantic import BaseModel, ConfigDict
 
+from vagents.vagentic.emb.cache import EmbeddingCache
+
 
 class Emb(BaseModel):
     """Base class for managing embedders"""
 
     dimensions: int = 1536
+    cache: Optional[EmbeddingCache] = None
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    @property
+    def cache_model_name(self) -> str:
+        """Model identifier used in cache keys"""
+        return getattr(self, "model", None) or self.__class__.__name__
+
+    def cache_key(self, text: str) -> str:
+        return EmbeddingCache.make_key(self.cache_model_name, self.dimensions, text)
+
     def get_embedding(self, text: str) -> List[float]:
-        raise NotImplementedError
\ No newline at end of file
+        """Returns the embedding of a text, served from the cache when one is configured"""
+        if self.cache is None:
+            return self._get_embedding(text)
+
+        key = self.cache_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached.tolist()
+        embedding = self._get_embedding(text)
+        if len(embedding) > 0:
+            self.cache.put(key, embedding)
+        return embedding
+
+    def get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Returns the embeddings of many texts as a contiguous (len(texts), dims) float32 matrix"""
+        if len(texts) == 0:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+        if self.cache is None:
+            return self._as_matrix(self._get_embeddings(texts, batch_size=batch_size))
+
+        keys = [self.cache_key(text) for text in texts]
+        found = self.cache.get_many(keys)
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = self._as_matrix(self._get_embeddings(list(missing.values()), batch_size=batch_size))
+            new_items = list(zip(missing.keys(), computed))
+            self.cache.put_many(new_items)
+            found.update(new_items)
+
+        width = len(next(iter(found.values())))
+        matrix = np.empty((len(texts), width), dtype=np.float32)
+        for i, key in enumerate(keys):
+            matrix[i] = found[key]
+        return matrix
+
+    def _get_embedding(self, text: str) -> List[float]:
+        """Computes the embedding of a text, implemented by each backend"""
+        raise NotImplementedError
+
+    def _get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Computes the embeddings of many texts, backends override this with a native batch call"""
+        return self._as_matrix([self._get_embedding(text) for text in texts])
+
+    @staticmethod
+    def _as_matrix(embeddings) -> np.ndarray:
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
@@ -0,0 +1,199 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 10:05
+# Author:david yuan
+# @File:batcher.py
+# @Software:VeSync
+
+'''
+Batched, concurrent embedding generation.
+
+Inputs are packed into requests up to a token budget, several requests run at
+once under a concurrency limit, and results come back in the original order.
+A request that keeps failing is split in half so only the failing inputs are
+retried.
+'''
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+EmbedFn = Callable[[List[str]], List[List[float]]]
+
+
+class EmbeddingBatchError(RuntimeError):
+    """Raised when a sub-batch still fails after all retries and splits."""
+
+    def __init__(self, indices: List[int], error: Exception):
+        super().__init__(f"Embedding failed for {len(indices)} inputs: {error}")
+        self.indices = indices
+        self.error = error
+
+
+class EmbeddingBatcher:
+    """
+    Packs texts into token-bounded batches and embeds them concurrently.
+
+    :param embed_fn: Callable taking a list of texts and returning one vector per text, in order.
+    :param max_batch_tokens: Token budget of a single request.
+    :param max_batch_size: Maximum number of inputs in a single request.
+    :param max_concurrency: Number of requests in flight at once.
+    :param max_retries: Retries per sub-batch before it is split.
+    :param backoff: Base delay in seconds for exponential backoff between retries.
+    :param encoding_name: tiktoken encoding used to count tokens, if tiktoken is installed.
+    """
+
+    def __init__(
+            self,
+            embed_fn: EmbedFn,
+            max_batch_tokens: int = 100_000,
+            max_batch_size: int = 256,
+            max_concurrency: int = 4,
+            max_retries: int = 3,
+            backoff: float = 0.5,
+            encoding_name: str = "cl100k_base",
+    ):
+        self.embed_fn = embed_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._last_error: Optional[Exception] = None
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding {encoding_name} unavailable, estimating tokens: {e}")
+
+    def count_tokens(self, text: str) -> int:
+        """Returns the token count of a text, estimated as ~4 chars per token without tiktoken."""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return max(1, len(text) // 4)
+
+    def make_batches(self, texts: Sequence[str]) -> List[List[int]]:
+        """
+        Greedily packs input indices into batches bounded by token budget and batch size.
+
+        :param texts: The input texts.
+        :return: A list of batches, each a list of indices into `texts`.
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        Embeds all texts and returns the vectors in input order.
+
+        :param texts: The input texts.
+        :return: One embedding per input text.
+        :raises EmbeddingBatchError: If some inputs could not be embedded.
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if not texts:
+            return []
+        batches = self.make_batches(texts)
+        logger.debug(f"Embedding {len(texts)} texts in {len(batches)} batches")
+
+        failed: List[int] = []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            futures = [executor.submit(self._run_batch, texts, batch) for batch in batches]
+            for future in futures:
+                for index, vector in future.result():
+                    if vector is None:
+                        failed.append(index)
+                    else:
+                        results[index] = vector
+
+        if failed:
+            raise EmbeddingBatchError(sorted(failed), self._last_error)
+        return results
+
+    def _run_batch(self, texts: Sequence[str], batch: List[int]) -> List[Tuple[int, Optional[List[float]]]]:
+        """Embeds one batch with retries, splitting it in half when retries are exhausted."""
+        inputs = [texts[i] for i in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embed_fn(inputs)
+                if len(vectors) != len(inputs):
+                    raise ValueError(f"expected {len(inputs)} embeddings, got {len(vectors)}")
+                return list(zip(batch, vectors))
+            except Exception as e:
+                self._last_error = e
+                logger.warning(f"Embedding batch of {len(batch)} failed (attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff * (2 ** attempt))
+
+        if len(batch) == 1:
+            return [(batch[0], None)]
+        middle = len(batch) // 2
+        return self._run_batch(texts, batch[:middle]) + self._run_batch(texts, batch[middle:])
+
+
+if __name__ == '__main__':
+    # Benchmark against a local stub embedding server with a fixed per-request latency.
+    import json
+    import threading
+    import urllib.request
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    latency, dims, n_texts = 0.05, 1536, 2000
+
+    class StubEmbeddingHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            time.sleep(latency)
+            data = [{"index": i, "embedding": [float(len(t) % 7)] * dims} for i, t in enumerate(inputs)]
+            payload = json.dumps({"data": data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/embeddings"
+
+    def stub_embed(batch: List[str]) -> List[List[float]]:
+        request = urllib.request.Request(url, data=json.dumps({"input": batch}).encode(), method="POST")
+        with urllib.request.urlopen(request) as response:
+            return [d["embedding"] for d in json.loads(response.read())["data"]]
+
+    corpus = [f"document chunk number {i} " * 20 for i in range(n_texts)]
+
+    start = time.perf_counter()
+    for text in corpus[:200]:
+        stub_embed([text])
+    sequential = (time.perf_counter() - start) / 200 * n_texts
+    print(f"sequential (extrapolated): {sequential:.2f}s for {n_texts} texts")
+
+    start = time.perf_counter()
+    vectors = EmbeddingBatcher(stub_embed, max_batch_size=128, max_concurrency=8).embed(corpus)
+    batched = time.perf_counter() - start
+    print(f"batched: {batched:.2f}s for {len(vectors)} texts ({sequential / batched:.1f}x)")
+    server.shutdown()
@@ -0,0 +1,84 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 11:20
+# Author:david yuan
+# @File:cache.py
+# @Software:VeSync
+
+'''
+Content-addressed embedding cache shared by all Emb implementations.
+
+Vectors are keyed by (model, dimensions, sha256(text)) and kept in two tiers:
+an in-process LRU and an optional SQLite file holding float32 blobs (see
+tiered_store).
+'''
+import hashlib
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from vagents.vagentic.emb.tiered_store import TieredStore
+
+
+def _decode(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """
+    Two-tier (memory LRU + SQLite) embedding cache. Errors of the SQLite file are logged and the
+    lookup falls through to the embedder.
+
+    :param max_memory_items: Maximum number of vectors kept in the in-process LRU, 0 disables it.
+    :param path: SQLite file of the on-disk tier, None keeps the cache in memory only.
+    :param max_disk_bytes: Size budget of the on-disk tier; least recently used rows are evicted beyond it.
+    """
+
+    def __init__(self, max_memory_items: int = 10_000, path: Optional[str] = None,
+                 max_disk_bytes: int = 1 << 30):
+        self.path = path
+        self._store = TieredStore("embeddings", np.ndarray.tobytes, _decode, max_memory_items, path, max_disk_bytes)
+
+    @staticmethod
+    def make_key(model: str, dimensions: int, text: str) -> str:
+        """Returns the cache key of a text embedded by `model` at `dimensions`."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions}:{digest}"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns the cached vector for `key`, or None."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Looks up several keys at once.
+
+        :param keys: Cache keys built with `make_key`.
+        :return: A dict with the keys that were found; missing keys are absent.
+        """
+        return self._store.get_many(keys)
+
+    def put(self, key: str, vector: Iterable[float]) -> None:
+        """Stores one vector."""
+        self.put_many([(key, vector)])
+
+    def put_many(self, items: Sequence[Tuple[str, Iterable[float]]]) -> None:
+        """
+        Stores several vectors in both tiers.
+
+        :param items: (key, vector) pairs.
+        """
+        self._store.put_many([(key, np.ascontiguousarray(vector, dtype=np.float32).reshape(-1))
+                              for key, vector in items])
+
+    def clear(self) -> None:
+        """Empties both tiers and resets the counters."""
+        self._store.clear()
+
+    def close(self) -> None:
+        self._store.close()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, disk errors and tier sizes."""
+        stats = self._store.stats()
+        del stats["expired"]  # vectors never expire
+        return stats
@@ -6,17 +6,48 @@
 import hashlib
 from typing import List
 
-from agentica.emb.base import Emb
+import numpy as np
+
+from vagents.vagentic.emb.base import Emb
 
 
 class HashEmb(Emb):
-    """A Literal Hash Embedding Function, which hashes the input text as a list of floats."""
+    """A Literal Hash Embedding Function, which hashes the input text as a list of floats.
+
+    Dimensions beyond 32 are filled by chaining SHA-256 digests (each block hashes the previous one),
+    so the first 32 values are the same at any size and the embedder can stand in for 384/768/1536-dim models.
+    """
     model: str = "literal_hash_emb"
     dimensions: int = 32
+    normalize: bool = False
+
+    @property
+    def cache_model_name(self) -> str:
+        """Normalized and raw vectors of the same text must not share a cache entry"""
+        return f"{self.model}:normalized" if self.normalize else self.model
+
+    def _digest(self, text: str) -> bytes:
+        # Calculate the SHA-256 hash of the text, chained until there are `dimensions` bytes
+        block = hashlib.sha256(text.encode()).digest()
+        blocks = [block]
+        size = len(block)
+        while size < self.dimensions:
+            block = hashlib.sha256(block).digest()
+            blocks.append(block)
+            size += len(block)
+        return b"".join(blocks)[:self.dimensions]
+
+    def _get_embedding(self, text: str) -> List[float]:
+        if self.normalize:
+            return self._get_embeddings([text])[0].tolist()
+        return [float(x) / 255.0 for x in self._digest(text)]
 
-    def get_embedding(self, text: str) -> List[float]:
-        # Calculate the SHA-256 hash of the text
-        hash_object = hashlib.sha256(text.encode())
-        hash_list = list(hash_object.digest())
-        float_list = [float(x) / 255.0 for x in hash_list]
-        return float_list
+    def _get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        # Hash the whole batch into one buffer and view it as an (N, dims) byte matrix
+        buffer = b"".join(self._digest(text) for text in texts)
+        matrix = np.frombuffer(buffer, dtype=np.uint8).reshape(len(texts), self.dimensions)
+        matrix = matrix.astype(np.float32) / 255.0
+        if self.normalize:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix
@@ -4,12 +4,15 @@
 # @File:openai_emb.py
 # @Software:VeSync
 
+import base64
 from os import getenv
-from typing import Optional, Dict, List, Tuple, Any
+from typing import Optional, Dict, List, Tuple, Any, Union
 
+import numpy as np
 from typing_extensions import Literal
 
 from vagents.vagentic.emb.base import Emb
+from vagents.vagentic.emb.batcher import EmbeddingBatcher
 try:
     from openai import OpenAI as OpenAIClient
     from openai.types.create_embedding_response import CreateEmbeddingResponse
@@ -28,6 +31,9 @@ class OpenAIEmb(Emb):
     request_params: Optional[Dict[str, Any]] = None
     client_params: Optional[Dict[str, Any]] = None
     openai_client: Optional[OpenAIClient] = None
+    # Batch requests: token budget per request and number of requests in flight
+    max_batch_tokens: int = 100_000
+    max_concurrency: int = 4
 
     @property
     def client(self) -> OpenAIClient:
@@ -45,7 +51,7 @@ class OpenAIEmb(Emb):
             _client_params.update(self.client_params)
         return OpenAIClient(**_client_params)
 
-    def _response(self, text: str) -> CreateEmbeddingResponse:
+    def _response(self, text: Union[str, List[str]]) -> CreateEmbeddingResponse:
         _request_params: Dict[str, Any] = {
             "input": text,
             "model": self.model,
@@ -59,7 +65,7 @@ class OpenAIEmb(Emb):
             _request_params.update(self.request_params)
         return self.client.embeddings.create(**_request_params)
 
-    def get_embedding(self, text: str) -> List[float]:
+    def _get_embedding(self, text: str) -> List[float]:
         response: CreateEmbeddingResponse = self._response(text=text)
         try:
             return response.data[0].embedding
@@ -67,9 +73,40 @@ class OpenAIEmb(Emb):
             print(f'get embedding failed: {e}')
             return []
 
+    def _get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        client = self.client
+        if self.openai_client is None:
+            # Reuse one client (and its connection pool) across the concurrent batch requests
+            self.openai_client = client
+        batcher = EmbeddingBatcher(
+            self._embed_batch,
+            max_batch_tokens=self.max_batch_tokens,
+            max_batch_size=batch_size,
+            max_concurrency=self.max_concurrency,
+        )
+        return self._as_matrix(batcher.embed(texts))
+
+    def _embed_batch(self, texts: List[str]) -> List[Any]:
+        response: CreateEmbeddingResponse = self._response(text=texts)
+        vectors = []
+        for item in sorted(response.data, key=lambda d: d.index):
+            embedding = item.embedding
+            if isinstance(embedding, str):
+                # encoding_format="base64" returns little-endian float32 bytes
+                embedding = np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+            vectors.append(embedding)
+        return vectors
+
     def get_embedding_and_usage(self, text: str) -> Tuple[List[float], Optional[Dict]]:
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key(text))
+            if cached is not None:
+                return cached.tolist(), {"prompt_tokens": 0, "total_tokens": 0}
+
         response: CreateEmbeddingResponse = self._response(text=text)
 
         embedding = response.data[0].embedding
         usage = response.usage
+        if self.cache is not None:
+            self.cache.put(self.cache_key(text), embedding)
         return embedding, usage.model_dump()
\ No newline at end of file
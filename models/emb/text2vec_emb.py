@@ -5,13 +5,15 @@
 """
 from typing import List, Optional, Dict, Any
 
+import numpy as np
+
 try:
     from text2vec import SentenceModel
 except ImportError:
     raise ImportError(
         "`text2vec` not installed. Please install it with `pip install text2vec`"
     )
-from agentica.emb.base import Emb
+from vagents.vagentic.emb.base import Emb
 
 
 class Text2VecEmb(Emb):
@@ -35,6 +37,10 @@ class Text2VecEmb(Emb):
         self.client = SentenceModel(**_client_params)
         return self.client
 
-    def get_embedding(self, text: str) -> List[float]:
+    def _get_embedding(self, text: str) -> List[float]:
         # Calculate emb of the text
         return self.get_client.encode([text])[0]
+
+    def _get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        # Encode the whole list in one call, SentenceModel batches internally
+        return self._as_matrix(self.get_client.encode(texts, batch_size=batch_size))
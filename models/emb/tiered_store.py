@@ -0,0 +1,272 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 10:20
+# Author:david yuan
+# @File:tiered_store.py
+# @Software:VeSync
+
+'''
+Two-tier key-value store behind the embedding and LLM response caches.
+
+Values live in an in-process LRU and, optionally, in a SQLite table with a
+size budget; least recently used rows are evicted beyond it, expired ones
+first. Entries may expire. The disk tier is best effort: SQLite errors are
+logged and counted, the lookup is treated as a miss and the write is dropped,
+so a locked or corrupt cache file never fails the call it caches.
+'''
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Blob = Union[bytes, str]
+
+_COLUMNS = ["key", "value", "size", "expires", "last_access"]
+
+
+class TieredStore:
+    """
+    Memory LRU + SQLite store of values with optional expiry.
+
+    :param table: SQLite table of the disk tier.
+    :param encode: Converts a value to the bytes or text stored on disk.
+    :param decode: Converts stored bytes or text back to a value.
+    :param max_memory_items: Maximum number of values kept in the in-process LRU, 0 disables it.
+    :param path: SQLite file of the disk tier, None keeps the store in memory only.
+    :param max_disk_bytes: Size budget of the disk tier.
+    """
+
+    def __init__(self, table: str, encode: Callable[[Any], Blob], decode: Callable[[Blob], Any],
+                 max_memory_items: int, path: Optional[str] = None, max_disk_bytes: int = 1 << 30):
+        self.table = table
+        self.encode = encode
+        self.decode = decode
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.path = path
+        # key -> (value, expires)
+        self._memory: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.errors = 0
+        if path:
+            try:
+                self._open(path)
+            except sqlite3.Error as e:
+                self._disk_error("open", e)
+                self._conn = None
+
+    def _open(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({self.table})")]
+        if columns and columns != _COLUMNS:  # written by an older layout; it is only a cache
+            self._conn.execute(f"DROP TABLE {self.table}")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, expires REAL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_access ON {self.table}(last_access)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def _disk_error(self, operation: str, error: Exception) -> None:
+        self.errors += 1
+        logger.warning(f"Cache {self.table}: {operation} on disk failed, skipping the disk tier: {error}")
+        if self._conn is not None:
+            try:
+                self._conn.rollback()
+                self._disk_bytes = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            except sqlite3.Error:
+                pass
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, Any]:
+        """Returns the values of the keys that are present and not expired."""
+        found: Dict[str, Any] = {}
+        with self._lock:
+            now = time.time()
+            pending: List[str] = []
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    pending.append(key)
+                elif entry[1] is None or entry[1] > now:
+                    self._memory.move_to_end(key)
+                    found[key] = entry[0]
+                    self.memory_hits += 1
+                else:
+                    self.expired += 1
+                    self._forget([key])
+
+            if pending and self._conn is not None:
+                try:
+                    found.update(self._load(pending, now))
+                except sqlite3.Error as e:
+                    self._disk_error("lookup", e)
+
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _load(self, keys: List[str], now: float) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        stale: List[str] = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, value, expires FROM {self.table} WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            hits = []
+            for key, blob, expires in rows:
+                if expires is not None and expires <= now:
+                    stale.append(key)
+                    continue
+                value = self.decode(blob)
+                found[key] = value
+                hits.append((now, key))
+                self._remember(key, value, expires)
+            self._conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", hits)
+        self._conn.commit()
+        self.disk_hits += len(found)
+        if stale:
+            self.expired += len(stale)
+            self._forget(stale)
+        return found
+
+    def put_many(self, items: Sequence[Tuple[str, Any]], expires: Optional[float] = None) -> None:
+        """
+        Stores values in both tiers.
+
+        :param items: (key, value) pairs.
+        :param expires: Time (time.time()) after which the values are dropped, None keeps them until evicted.
+        """
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value, expires)
+            if self._conn is None or not items:
+                return
+            try:
+                now = time.time()
+                rows = []
+                for key, value in items:
+                    blob = self.encode(value)
+                    size = len(blob.encode("utf-8")) if isinstance(blob, str) else len(blob)
+                    rows.append((key, blob, size, expires, now))
+                previous = self._disk_sizes([row[0] for row in rows])
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._disk_bytes += sum(row[2] for row in rows) - sum(previous.values())
+                self._evict_disk()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._disk_error("write", e)
+
+    def _disk_sizes(self, keys: List[str]) -> Dict[str, int]:
+        sizes: Dict[str, int] = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            sizes.update(self._conn.execute(
+                f"SELECT key, size FROM {self.table} WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return sizes
+
+    def _remember(self, key: str, value: Any, expires: Optional[float]) -> None:
+        if self.max_memory_items <= 0:
+            return
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _forget(self, keys: List[str]) -> None:
+        for key in keys:
+            self._memory.pop(key, None)
+        if self._conn is None:
+            return
+        try:
+            sizes = self._disk_sizes(keys)
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in sizes])
+            self._conn.commit()
+            self._disk_bytes -= sum(sizes.values())
+        except sqlite3.Error as e:
+            self._disk_error("delete", e)
+
+    def _evict_disk(self) -> None:
+        """Drops expired rows, then least recently used ones until the disk tier is under 90% of its budget."""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        now = time.time()
+        expired = self._conn.execute(f"SELECT COALESCE(SUM(size), 0), COUNT(*) FROM {self.table} "
+                                     "WHERE expires IS NOT NULL AND expires <= ?", (now,)).fetchone()
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires IS NOT NULL AND expires <= ?", (now,))
+        self._disk_bytes -= expired[0]
+        self.evictions += expired[1]
+        target = int(self.max_disk_bytes * 0.9)
+        cursor = self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access ASC")
+        doomed: List[str] = []
+        freed = 0
+        for key, size in cursor:
+            if self._disk_bytes - freed <= target:
+                break
+            doomed.append(key)
+            freed += size
+        cursor.close()
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in doomed])
+        self._disk_bytes -= freed
+        self.evictions += len(doomed)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        """Removes values from both tiers."""
+        with self._lock:
+            self._forget(list(keys))
+
+    def clear(self) -> None:
+        """Empties both tiers and resets the counters."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute(f"DELETE FROM {self.table}")
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    self._disk_error("clear", e)
+            self._disk_bytes = 0
+            self.memory_hits = self.disk_hits = self.misses = self.expired = self.evictions = self.errors = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, disk errors and tier sizes."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
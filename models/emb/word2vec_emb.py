@@ -5,13 +5,15 @@
 """
 from typing import List, Optional, Dict, Any
 
+import numpy as np
+
 try:
     from text2vec import Word2Vec
 except ImportError:
     raise ImportError(
         "`text2vec` not installed. Please install it with `pip install text2vec`"
     )
-from agentica.emb.base import Emb
+from vagents.vagentic.emb.base import Emb
 
 
 class Word2VecEmb(Emb):
@@ -34,6 +36,10 @@ class Word2VecEmb(Emb):
         self.client = Word2Vec(**_client_params)
         return self.client
 
-    def get_embedding(self, text: str) -> List[float]:
+    def _get_embedding(self, text: str) -> List[float]:
         # Calculate emb of the text
         return self.get_client.encode([text])[0]
+
+    def _get_embeddings(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        # Word2Vec averages word vectors, so the whole list is encoded in one call
+        return self._as_matrix(self.get_client.encode(texts))
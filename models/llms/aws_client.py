@@ -3,29 +3,54 @@
 # Author:david yuan
 # @File:amazon_titan_text_model.py
 
-import boto3
+import asyncio
 import json
 import os
 import base64
 import random
 import logging
 from botocore.exceptions import ClientError
+from vagents.vagentic.config import Config
+from vagents.vagentic.llms.client_pool import async_bedrock_client, bedrock_client
+from vagents.vagentic.llms.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+
+async def _iterate_in_thread(generator):
+    '''
+    Drives a blocking generator from a worker thread, one item at a time.
+    '''
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, generator, done)
+        if item is done:
+            return
+        yield item
+
 
 class AmazonTitanTextModelClient:
-    def __init__(self, region_name="us-east-1"):
+    '''
+    Bedrock text model client. The boto3 client is shared process-wide; the async methods use a
+    shared aiobotocore client per event loop, or the boto3 client in a thread without aiobotocore.
+
+    With a `response_cache` (ResponseCache), `chat` and `stream_chat` and their async versions return the
+    cached response of an identical request while the temperature is 0; streams are replayed chunk by chunk.
+    With a `semantic_cache` (SemanticCache), `user_chat` and `auser_chat` answer paraphrases of earlier
+    questions from the cache.
+    '''
+    def __init__(self, region_name="us-east-1", response_cache=None, semantic_cache=None):
         self.config = Config()
-        self.client = boto3.client(
-            "bedrock-runtime",
-            region_name=region_name,
-            aws_access_key_id=self.config.aws_access_key,
-            aws_secret_access_key=self.config.aws_access_secret,
-        )
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.region_name = region_name
+        self.client = bedrock_client(region_name)
         self.model_id = self.config.aws_model_id
         self.max_token_count = 512
         self.temperature = 0
         self.top_p = 0.9
 
-    def chat(self, input):
+    def _text_request(self, input):
         payload = {
             "inputText": input,
             "textGenerationConfig": {
@@ -33,31 +58,104 @@ class AmazonTitanTextModelClient:
                 "temperature": self.temperature,
             },
         }
+        return json.dumps(payload)
 
-        request = json.dumps(payload)
+    def _cache_key(self, request):
+        '''
+        Cache key of a request body, or None when the response is not cacheable.
+        '''
+        if self.response_cache is None or self.temperature != 0:
+            return None
+        return ResponseCache.make_key(self.model_id, request)
 
-        try:
+    def response_cache_stats(self):
+        '''
+        Returns hit-rate statistics of the response cache, or None without one.
+        '''
+        return self.response_cache.stats() if self.response_cache is not None else None
+
+    @property
+    def semantic_namespace(self):
+        '''
+        Semantic cache namespace of the cooking assistant: answers depend on the model and its settings.
+        '''
+        return f"cooking:{self.model_id}:{self.max_token_count}:{self.temperature}:{self.top_p}"
+
+    def semantic_cache_stats(self):
+        '''
+        Returns hit rate and precision of the semantic cache for this assistant, or None without one.
+        '''
+        if self.semantic_cache is None:
+            return None
+        return self.semantic_cache.stats(self.semantic_namespace)
+
+    def _inference_config(self):
+        return {"maxTokens": self.max_token_count, "temperature": self.temperature, "topP": self.top_p}
+
+    @staticmethod
+    def _conversation(text):
+        return [
+            {
+                "role": "user",
+                "content": [{"text": text}],
+            }
+        ]
+
+    @staticmethod
+    def _cooking_prompt(user_message):
+        system_message = "你是一个烹饪专家，你的任务就是根据用户的输入信息，给出非常专业和简洁的烹饪指导"
+        return f"{system_message}\n{user_message}"
+
+    def chat(self, input, bypass_cache=False):
+        request = self._text_request(input)
+
+        def invoke():
             response = self.client.invoke_model(modelId=self.model_id, body=request)
             model_response = json.loads(response["body"].read())
-            response_text = model_response["results"][0]["outputText"]
+            return model_response["results"][0]["outputText"]
+
+        try:
+            key = self._cache_key(request)
+            if key is None:
+                response_text = invoke()
+            else:
+                response_text = self.response_cache.call(key, invoke, bypass=bypass_cache)
             return {"message":response_text}, 200
 
         except (ClientError, Exception) as e:
             return {"error":f'{str(e)}'},404
 
-    def stream_chat(self, prompt):
-        payload = {
-            "inputText": prompt,
-            "textGenerationConfig": {
-                "maxTokenCount": self.max_token_count,
-                "temperature": self.temperature,
-            },
-        }
+    async def achat(self, input, bypass_cache=False):
+        '''
+        Async `chat`.
+        '''
+        request = self._text_request(input)
 
-        request = json.dumps(payload)
+        async def invoke():
+            client = await async_bedrock_client(self.region_name)
+            if client is None:
+                response = await asyncio.to_thread(self.client.invoke_model, modelId=self.model_id, body=request)
+                model_response = json.loads(await asyncio.to_thread(response["body"].read))
+            else:
+                response = await client.invoke_model(modelId=self.model_id, body=request)
+                model_response = json.loads(await response["body"].read())
+            return model_response["results"][0]["outputText"]
 
         try:
+            key = self._cache_key(request)
+            if key is None:
+                response_text = await invoke()
+            else:
+                response_text = await self.response_cache.acall(key, invoke, bypass=bypass_cache)
+            return {"message": response_text}, 200
+
+        except (ClientError, Exception) as e:
+            return {"error": f'{str(e)}'}, 404
+
+    def stream_chat(self, prompt, bypass_cache=False):
+        request = self._text_request(prompt)
 
+        def texts():
             streaming_response = self.client.invoke_model_with_response_stream(
                 modelId=self.model_id, body=request
             )
@@ -67,29 +165,104 @@ class AmazonTitanTextModelClient:
                 if "outputText" in chunk:
                     yield chunk["outputText"]
 
+        try:
+            key = self._cache_key(request)
+            if key is None:
+                yield from texts()
+            else:
+                yield from self.response_cache.stream(key, texts, bypass=bypass_cache)
+
         except (ClientError, Exception) as e:
-            self.logger.error(f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}")
+            logger.error(f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}")
             yield f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}"
 
-    def user_chat(self, user_message):
-        system_message = "你是一个烹饪专家，你的任务就是根据用户的输入信息，给出非常专业和简洁的烹饪指导"
-        combined_message = f"{system_message}\n{user_message}"
-        conversation = [
-            {
-                "role": "user",
-                "content": [{"text": combined_message}],
-            }
-        ]
+    async def astream_chat(self, prompt, bypass_cache=False):
+        '''
+        Async `stream_chat`: yields the generated text as it arrives.
+        '''
+        request = self._text_request(prompt)
+
+        async def texts():
+            client = await async_bedrock_client(self.region_name)
+            if client is None:
+                # The blocking stream runs in a thread, raising instead of yielding an error text
+                streaming_response = await asyncio.to_thread(
+                    self.client.invoke_model_with_response_stream, modelId=self.model_id, body=request
+                )
+                async for event in _iterate_in_thread(iter(streaming_response["body"])):
+                    chunk = json.loads(event["chunk"]["bytes"])
+                    if "outputText" in chunk:
+                        yield chunk["outputText"]
+                return
+
+            streaming_response = await client.invoke_model_with_response_stream(
+                modelId=self.model_id, body=request
+            )
+            async for event in streaming_response["body"]:
+                chunk = json.loads(event["chunk"]["bytes"])
+                if "outputText" in chunk:
+                    yield chunk["outputText"]
 
         try:
+            key = self._cache_key(request)
+            stream = texts() if key is None else self.response_cache.astream(key, texts, bypass=bypass_cache)
+            async for text in stream:
+                yield text
 
+        except (ClientError, Exception) as e:
+            logger.error(f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}")
+            yield f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}"
+
+    def user_chat(self, user_message, bypass_cache=False):
+        conversation = self._conversation(self._cooking_prompt(user_message))
+
+        def converse():
             response = self.client.converse(
                 modelId=self.model_id,
                 messages=conversation,
-                inferenceConfig={"maxTokens": self.max_token_count, "temperature": self.temperature,
-                                 "topP": self.top_p},
+                inferenceConfig=self._inference_config(),
             )
-            response_text = response["output"]["message"]['content'][0]['text']
+            return response["output"]["message"]['content'][0]['text']
+
+        try:
+            if self.semantic_cache is None:
+                response_text = converse()
+            else:
+                # Only the question is embedded; the fixed cooking prompt is part of the namespace
+                response_text = self.semantic_cache.call(user_message, converse, namespace=self.semantic_namespace,
+                                                         bypass=bypass_cache)
+            return {"message": response_text}, 200
+
+        except (ClientError, Exception) as e:
+            print(f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}")
+            return {"error": f"{str(e)}"}, 404
+
+    async def auser_chat(self, user_message, bypass_cache=False):
+        '''
+        Async `user_chat`.
+        '''
+        conversation = self._conversation(self._cooking_prompt(user_message))
+
+        async def converse():
+            client = await async_bedrock_client(self.region_name)
+            if client is None:
+                response = await asyncio.to_thread(self.client.converse, modelId=self.model_id,
+                                                   messages=conversation, inferenceConfig=self._inference_config())
+            else:
+                response = await client.converse(
+                    modelId=self.model_id,
+                    messages=conversation,
+                    inferenceConfig=self._inference_config(),
+                )
+            return response["output"]["message"]['content'][0]['text']
+
+        try:
+            if self.semantic_cache is None:
+                response_text = await converse()
+            else:
+                response_text = await self.semantic_cache.acall(user_message, converse,
+                                                                namespace=self.semantic_namespace,
+                                                                bypass=bypass_cache)
             return {"message": response_text}, 200
 
         except (ClientError, Exception) as e:
@@ -100,18 +273,13 @@ class AmazonTitanTextModelClient:
     流式输出
     '''
     def user_stream_chat(self, user_message):
-        conversation = [
-            {
-                "role": "user",
-                "content": [{"text": user_message}],
-            }
-        ]
+        conversation = self._conversation(user_message)
 
         try:
             streaming_response = self.client.converse_stream(
                 modelId=self.model_id,
                 messages=conversation,
-                inferenceConfig={"maxTokens": self.max_token_count, "temperature": self.temperature, "topP": self.top_p},
+                inferenceConfig=self._inference_config(),
             )
 
             for chunk in streaming_response["stream"]:
@@ -122,6 +290,25 @@ class AmazonTitanTextModelClient:
         except (ClientError, Exception) as e:
             yield f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}"
 
+    async def auser_stream_chat(self, user_message):
+        '''
+        Async `user_stream_chat`.
+        '''
+        try:
+            client = await async_bedrock_client(self.region_name)
+            if client is None:
+                async for text in _iterate_in_thread(self.user_stream_chat(user_message)):
+                    yield text
+                return
 
+            streaming_response = await client.converse_stream(
+                modelId=self.model_id,
+                messages=self._conversation(user_message),
+                inferenceConfig=self._inference_config(),
+            )
+            async for chunk in streaming_response["stream"]:
+                if "contentBlockDelta" in chunk:
+                    yield chunk["contentBlockDelta"]["delta"]["text"]
 
-
+        except (ClientError, Exception) as e:
+            yield f"ERROR: Can't invoke '{self.model_id}'. Reason: {e}"
@@ -9,44 +9,68 @@ openai 库
 '''
 from vagents.vagentic.config import Config
 import os
-from openai import AzureOpenAI
 import logging
+from vagents.vagentic.llms.client_pool import (AZURE_API_VERSION, AZURE_JSON_API_VERSION, async_azure_client,
+                                               azure_client)
+from vagents.vagentic.llms.history import ConversationHistory
+from vagents.vagentic.llms.response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
+JSON_SYSTEM_MESSAGE = "You are a helpful assistant designed to output JSON."
+
 class AzureOpenAIChatBot:
     """
     A chatbot that utilizes OpenAI's GPT models to engage in conversations.
+
+    The API clients are shared process-wide, so a chatbot per conversation is cheap. The async
+    methods (`achat`, `astream_chat`, `ajson_chat`, `acustom_chat`) let one event loop serve many
+    conversations concurrently; turns of the same chatbot should still be awaited one at a time.
+
+    The history sent with each request is kept under `max_history_tokens`: the system message is
+    pinned, and the oldest turns are dropped or, with `summarize_history`, compacted into a summary.
+    `prompt_token_stats()` reports the prompt tokens sent against the untrimmed history.
+
+    With a `response_cache`, the temperature 0 calls (`chat`, `custom_chat` and their async versions)
+    return the cached response of an identical prompt instead of calling the API.
     """
 
-    def __init__(self, system_message=""):
+    def __init__(self, system_message="", max_history_tokens=8000, summarize_history=False, response_cache=None):
         """
         Initializes the chatbot with an optional system-level message.
 
         :param system_message: A message that describes the system or purpose of the bot.
+        :param max_history_tokens: Prompt token budget of the history sent with each request.
+        :param summarize_history: Summarize turns that no longer fit instead of dropping them.
+        :param response_cache: ResponseCache of deterministic responses, may be shared between chatbots.
         """
         config = Config()
-        self.messages = []
         self.system_message = system_message
-        if self.system_message:
-            self.messages.append({"role": "system", "content": self.system_message})
         self.model = config.smart_fast_llm_model
-        self.client = AzureOpenAI(
-            azure_endpoint=config.azure_endpoint,
-            api_key=config.azure_key,
-            api_version="2024-02-01"
-        )
-
-        self.json_client = AzureOpenAI(
-            azure_endpoint=config.azure_endpoint,
-            api_key=config.azure_key,
-            api_version="2024-03-01-preview"
-        )
+        self.history = ConversationHistory(system_message, max_tokens=max_history_tokens, model=self.model,
+                                           summarize=summarize_history)
+        self.api_prompt_tokens = 0  # As reported by the API
+        self.response_cache = response_cache
+        self.azure_endpoint = config.azure_endpoint
+        self.api_key = config.azure_key
+        # Shared pooled clients instead of two new connection pools per chatbot
+        self.client = azure_client(AZURE_API_VERSION, self.azure_endpoint, self.api_key)
+        self.json_client = azure_client(AZURE_JSON_API_VERSION, self.azure_endpoint, self.api_key)
 
 
     def get_client(self):
         return self.client
-    
+
+    @property
+    def messages(self):
+        """
+        The messages sent with the next request: system message, summary and the turns within budget.
+        """
+        return self.history.messages()
+
+    @messages.setter
+    def messages(self, new_messages):
+        self.update_messages(new_messages)
 
     def update_messages(self, new_messages):
         """
@@ -54,40 +78,103 @@ class AzureOpenAIChatBot:
 
         :param new_messages: A list of message dictionaries to replace the current messages
         """
-        self.messages = new_messages
-        if self.system_message:
-            self.messages.append({"role": "system", "content": self.system_message})
+        self.history.replace(new_messages)
+        if self.history.system_message:
+            self.system_message = self.history.system_message
+        elif self.system_message:
+            self.history.set_system(self.system_message)
 
+    def prompt_token_stats(self):
+        """
+        Prompt tokens of the requests so far: sent, what the untrimmed history would have cost, and the
+        API-reported count.
+        """
+        return dict(self.history.stats(), api_prompt_tokens=self.api_prompt_tokens)
 
-    def custom_chat(self, messages):
-        try:
+    def _record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "prompt_tokens", None):
+            self.api_prompt_tokens += usage.prompt_tokens
+
+    def _compact_history(self):
+        """
+        Summarizes the oldest turns once the history is over budget (summarize_history only).
+        """
+        pending = self.history.compaction_prompt()
+        if pending is not None:
+            turns, request = pending
+            summary = self.custom_chat(request)
+            self.history.compact(None if summary.startswith("Error during chat completion") else summary, turns)
+
+    async def _acompact_history(self):
+        pending = self.history.compaction_prompt()
+        if pending is not None:
+            turns, request = pending
+            summary = await self.acustom_chat(request)
+            self.history.compact(None if summary.startswith("Error during chat completion") else summary, turns)
+
+
+    def _cache_key(self, messages):
+        return ResponseCache.make_key(self.model, messages, temperature=0)
+
+    def _complete(self, messages, bypass_cache=False):
+        """
+        Temperature 0 completion, served from the response cache when one is configured. Raises on API errors.
+        """
+        def create():
             chat_response = self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0
             )
-            response_message = chat_response.choices[0].message.content
-            return response_message
+            self._record_usage(chat_response)
+            return chat_response.choices[0].message.content
+
+        if self.response_cache is None:
+            return create()
+        return self.response_cache.call(self._cache_key(messages), create, bypass=bypass_cache)
+
+    async def _acomplete(self, messages, bypass_cache=False):
+        async def create():
+            chat_response = await self._async_client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0
+            )
+            self._record_usage(chat_response)
+            return chat_response.choices[0].message.content
+
+        if self.response_cache is None:
+            return await create()
+        return await self.response_cache.acall(self._cache_key(messages), create, bypass=bypass_cache)
+
+    def response_cache_stats(self):
+        """
+        Returns hit-rate statistics of the response cache, or None without one.
+        """
+        return self.response_cache.stats() if self.response_cache is not None else None
+
+
+    def custom_chat(self, messages, bypass_cache=False):
+        try:
+            return self._complete(messages, bypass_cache=bypass_cache)
         except Exception as e:
             return f"Error during chat completion: {e}"
 
 
-    def chat(self, message):
+    def chat(self, message, bypass_cache=False):
         """
         Sends a message to the chatbot and receives a response.
 
         :param message: User input message
+        :param bypass_cache: Call the API even if the response cache has this prompt, and do not cache the reply
         :return: Chatbot's response message
         """
-        self.messages.append({"role": "user", "content": message})
+        self.history.add_user(message)
+        self._compact_history()
         try:
-            chat_response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                temperature=0
-            )
-            response_message = chat_response.choices[0].message.content
-            self.messages.append({"role": "assistant", "content": response_message})
+            response_message = self._complete(self.history.prompt(), bypass_cache=bypass_cache)
+            self.history.add_assistant(response_message)
             return response_message
         except Exception as e:
             return f"Error during chat completion: {e}"
@@ -100,33 +187,124 @@ class AzureOpenAIChatBot:
         :param message: User input message
         :return: Chatbot's response message
         """
-        self.messages.append({"role": "system", "content": "You are a helpful assistant designed to output JSON."},)
-        self.messages.append({"role": "user", "content": message})
+        self.history.add_user(message)
+        self._compact_history()
         try:
+            # The JSON instruction is added to this request only, not appended to the history on every call
             json_response = self.json_client.chat.completions.create(
                 model=self.model,
-                messages=self.messages,
+                messages=self.history.prompt(extra_system=JSON_SYSTEM_MESSAGE),
                 response_format={ "type": "json_object" },
             )
+            self._record_usage(json_response)
             response_message = json_response.choices[0].message.content
-            self.messages.append({"role": "assistant", "content": response_message})
+            self.history.add_assistant(response_message)
+            return response_message
+        except Exception as e:
+            return f"Error during chat completion: {e}"
+
+
+
+    def _async_client(self, api_version=AZURE_API_VERSION):
+        return async_azure_client(api_version, self.azure_endpoint, self.api_key)
+
+    async def acustom_chat(self, messages, bypass_cache=False):
+        """
+        Async `custom_chat`.
+        """
+        try:
+            return await self._acomplete(messages, bypass_cache=bypass_cache)
+        except Exception as e:
+            return f"Error during chat completion: {e}"
+
+    async def achat(self, message, bypass_cache=False):
+        """
+        Async `chat`: sends a message and awaits the response without blocking the event loop.
+
+        :param message: User input message
+        :param bypass_cache: Call the API even if the response cache has this prompt
+        :return: Chatbot's response message
+        """
+        self.history.add_user(message)
+        await self._acompact_history()
+        try:
+            response_message = await self._acomplete(self.history.prompt(), bypass_cache=bypass_cache)
+            self.history.add_assistant(response_message)
             return response_message
         except Exception as e:
             return f"Error during chat completion: {e}"
 
+    async def astream_chat(self, message, bypass_cache=False):
+        """
+        Sends a message and yields the response as it is generated; the full response is added
+        to the history once the stream completes. A cached response is replayed chunk by chunk.
+
+        :param message: User input message
+        :param bypass_cache: Call the API even if the response cache has this prompt
+        :return: Async generator of response text deltas
+        """
+        self.history.add_user(message)
+        await self._acompact_history()
+        messages = self.history.prompt()
+        parts = []
 
+        async def deltas():
+            stream = await self._async_client().chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0,
+                stream=True
+            )
+            async for chunk in stream:
+                # Azure sends content filter results in chunks without choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        try:
+            if self.response_cache is None:
+                stream = deltas()
+            else:
+                stream = self.response_cache.astream(self._cache_key(messages), deltas, bypass=bypass_cache)
+            async for delta in stream:
+                parts.append(delta)
+                yield delta
+            self.history.add_assistant("".join(parts))
+        except Exception as e:
+            yield f"Error during chat completion: {e}"
+
+    async def ajson_chat(self, message):
+        """
+        Async `json_chat`.
+
+        :param message: User input message
+        :return: Chatbot's response message
+        """
+        self.history.add_user(message)
+        await self._acompact_history()
+        try:
+            json_response = await self._async_client(AZURE_JSON_API_VERSION).chat.completions.create(
+                model=self.model,
+                messages=self.history.prompt(extra_system=JSON_SYSTEM_MESSAGE),
+                response_format={ "type": "json_object" },
+            )
+            self._record_usage(json_response)
+            response_message = json_response.choices[0].message.content
+            self.history.add_assistant(response_message)
+            return response_message
+        except Exception as e:
+            return f"Error during chat completion: {e}"
 
     def get_history_message(self):
         """
-        Returns the full history of messages in the chat session.
+        Returns the history of messages in the chat session, as sent with the next request.
         """
-        return self.messages
+        return self.history.messages()
 
     def clear_history_message(self):
         """
-        Clears the conversation history in the chatbot.
+        Clears the conversation history in the chatbot; the system message stays pinned.
         """
-        self.messages.clear()
+        self.history.clear()
         return True
 
     def update_system_message(self, system_message):
@@ -135,10 +313,9 @@ class AzureOpenAIChatBot:
 
         :param system_message: New system message to be added
         """
-        if self.system_message:  # Clear the old system message if it exists
-            self.messages = [msg for msg in self.messages if msg["role"] != "system"]
+        # Replaces the pinned system message rather than adding another one
         self.system_message = system_message
-        self.messages.append({"role": "system", "content": self.system_message})
+        self.history.set_system(system_message)
 
 
 
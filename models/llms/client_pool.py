@@ -0,0 +1,203 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 23:50
+# Author:david yuan
+# @File:client_pool.py
+# @Software:VeSync
+
+'''
+Process-wide Azure OpenAI and Bedrock clients with tuned connection pools.
+
+Sync clients are thread-safe and shared by every chatbot in the process.
+Async clients hold connections bound to the event loop that opened them, so
+they are shared per event loop. An API worker running one loop serves all
+its concurrent conversations over a single keep-alive pool per endpoint.
+Async Bedrock needs aiobotocore (pip install aiobotocore). Without it, the
+shared boto3 client is run in a thread.
+'''
+import asyncio
+import contextlib
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from vagents.vagentic.config import Config
+
+logger = logging.getLogger(__name__)
+
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+except ImportError:
+    AioConfig = None
+    get_session = None
+
+# Connection pool tuning: enough connections for many concurrent conversations per endpoint,
+# idle ones kept alive between turns so requests skip the TCP and TLS handshakes.
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 50
+KEEPALIVE_EXPIRY = 60.0
+TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+MAX_RETRIES = 2
+
+AZURE_API_VERSION = "2024-02-01"
+AZURE_JSON_API_VERSION = "2024-03-01-preview"
+
+_lock = threading.Lock()
+_sync_clients: Dict[tuple, Any] = {}
+# Per event loop: client key -> client, and the exit stack closing them with the loop's `aclose`
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+_async_exit_stacks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, contextlib.AsyncExitStack]" = \
+    weakref.WeakKeyDictionary()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=KEEPALIVE_EXPIRY)
+
+
+def _azure_settings(api_version: str, azure_endpoint: Optional[str], api_key: Optional[str]) -> Dict[str, str]:
+    if azure_endpoint is None or api_key is None:
+        config = Config()
+        azure_endpoint = azure_endpoint or config.azure_endpoint
+        api_key = api_key or config.azure_key
+    return {"azure_endpoint": azure_endpoint, "api_key": api_key, "api_version": api_version}
+
+
+def azure_client(api_version: str = AZURE_API_VERSION, azure_endpoint: Optional[str] = None,
+                 api_key: Optional[str] = None) -> AzureOpenAI:
+    """
+    Returns the shared sync Azure OpenAI client of an endpoint and API version.
+
+    :param api_version: Azure OpenAI API version, e.g. "2024-03-01-preview" for JSON mode.
+    :param azure_endpoint: Endpoint, defaults to the configured one.
+    :param api_key: Key, defaults to the configured one.
+    """
+    settings = _azure_settings(api_version, azure_endpoint, api_key)
+    key = ("azure",) + tuple(settings.values())
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            client = AzureOpenAI(**settings, max_retries=MAX_RETRIES,
+                                 http_client=httpx.Client(limits=_limits(), timeout=TIMEOUT))
+            _sync_clients[key] = client
+        return client
+
+
+def async_azure_client(api_version: str = AZURE_API_VERSION, azure_endpoint: Optional[str] = None,
+                       api_key: Optional[str] = None) -> AsyncAzureOpenAI:
+    """
+    Returns the async Azure OpenAI client shared within the running event loop. Must be called from a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    settings = _azure_settings(api_version, azure_endpoint, api_key)
+    key = ("azure",) + tuple(settings.values())
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncAzureOpenAI(**settings, max_retries=MAX_RETRIES,
+                                      http_client=httpx.AsyncClient(limits=_limits(), timeout=TIMEOUT))
+            clients[key] = client
+        return client
+
+
+def _bedrock_settings(region_name: str) -> Dict[str, str]:
+    config = Config()
+    return {
+        "region_name": region_name,
+        "aws_access_key_id": config.aws_access_key,
+        "aws_secret_access_key": config.aws_access_secret,
+    }
+
+
+def bedrock_client(region_name: str = "us-east-1", max_retries: int = MAX_RETRIES) -> Any:
+    """
+    Returns the shared sync bedrock-runtime client of a region; boto3 clients are thread-safe.
+
+    :param max_retries: Retries of throttled or failed calls, 0 for callers that fail over themselves.
+    """
+    import boto3
+    from botocore.config import Config as BotoConfig
+
+    settings = _bedrock_settings(region_name)
+    key = ("bedrock", max_retries) + tuple(settings.values())
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            client = boto3.client(
+                "bedrock-runtime",
+                config=BotoConfig(max_pool_connections=MAX_CONNECTIONS, tcp_keepalive=True,
+                                  read_timeout=TIMEOUT.read, connect_timeout=TIMEOUT.connect,
+                                  retries={"max_attempts": max_retries + 1, "mode": "adaptive"}),
+                **settings,
+            )
+            _sync_clients[key] = client
+        return client
+
+
+async def async_bedrock_client(region_name: str = "us-east-1", max_retries: int = MAX_RETRIES) -> Optional[Any]:
+    """
+    Returns the aiobotocore bedrock-runtime client shared within the running event loop, or None if
+    aiobotocore is not installed; callers then run the sync client in a thread.
+    """
+    if get_session is None:
+        return None
+    loop = asyncio.get_running_loop()
+    settings = _bedrock_settings(region_name)
+    key = ("bedrock", max_retries) + tuple(settings.values())
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            # Reserved before awaiting, so concurrent first calls wait for one client instead of opening several
+            opening = clients[key] = loop.create_future()
+    if isinstance(client, asyncio.Future):
+        return await asyncio.shield(client)
+    if client is not None:
+        return client
+    try:
+        stack = _async_exit_stacks.setdefault(loop, contextlib.AsyncExitStack())
+        client = await stack.enter_async_context(get_session().create_client(
+            "bedrock-runtime",
+            config=AioConfig(max_pool_connections=MAX_CONNECTIONS, connect_timeout=TIMEOUT.connect,
+                             read_timeout=TIMEOUT.read, connector_args={"keepalive_timeout": KEEPALIVE_EXPIRY},
+                             retries={"max_attempts": max_retries + 1, "mode": "adaptive"}),
+            **settings,
+        ))
+    except BaseException as e:
+        with _lock:
+            clients.pop(key, None)
+        opening.set_exception(e)
+        opening.exception()  # retrieved, so it is not logged when no other caller was waiting
+        raise
+    with _lock:
+        clients[key] = client
+    opening.set_result(client)
+    return client
+
+
+async def aclose() -> None:
+    """Closes the async clients of the running event loop, e.g. on API worker shutdown."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.pop(loop, {})
+        stack = _async_exit_stacks.pop(loop, None)
+    for client in clients.values():
+        if isinstance(client, AsyncAzureOpenAI):
+            await client.close()
+    if stack is not None:
+        await stack.aclose()
+
+
+def close() -> None:
+    """Closes the shared sync clients."""
+    with _lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        if hasattr(client, "close"):  # boto3 clients only since botocore 1.29
+            client.close()
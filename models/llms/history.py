@@ -0,0 +1,271 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 00:30
+# Author:david yuan
+# @File:history.py
+# @Software:VeSync
+
+'''
+Token-budgeted conversation history for chat completion requests.
+
+The system message is pinned at the start of every prompt and kept once. The
+newest turns are kept while they fit in `max_tokens`. Older turns are dropped,
+or, when a summarizer is used, compacted into a running summary that is sent
+as a second system message. Tokens are counted with tiktoken
+(pip install tiktoken) using the chat format overhead of the OpenAI models;
+without it they are estimated. Prompt token counts are recorded per call, as
+well as what the untrimmed history would have cost.
+'''
+import logging
+import re
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+# Chat format overhead of the OpenAI models: per message, and once to prime the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own future reference. Keep every fact, decision, "
+    "preference and open question that later turns may depend on; drop greetings and repetition. "
+    "Reply with the summary only, in at most {max_tokens} tokens.\n\n{conversation}"
+)
+
+
+def _encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+    except KeyError:  # deployment names and unknown models
+        name = "o200k_base" if model and ("4o" in model or model.startswith("o")) else "cl100k_base"
+        return tiktoken.get_encoding(name)
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens of chat messages.
+
+    :param model: Model or Azure deployment name, selects the tiktoken encoding.
+    """
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model
+        self._encoding = _encoding(model)
+        if self._encoding is None:
+            logger.warning("tiktoken is not installed, estimating prompt tokens")
+
+    def count(self, text: str) -> int:
+        """Tokens of a text, estimated as one per CJK character plus ~4 other chars per token without tiktoken."""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        cjk = len(_CJK.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The leading part of `text` that fits in `max_tokens`."""
+        if self._encoding is not None:
+            ids = self._encoding.encode(text, disallowed_special=())
+            return text if len(ids) <= max_tokens else self._encoding.decode(ids[:max_tokens])
+        tokens = self.count(text)
+        return text if tokens <= max_tokens else text[:len(text) * max_tokens // tokens]
+
+    def count_message(self, message: Dict) -> int:
+        content = message.get("content") or ""
+        if not isinstance(content, str):  # multi-part content; only text parts are counted
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        tokens = TOKENS_PER_MESSAGE + self.count(content) + self.count(message.get("role", ""))
+        if message.get("name"):
+            tokens += 1 + self.count(message["name"])
+        return tokens
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        return sum(self.count_message(message) for message in messages) + TOKENS_PER_REPLY
+
+
+class ConversationHistory:
+    """
+    Conversation turns kept under a prompt token budget.
+
+    :param system_message: Pinned system message, sent first in every prompt.
+    :param max_tokens: Prompt token budget of system message, summary and kept turns.
+    :param model: Model or deployment name, selects the tokenizer.
+    :param summarize: Compact turns that no longer fit into a summary instead of dropping them.
+    :param compact_ratio: Compaction empties the budget down to this fraction, so it runs once every
+                          few turns rather than on every call.
+    :param summary_ratio: Share of the budget the summary may take; longer summaries are cut.
+    """
+
+    def __init__(self, system_message: str = "", max_tokens: int = 8000, model: Optional[str] = None,
+                 summarize: bool = False, compact_ratio: float = 0.5, summary_ratio: float = 0.25):
+        self.counter = TokenCounter(model)
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.compact_ratio = compact_ratio
+        self.summary_ratio = summary_ratio
+        self.system_message = ""
+        self._system_tokens = 0
+        self.summary = ""
+        self._summary_tokens = 0
+        self._turns: Deque[Tuple[Dict, int]] = deque()  # (message, tokens)
+        self._turn_tokens = 0
+        self.set_system(system_message)
+        # Per-call accounting
+        self.calls = 0
+        self.last_prompt_tokens = 0
+        self.prompt_tokens = 0
+        self.untrimmed_tokens = 0
+        self.dropped_messages = 0
+        self.compactions = 0
+        self._all_tokens = 0  # Every message ever added, i.e. the prompt without a budget
+
+    # ------------------------------------------------------------------ content
+
+    def set_system(self, system_message: Optional[str]) -> None:
+        """Replaces the pinned system message."""
+        self.system_message = system_message or ""
+        self._system_tokens = self.counter.count_message(self._system()) if self.system_message else 0
+
+    def _system(self) -> Dict:
+        return {"role": "system", "content": self.system_message}
+
+    def _summary(self) -> Dict:
+        return {"role": "system", "content": SUMMARY_PREFIX + self.summary}
+
+    def add(self, role: str, content: str) -> None:
+        """Appends a message; system messages replace the pinned one rather than piling up."""
+        if role == "system":
+            self.set_system(content)
+            return
+        message = {"role": role, "content": content}
+        tokens = self.counter.count_message(message)
+        self._turns.append((message, tokens))
+        self._turn_tokens += tokens
+        self._all_tokens += tokens
+        if not self.summarize:
+            self._trim(self.max_tokens)
+
+    def add_user(self, content: str) -> None:
+        self.add("user", content)
+
+    def add_assistant(self, content: str) -> None:
+        self.add("assistant", content)
+
+    def replace(self, messages: List[Dict]) -> None:
+        """Replaces the history; the last system message in `messages` becomes the pinned one."""
+        self.clear()
+        for message in messages:
+            self.add(message["role"], message.get("content") or "")
+
+    def clear(self) -> None:
+        """Forgets turns and summary; the system message stays pinned."""
+        self._turns.clear()
+        self._turn_tokens = 0
+        self.summary = ""
+        self._summary_tokens = 0
+        self._all_tokens = 0
+
+    def messages(self) -> List[Dict]:
+        """System message, summary and kept turns, as sent to the model."""
+        messages = [self._system()] if self.system_message else []
+        if self.summary:
+            messages.append(self._summary())
+        messages.extend(message for message, _ in self._turns)
+        return messages
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    # ------------------------------------------------------------------ budget
+
+    def tokens(self) -> int:
+        """Prompt tokens of `messages()`."""
+        return self._system_tokens + self._summary_tokens + self._turn_tokens + TOKENS_PER_REPLY
+
+    def _trim(self, budget: int) -> List[Dict]:
+        """Drops the oldest turns until the prompt fits in `budget`, keeping at least the newest message."""
+        dropped = []
+        while len(self._turns) > 1 and self.tokens() > budget:
+            message, tokens = self._turns.popleft()
+            self._turn_tokens -= tokens
+            dropped.append(message)
+        # Never start on an assistant reply whose question was dropped
+        while dropped and len(self._turns) > 1 and self._turns[0][0]["role"] == "assistant":
+            message, tokens = self._turns.popleft()
+            self._turn_tokens -= tokens
+            dropped.append(message)
+        self.dropped_messages += len(dropped)
+        return dropped
+
+    def needs_compaction(self) -> bool:
+        return self.summarize and len(self._turns) > 1 and self.tokens() > self.max_tokens
+
+    def compaction_prompt(self) -> Optional[Tuple[List[Dict], List[Dict]]]:
+        """
+        Takes the oldest turns out of the history for compaction and returns (turns, summary request),
+        or None if everything fits. The caller sends the request and hands the reply to `compact`.
+        """
+        if not self.needs_compaction():
+            return None
+        turns = self._trim(int(self.max_tokens * self.compact_ratio))
+        self.dropped_messages -= len(turns)  # summarized, not lost
+        lines = [SUMMARY_PREFIX + self.summary] if self.summary else []
+        lines.extend(f"{message['role']}: {message['content']}" for message in turns)
+        request = [{"role": "user", "content": SUMMARY_PROMPT.format(max_tokens=self._summary_budget(),
+                                                                    conversation="\n".join(lines))}]
+        return turns, request
+
+    def compact(self, summary: Optional[str], turns: List[Dict]) -> None:
+        """Stores the summary of `turns`; without one (e.g. the summary call failed) they stay dropped."""
+        if not summary:
+            self.dropped_messages += len(turns)
+            return
+        self.summary = self.counter.truncate(summary.strip(), self._summary_budget())
+        self._summary_tokens = self.counter.count_message(self._summary())
+        self.compactions += 1
+
+    def _summary_budget(self) -> int:
+        return max(int(self.max_tokens * self.summary_ratio), 1)
+
+    # ------------------------------------------------------------------ accounting
+
+    def prompt(self, extra_system: Optional[str] = None) -> List[Dict]:
+        """
+        The messages to send for the next call, recording their token count.
+
+        :param extra_system: System instruction for this call only, e.g. a JSON output instruction;
+                             it is not stored, so it is never repeated in the history.
+        """
+        messages = self.messages()
+        if extra_system and extra_system != self.system_message:
+            messages.insert(1 if self.system_message else 0, {"role": "system", "content": extra_system})
+        self.calls += 1
+        self.last_prompt_tokens = self.counter.count_messages(messages)
+        self.prompt_tokens += self.last_prompt_tokens
+        untrimmed = self.last_prompt_tokens - self._summary_tokens - self._turn_tokens + self._all_tokens
+        self.untrimmed_tokens += untrimmed
+        return messages
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Prompt tokens sent over all calls against what the full, untrimmed history would have cost.
+        """
+        return {
+            "calls": self.calls,
+            "last_prompt_tokens": self.last_prompt_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "untrimmed_prompt_tokens": self.untrimmed_tokens,
+            "saved_prompt_tokens": self.untrimmed_tokens - self.prompt_tokens,
+            "kept_messages": len(self._turns),
+            "dropped_messages": self.dropped_messages,
+            "compactions": self.compactions,
+        }
@@ -0,0 +1,212 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 01:10
+# Author:david yuan
+# @File:response_cache.py
+# @Software:VeSync
+
+'''
+Exact-match cache of deterministic LLM responses.
+
+Responses are keyed by a canonical hash of (model, messages, parameters), so
+dict key order, `None` parameters and 0 vs 0.0 do not change the key. Entries
+are kept in the two-tier store of the embedding cache: an in-process LRU and
+an optional SQLite file, with an optional TTL. Values are text, or the list of
+chunks of a streamed response, which is replayed chunk by chunk on a hit.
+Only cache calls whose output is determined by their input, e.g. temperature 0.
+Errors of the SQLite file are logged and the call goes to the provider.
+'''
+import hashlib
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from vagents.vagentic.emb.tiered_store import TieredStore
+
+Value = Union[str, List[str]]
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _as_text(value: Value) -> str:
+    return "".join(value) if isinstance(value, list) else value
+
+
+def _as_chunks(value: Value) -> List[str]:
+    return value if isinstance(value, list) else [value]
+
+
+def _encode(entry: Tuple[Value, float]) -> str:
+    return json.dumps(list(entry), ensure_ascii=False)
+
+
+def _decode(blob: str) -> Tuple[Value, float]:
+    value, elapsed = json.loads(blob)
+    return value, elapsed
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + SQLite) cache of LLM responses.
+
+    :param max_memory_items: Maximum number of responses kept in the in-process LRU, 0 disables it.
+    :param path: SQLite file of the on-disk tier, None keeps the cache in memory only.
+    :param ttl: Seconds a response stays valid, None keeps it until evicted.
+    :param max_disk_bytes: Size budget of the on-disk tier; least recently used rows are evicted beyond it.
+    :param enabled: False turns every call into a bypass, e.g. to measure live latency.
+    """
+
+    def __init__(self, max_memory_items: int = 1000, path: Optional[str] = None, ttl: Optional[float] = None,
+                 max_disk_bytes: int = 256 * 1024 * 1024, enabled: bool = True):
+        self.path = path
+        self.ttl = ttl
+        self.enabled = enabled
+        # Entries are (value, elapsed) pairs
+        self._store = TieredStore("responses", _encode, _decode, max_memory_items, path, max_disk_bytes)
+        self._lock = threading.Lock()
+        self.bypasses = 0
+        self.stores = 0
+        self.saved_seconds = 0.0  # Latency of the original calls, summed over hits
+
+    @staticmethod
+    def make_key(model: str, messages: Any, **params) -> str:
+        """
+        Returns the cache key of a request.
+
+        :param model: Model or deployment id.
+        :param messages: Chat messages, or the prompt text of a completion model.
+        :param params: Generation parameters that change the output, e.g. temperature or max tokens.
+        """
+        payload = json.dumps(_canonical({"model": model, "messages": messages, "params": params}),
+                             sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ tiers
+
+    def get(self, key: str) -> Optional[Value]:
+        """Returns the cached response for `key`, or None if it is missing or expired."""
+        entry = self._store.get_many([key]).get(key)
+        if entry is None:
+            return None
+        value, elapsed = entry
+        with self._lock:
+            self.saved_seconds += elapsed
+        return value
+
+    def put(self, key: str, value: Value, ttl: Optional[float] = None, elapsed: float = 0.0) -> None:
+        """
+        Stores a response in both tiers.
+
+        :param value: Response text, or the chunks of a streamed response.
+        :param ttl: Overrides the cache TTL for this entry.
+        :param elapsed: Latency of the call that produced it, reported as saved on every hit.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._store.put_many([(key, (value, elapsed))], expires=time.time() + ttl if ttl is not None else None)
+        with self._lock:
+            self.stores += 1
+
+    def invalidate(self, key: str) -> None:
+        """Removes one response from both tiers."""
+        self._store.delete([key])
+
+    # ------------------------------------------------------------------ calls
+
+    def _lookup(self, key: str, bypass: bool, refresh: bool) -> Optional[Value]:
+        if bypass or not self.enabled:
+            with self._lock:
+                self.bypasses += 1
+            return None
+        return None if refresh else self.get(key)
+
+    def call(self, key: str, fn: Callable[[], str], bypass: bool = False, refresh: bool = False,
+             ttl: Optional[float] = None) -> str:
+        """
+        Returns the cached response of `key`, or calls `fn` and caches its result. Exceptions raised by
+        `fn` propagate and nothing is cached, so failed calls are retried next time.
+
+        :param bypass: Neither read nor write the cache for this call.
+        :param refresh: Skip the lookup but store the fresh response.
+        :param ttl: Overrides the cache TTL for this entry.
+        """
+        cached = self._lookup(key, bypass, refresh)
+        if cached is not None:
+            return _as_text(cached)
+        start = time.perf_counter()
+        value = fn()
+        if not (bypass or not self.enabled) and value is not None:
+            self.put(key, value, ttl=ttl, elapsed=time.perf_counter() - start)
+        return value
+
+    async def acall(self, key: str, fn: Callable[[], Awaitable[str]], bypass: bool = False, refresh: bool = False,
+                    ttl: Optional[float] = None) -> str:
+        """Async `call`: `fn` returns the awaitable of the response."""
+        cached = self._lookup(key, bypass, refresh)
+        if cached is not None:
+            return _as_text(cached)
+        start = time.perf_counter()
+        value = await fn()
+        if not (bypass or not self.enabled) and value is not None:
+            self.put(key, value, ttl=ttl, elapsed=time.perf_counter() - start)
+        return value
+
+    def stream(self, key: str, fn: Callable[[], Iterator[str]], bypass: bool = False, refresh: bool = False,
+               ttl: Optional[float] = None) -> Iterator[str]:
+        """
+        Replays the cached chunks of `key`, or streams `fn()` through and caches its chunks once it completes.
+        A stream that raises or is closed early is not cached.
+        """
+        cached = self._lookup(key, bypass, refresh)
+        if cached is not None:
+            yield from _as_chunks(cached)
+            return
+        start = time.perf_counter()
+        chunks = []
+        for chunk in fn():
+            chunks.append(chunk)
+            yield chunk
+        if not (bypass or not self.enabled):
+            self.put(key, chunks, ttl=ttl, elapsed=time.perf_counter() - start)
+
+    async def astream(self, key: str, fn: Callable[[], AsyncIterator[str]], bypass: bool = False,
+                      refresh: bool = False, ttl: Optional[float] = None) -> AsyncIterator[str]:
+        """Async `stream`: `fn` returns an async iterator of chunks."""
+        cached = self._lookup(key, bypass, refresh)
+        if cached is not None:
+            for chunk in _as_chunks(cached):
+                yield chunk
+            return
+        start = time.perf_counter()
+        chunks = []
+        async for chunk in fn():
+            chunks.append(chunk)
+            yield chunk
+        if not (bypass or not self.enabled):
+            self.put(key, chunks, ttl=ttl, elapsed=time.perf_counter() - start)
+
+    # ------------------------------------------------------------------ housekeeping
+
+    def clear(self) -> None:
+        """Empties both tiers and resets the counters."""
+        self._store.clear()
+        with self._lock:
+            self.bypasses = self.stores = 0
+            self.saved_seconds = 0.0
+
+    def close(self) -> None:
+        self._store.close()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns hit/miss counters, the latency saved by hits, disk errors and tier sizes."""
+        stats = self._store.stats()
+        with self._lock:
+            stats.update(bypasses=self.bypasses, stores=self.stores, saved_seconds=round(self.saved_seconds, 3))
+        return stats
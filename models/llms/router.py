@@ -0,0 +1,834 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 02:40
+# Author:david yuan
+# @File:router.py
+# @Software:VeSync
+
+'''
+Chat completion router over Azure OpenAI deployments and Bedrock models.
+
+Every provider deployment is a Route with the same interface: OpenAI-style
+messages in, response text out. The router tracks each route's latency
+(EWMA and recent quantiles), error rate and rate-limit headroom (from the
+x-ratelimit-* headers of Azure, or throttling errors of Bedrock). Each request
+picks the better of two random healthy routes, so load spreads and slow or
+failing routes get less of it.
+
+- Hedging: if the primary has not answered within its recent p90 latency, the
+  request is also sent to a second route and the first answer wins. Hedges are
+  limited to `max_hedge_ratio` of requests, so a slow provider does not double
+  the load.
+- Failover: a failed request is retried on another route, up to
+  `max_attempts` routes. Rate-limited routes and routes failing
+  `failure_threshold` times in a row are skipped for a backoff that doubles
+  from `cooldown` up to `max_cooldown` seconds, or for the Retry-After of a 429.
+  Requests the provider rejected for their content (400, 413 and 422, e.g.
+  context length or content filter) are raised at once: every route would
+  reject them, so they neither fail over nor count against the route. Other
+  4xx (a bad key or a missing deployment) are failures of that route.
+
+Provider retries are turned off on routed clients, failover replaces them.
+Run this module to route traffic between local Azure and Bedrock stub servers
+(needs openai and boto3).
+'''
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from openai import RateLimitError
+
+from vagents.vagentic.llms.client_pool import (AZURE_API_VERSION, async_azure_client, async_bedrock_client,
+                                               azure_client, bedrock_client)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    ClientError = None
+
+# Bedrock error codes meaning "slow down" rather than "broken"
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException",
+                    "ModelNotReadyException"}
+# Statuses rejecting the request content, which every route would reject alike
+CALLER_ERROR_STATUSES = {400, 413, 422}
+# OpenAI-style parameters and their Bedrock Converse inferenceConfig names
+BEDROCK_PARAMS = {"temperature": "temperature", "max_tokens": "maxTokens", "top_p": "topP", "stop": "stopSequences"}
+
+
+class RateLimited(Exception):
+    """Raised by a route when its provider rejected the request for exceeding a rate limit."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RouterError(Exception):
+    """Raised when every attempted route failed; `errors` maps route names to their exceptions."""
+
+    def __init__(self, errors: Dict[str, Exception]):
+        detail = "; ".join(f"{name}: {error}" for name, error in errors.items()) or "no route available"
+        super().__init__(f"All routes failed: {detail}")
+        self.errors = errors
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a provider error: openai APIStatusError, botocore ClientError or anything with status_code."""
+    status = getattr(error, "status_code", None)
+    if status is None and ClientError is not None and isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status if isinstance(status, int) else None
+
+
+def is_caller_error(error: Exception) -> bool:
+    """
+    Whether the provider rejected the request content (400, 413, 422), so no route would accept it.
+    401, 403 and 404 concern the route's key or deployment and count as route failures.
+    """
+    if isinstance(error, RateLimited):
+        return False
+    return _status_code(error) in CALLER_ERROR_STATUSES
+
+
+def _retry_after(headers) -> Optional[float]:
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:  # an HTTP date
+        pass
+    return None
+
+
+class Route:
+    """
+    One provider deployment behind the router, with its live statistics.
+
+    Subclasses implement `chat`, and `achat` when the provider has an async client.
+
+    :param name: Unique route name used in metrics.
+    :param weight: Relative share of traffic among equally fast routes.
+    """
+
+    def __init__(self, name: str, weight: float = 1.0):
+        self.name = name
+        self.weight = weight
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.cancelled = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.inflight = 0
+        self.latency: Optional[float] = None  # EWMA of successful call latency, seconds
+        self.error_rate = 0.0  # EWMA of failures
+        self.headroom = 1.0  # Share of the rate limit left, 1.0 when unknown
+        self.consecutive_failures = 0
+        self.trips = 0  # Times skipped since the last success, doubles the backoff
+        self.open_until = 0.0  # Skipped by the router until then (time.monotonic)
+        self._latencies: deque = deque(maxlen=256)
+        self._limits: Dict[str, float] = {}
+        self._reports_headroom = False
+
+    def chat(self, messages: List[Dict], **params) -> str:
+        """Sends OpenAI-style messages and returns the response text; raises RateLimited when throttled."""
+        raise NotImplementedError
+
+    async def achat(self, messages: List[Dict], **params) -> str:
+        return await asyncio.to_thread(self.chat, messages, **params)
+
+    def observe_headers(self, headers) -> None:
+        """Updates the headroom from x-ratelimit-remaining-* (and -limit-*) response headers."""
+        ratios = []
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            remaining = float(remaining)
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            # Azure reports only the remaining count; the largest one seen approximates the limit
+            limit = float(limit) if limit else max(self._limits.get(kind, 0.0), remaining)
+            self._limits[kind] = limit
+            ratios.append(remaining / limit if limit else 0.0)
+        if ratios:
+            self.headroom = min(ratios)
+            self._reports_headroom = True
+
+    def available(self, now: float) -> bool:
+        return now >= self.open_until
+
+    def quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """Latency quantile of the recent successful calls, None with too few samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < min_samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "cancelled": self.cancelled,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "inflight": self.inflight,
+            "ewma_latency": round(self.latency, 4) if self.latency is not None else None,
+            "p50": self.quantile(0.5, 1),
+            "p95": self.quantile(0.95, 1),
+            "p99": self.quantile(0.99, 1),
+            "error_rate": round(self.error_rate, 4),
+            "headroom": round(self.headroom, 4),
+            "circuit": "closed" if self.available(now) else f"open {self.open_until - now:.1f}s",
+        }
+
+
+class CallableRoute(Route):
+    """
+    Route over any chat function, e.g. an existing client or a test double.
+
+    :param fn: Callable(messages, **params) -> text.
+    :param afn: Async version of `fn`; without it `fn` runs in a thread.
+    """
+
+    def __init__(self, name: str, fn: Callable[..., str], afn: Optional[Callable[..., Any]] = None,
+                 weight: float = 1.0):
+        super().__init__(name, weight)
+        self.fn = fn
+        self.afn = afn
+
+    def chat(self, messages: List[Dict], **params) -> str:
+        return self.fn(messages, **params)
+
+    async def achat(self, messages: List[Dict], **params) -> str:
+        if self.afn is None:
+            return await super().achat(messages, **params)
+        return await self.afn(messages, **params)
+
+
+class AzureRoute(Route):
+    """
+    An Azure OpenAI deployment, over the shared pooled clients.
+
+    :param deployment: Deployment (model) name.
+    :param azure_endpoint: Endpoint, defaults to the configured one.
+    :param api_key: Key, defaults to the configured one.
+    """
+
+    def __init__(self, deployment: str, azure_endpoint: Optional[str] = None, api_key: Optional[str] = None,
+                 api_version: str = AZURE_API_VERSION, name: Optional[str] = None, weight: float = 1.0):
+        super().__init__(name or f"azure:{deployment}", weight)
+        self.deployment = deployment
+        self.azure_endpoint = azure_endpoint
+        self.api_key = api_key
+        self.api_version = api_version
+        self._client = None
+
+    def _raise_rate_limited(self, e: RateLimitError):
+        self.observe_headers(e.response.headers)
+        raise RateLimited(str(e), _retry_after(e.response.headers)) from e
+
+    def chat(self, messages: List[Dict], **params) -> str:
+        if self._client is None:
+            self._client = azure_client(self.api_version, self.azure_endpoint, self.api_key).with_options(max_retries=0)
+        try:
+            raw = self._client.chat.completions.with_raw_response.create(model=self.deployment, messages=messages,
+                                                                         **params)
+        except RateLimitError as e:
+            self._raise_rate_limited(e)
+        self.observe_headers(raw.headers)
+        return raw.parse().choices[0].message.content
+
+    async def achat(self, messages: List[Dict], **params) -> str:
+        client = async_azure_client(self.api_version, self.azure_endpoint, self.api_key).with_options(max_retries=0)
+        try:
+            raw = await client.chat.completions.with_raw_response.create(model=self.deployment, messages=messages,
+                                                                         **params)
+        except RateLimitError as e:
+            self._raise_rate_limited(e)
+        self.observe_headers(raw.headers)
+        return raw.parse().choices[0].message.content
+
+
+class BedrockRoute(Route):
+    """
+    A Bedrock model, called through the Converse API.
+
+    :param model_id: Bedrock model id.
+    :param client: bedrock-runtime client to use instead of the shared one, e.g. with another endpoint_url.
+    :param system_prompts: Send system messages as Converse system prompts; Titan text models do not
+                           support them, so by default they are prepended to the first user message there.
+    """
+
+    def __init__(self, model_id: str, region_name: str = "us-east-1", client: Any = None,
+                 system_prompts: Optional[bool] = None, name: Optional[str] = None, weight: float = 1.0):
+        super().__init__(name or f"bedrock:{model_id}", weight)
+        self.model_id = model_id
+        self.region_name = region_name
+        self.client = client
+        self.system_prompts = not model_id.startswith("amazon.titan") if system_prompts is None else system_prompts
+
+    def _request(self, messages: List[Dict], params: Dict[str, Any]) -> Dict[str, Any]:
+        system, turns = [], []
+        for message in messages:
+            text = message.get("content") or ""
+            if message["role"] == "system":
+                system.append(text)
+                continue
+            role = "assistant" if message["role"] == "assistant" else "user"
+            # Converse needs alternating roles starting with the user
+            if turns and turns[-1]["role"] == role:
+                turns[-1]["content"].append({"text": text})
+            elif turns or role == "user":
+                turns.append({"role": role, "content": [{"text": text}]})
+        request = {"modelId": self.model_id, "messages": turns}
+        if system and self.system_prompts:
+            request["system"] = [{"text": text} for text in system]
+        elif system and turns:
+            turns[0]["content"].insert(0, {"text": "\n".join(system)})
+        config = {BEDROCK_PARAMS[key]: value for key, value in params.items() if key in BEDROCK_PARAMS}
+        if isinstance(config.get("stopSequences"), str):
+            config["stopSequences"] = [config["stopSequences"]]
+        if config:
+            request["inferenceConfig"] = config
+        return request
+
+    @staticmethod
+    def _text(response: Dict[str, Any]) -> str:
+        return "".join(block.get("text", "") for block in response["output"]["message"]["content"])
+
+    def _error(self, e: Exception) -> Exception:
+        if ClientError is not None and isinstance(e, ClientError):
+            if e.response.get("Error", {}).get("Code") in THROTTLING_CODES:
+                return RateLimited(str(e))
+        return e
+
+    def chat(self, messages: List[Dict], **params) -> str:
+        client = self.client or bedrock_client(self.region_name, max_retries=0)
+        try:
+            return self._text(client.converse(**self._request(messages, params)))
+        except Exception as e:
+            error = self._error(e)
+            if error is e:
+                raise
+            raise error from e
+
+    async def achat(self, messages: List[Dict], **params) -> str:
+        client = None if self.client is not None else await async_bedrock_client(self.region_name, max_retries=0)
+        if client is None:
+            return await super().achat(messages, **params)
+        try:
+            return self._text(await client.converse(**self._request(messages, params)))
+        except Exception as e:
+            error = self._error(e)
+            if error is e:
+                raise
+            raise error from e
+
+
+class LLMRouter:
+    """
+    Routes chat requests across providers by live latency, error rate and rate-limit headroom,
+    with hedged requests and failover.
+
+    :param routes: The routes to balance across.
+    :param hedge: Send a second copy of slow requests to another route.
+    :param hedge_delay: Fixed hedge delay in seconds; by default the primary route's `hedge_quantile` latency.
+    :param hedge_quantile: Latency quantile of the primary after which a request is hedged.
+    :param max_hedge_ratio: Maximum share of requests that are hedged.
+    :param max_attempts: Routes tried per request, counting hedges and failovers.
+    :param alpha: EWMA weight of the newest latency and error sample.
+    :param failure_threshold: Consecutive failures after which a route is skipped for a while.
+    :param cooldown: Seconds a failing or rate-limited route is first skipped, doubled while it keeps failing.
+    :param max_cooldown: Longest skip.
+    :param explore: Share of requests sent to a random healthy route, so recovered routes are noticed.
+    :param max_workers: Threads running sync requests.
+    """
+
+    def __init__(self, routes: Sequence[Route], hedge: bool = True, hedge_delay: Optional[float] = None,
+                 hedge_quantile: float = 0.9, max_hedge_ratio: float = 0.1, max_attempts: int = 3,
+                 alpha: float = 0.2, failure_threshold: int = 3, cooldown: float = 1.0, max_cooldown: float = 60.0,
+                 explore: float = 0.05,
+                 max_workers: int = 32, seed: Optional[int] = None):
+        if not routes:
+            raise ValueError("At least one route is required")
+        names = [route.name for route in routes]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Route names must be unique: {names}")
+        self.routes = list(routes)
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_attempts = max_attempts
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.explore = explore
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self._hedge_budget = 1.0
+        self.requests = 0
+        self.hedged = 0
+        self.failovers = 0
+        self.failures = 0
+        self.rejected = 0  # Requests raised as caller errors
+
+    @classmethod
+    def from_config(cls, azure_deployments: Optional[Sequence[str]] = None,
+                    bedrock_models: Optional[Sequence[str]] = None, region_name: str = "us-east-1",
+                    **kwargs) -> "LLMRouter":
+        """
+        Router over the configured Azure deployment and Bedrock model, or the given ones.
+        """
+        from vagents.vagentic.config import Config
+
+        config = Config()
+        azure_deployments = azure_deployments or [config.smart_fast_llm_model]
+        bedrock_models = bedrock_models or [config.aws_model_id]
+        routes: List[Route] = [AzureRoute(deployment) for deployment in azure_deployments]
+        routes += [BedrockRoute(model_id, region_name) for model_id in bedrock_models]
+        return cls(routes, **kwargs)
+
+    # ------------------------------------------------------------------ selection
+
+    def _score(self, route: Route, prior: float) -> float:
+        """Expected cost of sending one more request to `route`, lower is better."""
+        latency = route.latency if route.latency is not None else prior
+        # Provider latency barely depends on our own concurrency, so in-flight requests only break ties
+        return (latency * (1 + 0.05 * route.inflight) * (1 + 4 * route.error_rate)
+                / max(route.headroom, 0.05) / max(route.weight, 1e-6))
+
+    def _pick(self, exclude: Sequence[str]) -> Optional[Route]:
+        """Picks the better of two random healthy routes, or the one closest to recovery if none is healthy."""
+        now = time.monotonic()
+        remaining = [route for route in self.routes if route.name not in exclude]
+        if not remaining:
+            return None
+        healthy = [route for route in remaining if route.available(now)]
+        if not healthy:
+            return min(remaining, key=lambda route: route.open_until)
+        if len(healthy) == 1:
+            return healthy[0]
+        with self._lock:
+            if self._random.random() < self.explore:
+                return self._random.choice(healthy)
+            first, second = self._random.choices(healthy, weights=[route.weight for route in healthy], k=2)
+            if first is second:
+                second = self._random.choice([route for route in healthy if route is not first])
+        # Unmeasured routes are assumed as fast as the fastest measured one, so they get tried
+        measured = [route.latency for route in self.routes if route.latency is not None]
+        prior = min(measured) if measured else 1.0
+        return min((first, second), key=lambda route: self._score(route, prior))
+
+    def _hedge_after(self, route: Route) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        delay = route.quantile(self.hedge_quantile)
+        if delay is None and route.latency is not None:  # until there are enough samples for the quantile
+            delay = 2 * route.latency
+        return delay
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self._hedge_budget < 1.0:
+                return False
+            self._hedge_budget -= 1.0
+            self.hedged += 1
+            return True
+
+    def _count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+            # Refilled per request, so at most max_hedge_ratio of requests are hedged over time
+            # Up to 100 requests' worth is saved, so a burst of slow requests can all be hedged
+            self._hedge_budget = min(self._hedge_budget + self.max_hedge_ratio, max(1.0, 100 * self.max_hedge_ratio))
+
+    # ------------------------------------------------------------------ bookkeeping
+
+    def _begin(self, route: Route, hedge: bool) -> None:
+        with route._lock:
+            route.requests += 1
+            route.inflight += 1
+            route.hedges += hedge
+
+    def _succeed(self, route: Route, elapsed: float) -> None:
+        with route._lock:
+            route.inflight -= 1
+            route.successes += 1
+            if route.latency is None:
+                route.latency = elapsed
+            else:
+                # Outliers count at most double, so one slow call does not flip routing; a route that
+                # really slowed down still converges within a few calls
+                sample = min(elapsed, 2 * route.latency)
+                route.latency = (1 - self.alpha) * route.latency + self.alpha * sample
+            route.error_rate *= 1 - self.alpha
+            route.consecutive_failures = 0
+            route.trips = 0
+            route._latencies.append(elapsed)
+            if not route._reports_headroom:
+                route.headroom = 1.0
+
+    def _fail(self, route: Route, error: Exception) -> None:
+        with route._lock:
+            route.inflight -= 1
+            route.errors += 1
+            route.error_rate = (1 - self.alpha) * route.error_rate + self.alpha
+            route.consecutive_failures += 1
+            now = time.monotonic()
+            rate_limited = isinstance(error, RateLimited)
+            if rate_limited:
+                route.rate_limited += 1
+                route.headroom = 0.0
+            if (rate_limited or route.consecutive_failures >= self.failure_threshold) and route.available(now):
+                backoff = min(self.cooldown * 2 ** route.trips, self.max_cooldown)
+                if rate_limited and error.retry_after:
+                    backoff = error.retry_after
+                route.trips += 1
+                route.open_until = now + backoff
+        logger.warning(f"Route {route.name} failed: {error}")
+
+    def _cancel(self, route: Route) -> None:
+        with route._lock:
+            route.inflight -= 1
+            route.cancelled += 1
+
+    def _end(self, route: Route, error: Exception) -> None:
+        """Records a failed call: caller errors leave the route's health untouched."""
+        if not is_caller_error(error):
+            self._fail(route, error)
+            return
+        with route._lock:
+            route.inflight -= 1
+
+    def _reject(self, error: Exception) -> None:
+        with self._lock:
+            self.rejected += 1
+        logger.warning(f"Request rejected by the provider, not failing over: {error}")
+
+    def _call(self, route: Route, messages: List[Dict], params: Dict[str, Any]) -> str:
+        start = time.perf_counter()
+        try:
+            text = route.chat(messages, **params)
+        except Exception as e:
+            self._end(route, e)
+            raise
+        self._succeed(route, time.perf_counter() - start)
+        return text
+
+    async def _acall(self, route: Route, messages: List[Dict], params: Dict[str, Any]) -> str:
+        start = time.perf_counter()
+        try:
+            text = await route.achat(messages, **params)
+        except asyncio.CancelledError:
+            self._cancel(route)
+            raise
+        except Exception as e:
+            self._end(route, e)
+            raise
+        self._succeed(route, time.perf_counter() - start)
+        return text
+
+    # ------------------------------------------------------------------ requests
+
+    def chat(self, messages: List[Dict], **params) -> str:
+        """
+        Sends a chat request through the best route, hedging and failing over as needed.
+
+        :param messages: OpenAI-style messages.
+        :param params: Generation parameters, e.g. temperature or max_tokens.
+        :return: The response text of the first route that answered.
+        :raises RouterError: When every attempted route failed.
+        :raises Exception: The provider's own error when it rejected the request as invalid (see `is_caller_error`).
+        """
+        self._count_request()
+        tried: List[str] = []
+        errors: Dict[str, Exception] = {}
+        pending: Dict[Any, tuple] = {}  # future -> (route, hedge)
+
+        def launch(route: Route, hedge: bool) -> None:
+            tried.append(route.name)
+            self._begin(route, hedge)
+            pending[self._executor.submit(self._call, route, messages, params)] = (route, hedge)
+
+        primary = self._pick(tried)
+        launch(primary, False)
+        start = time.monotonic()
+        hedged = False
+        while pending:
+            timeout = None
+            delay = self._hedge_after(primary) if not hedged and len(tried) < self.max_attempts else None
+            if delay is not None:
+                timeout = max(delay - (time.monotonic() - start), 0.0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                route = self._pick(tried)
+                if route is not None and route.available(time.monotonic()) and self._take_hedge():
+                    launch(route, True)
+                continue
+            for future in done:
+                route, hedge = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    if is_caller_error(e):
+                        for loser, (other, _) in pending.items():
+                            if loser.cancel():
+                                self._cancel(other)
+                        self._reject(e)
+                        raise
+                    errors[route.name] = e
+                    continue
+                if hedge:
+                    with route._lock:
+                        route.hedge_wins += 1
+                for loser, (other, _) in pending.items():
+                    if loser.cancel():  # not started yet; running calls finish in the background
+                        self._cancel(other)
+                return text
+            if not pending and len(tried) < self.max_attempts:
+                route = self._pick(tried)
+                if route is not None:
+                    with self._lock:
+                        self.failovers += 1
+                    launch(route, False)
+                    # The failover is hedged on its own route's latency, from its own start
+                    primary, start, hedged = route, time.monotonic(), False
+        with self._lock:
+            self.failures += 1
+        raise RouterError(errors)
+
+    async def achat(self, messages: List[Dict], **params) -> str:
+        """Async `chat`: hedges are tasks on the running loop, and the losers are cancelled."""
+        self._count_request()
+        tried: List[str] = []
+        errors: Dict[str, Exception] = {}
+        pending: Dict[asyncio.Task, tuple] = {}
+
+        def launch(route: Route, hedge: bool) -> None:
+            tried.append(route.name)
+            self._begin(route, hedge)
+            pending[asyncio.ensure_future(self._acall(route, messages, params))] = (route, hedge)
+
+        primary = self._pick(tried)
+        launch(primary, False)
+        start = time.monotonic()
+        hedged = False
+        try:
+            while pending:
+                timeout = None
+                delay = self._hedge_after(primary) if not hedged and len(tried) < self.max_attempts else None
+                if delay is not None:
+                    timeout = max(delay - (time.monotonic() - start), 0.0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    route = self._pick(tried)
+                    if route is not None and route.available(time.monotonic()) and self._take_hedge():
+                        launch(route, True)
+                    continue
+                for task in done:
+                    route, hedge = pending.pop(task)
+                    if task.exception() is not None:
+                        if is_caller_error(task.exception()):
+                            self._reject(task.exception())
+                            raise task.exception()
+                        errors[route.name] = task.exception()
+                        continue
+                    if hedge:
+                        with route._lock:
+                            route.hedge_wins += 1
+                    return task.result()
+                if not pending and len(tried) < self.max_attempts:
+                    route = self._pick(tried)
+                    if route is not None:
+                        with self._lock:
+                            self.failovers += 1
+                        launch(route, False)
+                        primary, start, hedged = route, time.monotonic(), False
+        finally:
+            for task in pending:
+                task.cancel()
+        with self._lock:
+            self.failures += 1
+        raise RouterError(errors)
+
+    # ------------------------------------------------------------------ reporting
+
+    def metrics(self) -> Dict[str, Any]:
+        """Router totals and per-route latency, error, headroom and hedge statistics."""
+        with self._lock:
+            totals = {"requests": self.requests, "hedged": self.hedged, "failovers": self.failovers,
+                      "failures": self.failures, "rejected": self.rejected}
+        totals["hedge_wins"] = sum(route.hedge_wins for route in self.routes)
+        totals["routes"] = {route.name: route.snapshot() for route in self.routes}
+        return totals
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    # Routes traffic between local stub servers standing in for two Azure deployments and Bedrock,
+    # then compares tail latency with a single Azure deployment.
+    import statistics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import boto3
+    from botocore.config import Config as BotoConfig
+
+    class StubProvider:
+        """Latency, error and rate-limit behaviour of one stub deployment."""
+
+        def __init__(self, latency, tail_latency=0.0, tail_rate=0.0, error_rate=0.0, rate_limit=None):
+            self.latency = latency
+            self.tail_latency = tail_latency
+            self.tail_rate = tail_rate
+            self.error_rate = error_rate
+            self.rate_limit = rate_limit  # Requests per second
+            self.window = deque()
+            self.lock = threading.Lock()
+            self.random = random.Random(7)
+
+        def admit(self):
+            """Returns the status code of the next request and its remaining requests in the window."""
+            with self.lock:
+                now = time.monotonic()
+                while self.window and self.window[0] < now - 1.0:
+                    self.window.popleft()
+                if self.rate_limit is not None and len(self.window) >= self.rate_limit:
+                    return 429, 0
+                self.window.append(now)
+                remaining = self.rate_limit - len(self.window) if self.rate_limit is not None else 1000
+                roll = self.random.random()
+                delay = self.latency + (self.tail_latency if self.random.random() < self.tail_rate else 0.0)
+            time.sleep(delay)
+            return (500 if roll < self.error_rate else 200), remaining
+
+    providers = {
+        "gpt-east": StubProvider(0.2, tail_latency=1.5, tail_rate=0.05),
+        "gpt-west": StubProvider(0.25, tail_latency=1.5, tail_rate=0.03, error_rate=0.2),
+        "amazon.titan-text-express-v1": StubProvider(0.3, rate_limit=10),
+    }
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            try:
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):  # the losing copy of a hedged request was cancelled
+                self.close_connection = True
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if parts[:2] == ["openai", "deployments"]:  # Azure OpenAI chat completions
+                status, remaining = providers[parts[2]].admit()
+                limits = {"x-ratelimit-remaining-requests": str(remaining), "retry-after": "1"}
+                if status != 200:
+                    self.reply(status, {"error": {"code": str(status), "message": "stub failure"}}, limits)
+                    return
+                self.reply(200, {
+                    "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": parts[2],
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                        "role": "assistant", "content": f"{parts[2]}: {request['messages'][-1]['content']}"}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }, limits)
+            elif parts[0] == "model":  # Bedrock Converse
+                model_id = parts[1].replace("%3A", ":")
+                status, _ = providers[model_id].admit()
+                if status == 429:
+                    self.reply(429, {"message": "Too many requests"}, {"x-amzn-ErrorType": "ThrottlingException"})
+                    return
+                if status != 200:
+                    self.reply(500, {"message": "stub failure"}, {"x-amzn-ErrorType": "InternalServerException"})
+                    return
+                text = request["messages"][-1]["content"][-1]["text"]
+                self.reply(200, {
+                    "output": {"message": {"role": "assistant", "content": [{"text": f"{model_id}: {text}"}]}},
+                    "stopReason": "end_turn", "usage": {"inputTokens": 1, "outputTokens": 1, "totalTokens": 2},
+                    "metrics": {"latencyMs": 1},
+                })
+            else:
+                self.reply(404, {"message": "unknown path"})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    stub_bedrock = boto3.client("bedrock-runtime", region_name="us-east-1", endpoint_url=endpoint,
+                                aws_access_key_id="stub", aws_secret_access_key="stub",
+                                config=BotoConfig(retries={"max_attempts": 1}))
+
+    def run(router, count=300, concurrency=20):
+        async def main():
+            # Bedrock runs the boto3 client in threads without aiobotocore; the default pool is too small
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=64))
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies, failed = [], 0
+
+            async def one(i):
+                nonlocal failed
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        await router.achat([{"role": "system", "content": "You are a cook."},
+                                            {"role": "user", "content": f"recipe {i}"}], temperature=0)
+                        latencies.append(time.perf_counter() - start)
+                    except RouterError:
+                        failed += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(count)))
+            return latencies, failed, time.perf_counter() - start
+
+        latencies, failed, elapsed = asyncio.run(main())
+        latencies.sort()
+        pick = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000
+        print(f"  ok {len(latencies)}, failed {failed}, {elapsed:.2f}s, mean {statistics.mean(latencies) * 1000:.0f}ms, "
+              f"p50 {pick(0.5):.0f}ms, p95 {pick(0.95):.0f}ms, p99 {pick(0.99):.0f}ms")
+        return router
+
+    print("single Azure deployment, no hedging or failover:")
+    run(LLMRouter([AzureRoute("gpt-east", endpoint, "stub")], hedge=False, max_attempts=1))
+    print("single Azure deployment with 20% errors, no failover:")
+    run(LLMRouter([AzureRoute("gpt-west", endpoint, "stub")], hedge=False, max_attempts=1))
+    print("router over both Azure deployments and Bedrock, hedged:")
+    router = run(LLMRouter([AzureRoute("gpt-east", endpoint, "stub"), AzureRoute("gpt-west", endpoint, "stub"),
+                            BedrockRoute("amazon.titan-text-express-v1", client=stub_bedrock)], seed=0))
+    metrics = router.metrics()
+    print(f"  requests {metrics['requests']}, hedged {metrics['hedged']} (won {metrics['hedge_wins']}), "
+          f"failovers {metrics['failovers']}, failures {metrics['failures']}")
+    for name, stats in metrics["routes"].items():
+        print(f"  {name}: {stats}")
+    server.shutdown()
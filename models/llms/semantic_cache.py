@@ -0,0 +1,389 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 01:50
+# Author:david yuan
+# @File:semantic_cache.py
+# @Software:VeSync
+
+'''
+Semantic cache of LLM answers: paraphrased prompts share one answer.
+
+Prompts are embedded with any Emb and searched in a LocalVectorIndex of past
+prompts; the stored answer of the closest one is returned when its cosine
+similarity reaches `threshold`. Namespaces (e.g. model + system prompt) get
+separate indexes, so answers never leak between assistants. Entries expire
+after `ttl` and the least recently hit ones are evicted beyond `max_entries`.
+
+A wrong hit is worse than a miss, so precision is measured as well: answers
+can be labelled with `feedback`, and with `audit_rate` a sample of hits is
+answered again and compared with the cached answer by `judge`.
+
+The cache never fails a call: when embedding, searching or storing raises,
+the error is logged and the answer comes from `fn` uncached.
+'''
+import asyncio
+import atexit
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from vagents.manager.vector_index import LocalVectorIndex
+from vagents.vagentic.emb.base import Emb
+
+logger = logging.getLogger(__name__)
+
+class SemanticHit(NamedTuple):
+    answer: str
+    similarity: float
+    prompt: str  # The cached prompt that matched
+    entry_id: str
+
+
+def _normalize(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def _entry_id(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _persist_at_exit(ref: "weakref.ref") -> None:
+    cache = ref()
+    if cache is not None:
+        cache.persist()
+
+
+class _Namespace:
+    """Index and counters of one namespace."""
+
+    def __init__(self, name: str, index: Optional[LocalVectorIndex]):
+        self.name = name
+        self.index = index
+        # entry id -> last hit (or store) time, drives LRU eviction
+        self.last_access: Dict[str, float] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.near_misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.evictions = 0
+        self.judged = 0
+        self.correct = 0
+        self.similarity_sum = 0.0
+        self.saved_seconds = 0.0
+
+
+class SemanticCache:
+    """
+    Embedding-similarity cache of answers, isolated per namespace.
+
+    :param embedder: Any Emb; a cached one avoids embedding the same prompt twice.
+    :param threshold: Minimum cosine similarity of a hit. Higher is safer; tune it with `stats()` precision.
+    :param max_entries: Entries kept per namespace; least recently hit ones are evicted beyond it.
+    :param ttl: Seconds an answer stays valid, None keeps it until evicted.
+    :param persist_directory: Directory of the namespace indexes, None keeps them in memory.
+    :param persist_interval: Seconds between writes of new entries to `persist_directory`. Pending
+                             entries are also written by `persist` and at interpreter exit.
+    :param audit_rate: Fraction of hits that are also answered afresh to measure precision.
+    :param judge: Callable(prompt, cached_answer, fresh_answer) -> bool deciding if an audited hit was
+                  correct; defaults to the cosine similarity of both answers reaching `threshold`.
+    :param near_miss_margin: Misses whose best similarity is within this margin below the threshold are
+                             counted as near misses, i.e. hits a slightly lower threshold would have had.
+    """
+
+    def __init__(self, embedder: Emb, threshold: float = 0.92, max_entries: int = 10_000,
+                 ttl: Optional[float] = None, persist_directory: Optional[str] = None, audit_rate: float = 0.0,
+                 judge: Optional[Callable[[str, str, str], bool]] = None, near_miss_margin: float = 0.05,
+                 persist_interval: float = 30.0):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_directory = persist_directory
+        self.audit_rate = audit_rate
+        self.judge = judge or self._similar_answers
+        self.near_miss_margin = near_miss_margin
+        self.persist_interval = persist_interval
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+        self._random = random.Random(0)
+        self._persisted_at = time.monotonic()
+        if persist_directory:
+            atexit.register(_persist_at_exit, weakref.ref(self))
+
+    # ------------------------------------------------------------------ namespaces
+
+    def _namespace(self, namespace: str) -> _Namespace:
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                name = re.sub(r"[^\w.-]", "_", namespace)[:64] + "-" + _entry_id(namespace)[:8]
+                if self.persist_directory:
+                    index = LocalVectorIndex.open(name, os.path.join(self.persist_directory, name), metric="cosine")
+                else:
+                    index = LocalVectorIndex(name, metric="cosine")
+                ns = self._namespaces[namespace] = _Namespace(namespace, index)
+                now = time.time()
+                records = index.get()
+                for entry_id, metadata in zip(records["ids"], records["metadatas"]):
+                    ns.last_access[entry_id] = (metadata or {}).get("created", now)
+            return ns
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        return np.asarray(self.embedder.get_embedding(prompt), dtype=np.float32)
+
+    # ------------------------------------------------------------------ lookups
+
+    def lookup(self, prompt: str, namespace: str = "default") -> Optional[SemanticHit]:
+        """Returns the cached answer of the most similar prompt, or None below the threshold."""
+        return self._search(self._namespace(namespace), _normalize(prompt))[0]
+
+    def _search(self, ns: _Namespace, prompt: str) -> Tuple[Optional[SemanticHit], Optional[np.ndarray]]:
+        """Returns (hit, prompt embedding); the embedding is None when it was not needed."""
+        entry_id = _entry_id(prompt)
+        with self._lock:
+            ns.lookups += 1
+            # The same prompt again needs no embedding
+            exact = ns.index.get(ids=[entry_id])
+            if exact["ids"]:
+                hit = self._hit(ns, entry_id, prompt, exact["metadatas"][0], 1.0)
+                if hit is not None:
+                    ns.exact_hits += 1
+                    return hit, None
+            if ns.index.count() == 0:
+                return None, None
+        embedding = self._embed(prompt)
+        with self._lock:
+            result = ns.index.query(query_embeddings=embedding, n_results=3)
+            best = 0.0
+            for candidate_id, document, metadata, distance in zip(result["ids"][0], result["documents"][0],
+                                                                  result["metadatas"][0], result["distances"][0]):
+                similarity = 1.0 - distance
+                best = max(best, similarity)
+                if similarity < self.threshold:
+                    break
+                hit = self._hit(ns, candidate_id, document, metadata, similarity)
+                if hit is not None:
+                    return hit, embedding
+            if self.threshold - self.near_miss_margin <= best < self.threshold:
+                ns.near_misses += 1
+            return None, embedding
+
+    def _hit(self, ns: _Namespace, entry_id: str, prompt: str, metadata: Dict[str, Any],
+             similarity: float) -> Optional[SemanticHit]:
+        expires = metadata.get("expires")
+        if expires is not None and expires <= time.time():
+            ns.index.delete(ids=[entry_id])
+            ns.last_access.pop(entry_id, None)
+            ns.expired += 1
+            return None
+        ns.hits += 1
+        ns.similarity_sum += similarity
+        ns.saved_seconds += metadata.get("elapsed", 0.0)
+        ns.last_access[entry_id] = time.time()
+        return SemanticHit(metadata["answer"], similarity, prompt, entry_id)
+
+    def store(self, prompt: str, answer: str, namespace: str = "default", embedding: Optional[np.ndarray] = None,
+              ttl: Optional[float] = None, elapsed: float = 0.0) -> str:
+        """
+        Caches the answer of a prompt and returns its entry id.
+
+        :param ttl: Overrides the cache TTL for this entry.
+        :param elapsed: Latency of the call that produced the answer, reported as saved on every hit.
+        """
+        prompt = _normalize(prompt)
+        ns = self._namespace(namespace)
+        if embedding is None:
+            embedding = self._embed(prompt)
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        entry_id = _entry_id(prompt)
+        metadata = {"answer": answer, "created": now, "expires": now + ttl if ttl is not None else None,
+                    "elapsed": elapsed}
+        with self._lock:
+            ns.index.upsert(ids=[entry_id], embeddings=[embedding], documents=[prompt], metadatas=[metadata])
+            ns.last_access[entry_id] = now
+            ns.stores += 1
+            if ns.index.count() > self.max_entries:
+                self._evict(ns)
+            if self.persist_directory and time.monotonic() - self._persisted_at >= self.persist_interval:
+                self.persist()
+        return entry_id
+
+    def _evict(self, ns: _Namespace) -> None:
+        """Drops the least recently hit entries down to 90% of `max_entries` and reclaims their rows."""
+        target = int(self.max_entries * 0.9)
+        doomed = sorted(ns.last_access, key=ns.last_access.get)[:ns.index.count() - target]
+        ns.index.delete(ids=doomed)
+        for entry_id in doomed:
+            ns.last_access.pop(entry_id, None)
+        ns.evictions += len(doomed)
+        if ns.index.persist_directory:
+            ns.index.persist()  # Rewrites the index without the deleted rows
+        else:
+            ns.index = self._rebuilt(ns.index)
+
+    @staticmethod
+    def _rebuilt(index: LocalVectorIndex) -> LocalVectorIndex:
+        records = index.get(include=("documents", "metadatas", "embeddings"))
+        rebuilt = LocalVectorIndex(index.name, metric="cosine")
+        if records["ids"]:
+            rebuilt.add(ids=records["ids"], embeddings=records["embeddings"], documents=records["documents"],
+                        metadatas=records["metadatas"])
+        return rebuilt
+
+    # ------------------------------------------------------------------ calls
+
+    def call(self, prompt: str, fn: Callable[[], str], namespace: str = "default", bypass: bool = False,
+             ttl: Optional[float] = None) -> str:
+        """
+        Returns the cached answer of a similar prompt, or calls `fn` and caches its answer. The prompt is
+        embedded once for both. Exceptions raised by `fn` propagate and nothing is cached; errors of the
+        cache itself are logged and `fn` is called uncached.
+
+        :param bypass: Neither read nor write the cache for this call.
+        """
+        if bypass:
+            return fn()
+        prompt = _normalize(prompt)
+        try:
+            ns = self._namespace(namespace)
+            hit, embedding = self._search(ns, prompt)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed, calling uncached: {e}")
+            return fn()
+        if hit is not None:
+            if self.audit_rate and self._random.random() < self.audit_rate:
+                try:
+                    self._audit(ns, prompt, hit, fn())
+                except Exception as e:
+                    logger.warning(f"Semantic cache audit failed: {e}")
+            return hit.answer
+        start = time.perf_counter()
+        answer = fn()
+        if answer:
+            try:
+                self.store(prompt, answer, namespace, embedding=embedding, ttl=ttl,
+                           elapsed=time.perf_counter() - start)
+            except Exception as e:
+                logger.warning(f"Semantic cache store failed: {e}")
+        return answer
+
+    async def acall(self, prompt: str, fn: Callable[[], Any], namespace: str = "default", bypass: bool = False,
+                    ttl: Optional[float] = None) -> str:
+        """Async `call`: `fn` returns the awaitable of the answer; embedding and search run in a thread."""
+        if bypass:
+            return await fn()
+        prompt = _normalize(prompt)
+        try:
+            ns = self._namespace(namespace)
+            hit, embedding = await asyncio.to_thread(self._search, ns, prompt)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed, calling uncached: {e}")
+            return await fn()
+        if hit is not None:
+            if self.audit_rate and self._random.random() < self.audit_rate:
+                try:
+                    await asyncio.to_thread(self._audit, ns, prompt, hit, await fn())
+                except Exception as e:
+                    logger.warning(f"Semantic cache audit failed: {e}")
+            return hit.answer
+        start = time.perf_counter()
+        answer = await fn()
+        if answer:
+            try:
+                await asyncio.to_thread(self.store, prompt, answer, namespace, embedding, ttl,
+                                        time.perf_counter() - start)
+            except Exception as e:
+                logger.warning(f"Semantic cache store failed: {e}")
+        return answer
+
+    # ------------------------------------------------------------------ precision
+
+    def _similar_answers(self, prompt: str, cached: str, fresh: str) -> bool:
+        if _normalize(cached) == _normalize(fresh):
+            return True
+        a, b = self._embed(cached), self._embed(fresh)
+        return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0)) >= self.threshold
+
+    def _audit(self, ns: _Namespace, prompt: str, hit: SemanticHit, fresh: str) -> None:
+        correct = bool(self.judge(prompt, hit.answer, fresh))
+        with self._lock:
+            ns.judged += 1
+            ns.correct += correct
+        if not correct and hit.similarity < 1.0:
+            # The fresh answer is right for this wording; cache it so the paraphrase stops mismatching
+            self.store(prompt, fresh, ns.name)
+
+    def feedback(self, hit: SemanticHit, correct: bool, namespace: str = "default") -> None:
+        """
+        Records whether a hit's answer was right for its prompt, e.g. from user ratings. Wrong
+        answers are removed so they are not served again.
+        """
+        ns = self._namespace(namespace)
+        with self._lock:
+            ns.judged += 1
+            ns.correct += bool(correct)
+            if not correct:
+                ns.index.delete(ids=[hit.entry_id])
+                ns.last_access.pop(hit.entry_id, None)
+
+    # ------------------------------------------------------------------ housekeeping
+
+    def invalidate(self, namespace: str) -> None:
+        """Forgets every entry of a namespace."""
+        ns = self._namespace(namespace)
+        with self._lock:
+            ns.index.delete(ids=list(ns.last_access))
+            ns.last_access.clear()
+            if ns.index.persist_directory:
+                ns.index.persist()
+            else:
+                ns.index = self._rebuilt(ns.index)
+
+    def persist(self) -> None:
+        """Writes the namespace indexes to `persist_directory`."""
+        if not self.persist_directory:
+            return
+        with self._lock:
+            for ns in self._namespaces.values():
+                if ns.index.dimensions is not None:
+                    ns.index.persist()
+            self._persisted_at = time.monotonic()
+
+    def stats(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Hit rate, precision and size per namespace, or of one namespace.
+
+        Precision is the share of judged hits (audits and feedback) that were correct, None before any.
+        A namespace not used yet reports zeros and is not opened.
+        """
+        with self._lock:
+            names = [namespace] if namespace is not None else list(self._namespaces)
+            report = {}
+            for name in names:
+                ns = self._namespaces.get(name) or _Namespace(name, None)
+                report[name] = {
+                    "lookups": ns.lookups,
+                    "hits": ns.hits,
+                    "exact_hits": ns.exact_hits,
+                    "hit_rate": ns.hits / ns.lookups if ns.lookups else 0.0,
+                    "near_misses": ns.near_misses,
+                    "mean_hit_similarity": ns.similarity_sum / ns.hits if ns.hits else None,
+                    "judged": ns.judged,
+                    "precision": ns.correct / ns.judged if ns.judged else None,
+                    "stores": ns.stores,
+                    "expired": ns.expired,
+                    "evictions": ns.evictions,
+                    "entries": ns.index.count() if ns.index is not None else 0,
+                    "saved_seconds": round(ns.saved_seconds, 3),
+                }
+            return report[namespace] if namespace is not None else report
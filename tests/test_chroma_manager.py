@@ -0,0 +1,50 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 09:40
+# Author:david yuan
+# @File:test_chroma_manager.py
+# @Software:VeSync
+
+import pytest
+
+from vagents.manager import chroma_manager
+from vagents.manager.chroma_manager import ChromaManager
+from vagents.vagentic.emb.hash_emb import HashEmb
+
+
+class _NoChatBot:
+    def __init__(self, system_message=None):
+        pass
+
+    def get_client(self):
+        return None
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(chroma_manager, "AzureOpenAIChatBot", _NoChatBot)
+    db = ChromaManager("shared_chunks", embedder=HashEmb(dimensions=64), backend="local")
+    yield db
+    db.close()
+
+
+def test_delete_missing_keeps_chunk_shared_with_another_source(manager):
+    shared = "Marinate the chicken overnight."
+    manager.ingest_texts(["Preheat the oven.", shared], source="a.txt")
+    manager.ingest_texts([shared, "Serve with rice."], source="b.txt")
+
+    # a.txt no longer contains the shared chunk; b.txt still does
+    report = manager.ingest_texts(["Preheat the oven."], source="a.txt", delete_missing=True)
+
+    assert report["deleted"] == 1
+    b_chunks = manager.collection.get(where={"source": "b.txt"}, include=["documents"])["documents"]
+    assert sorted(b_chunks) == [shared, "Serve with rice."]
+    a_chunks = manager.collection.get(where={"source": "a.txt"}, include=["documents"])["documents"]
+    assert a_chunks == ["Preheat the oven."]
+
+
+def test_reingesting_unchanged_source_skips_everything(manager):
+    texts = ["Boil the noodles.", "Drain and rinse."]
+    manager.ingest_texts(texts, source="noodles.txt")
+    report = manager.ingest_texts(texts, source="noodles.txt", delete_missing=True)
+    assert report == {"added": 0, "updated": 0, "skipped": 2, "duplicates": 0, "deleted": 0}
@@ -0,0 +1,42 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/19 09:10
+# Author:david yuan
+# @File:test_html_extractor.py
+# @Software:VeSync
+
+from agentica.tools.html_extractor import html_to_markdown, html_to_text
+
+
+def test_sidebar_layout_wrapper_keeps_main():
+    page = ("<div class='site layout-has-sidebar'><main><h1>Braised pork</h1><p>Step one: sear the pork.</p>"
+            "</main></div><div class='copyright'>(c) 2024 Example</div>")
+    markdown = html_to_markdown(page)
+    assert "# Braised pork" in markdown
+    assert "Step one: sear the pork." in markdown
+    assert "Step one: sear the pork." in html_to_text(page)
+
+
+def test_ad_wrapper_keeps_article():
+    page = ("<div class='ads-wrapper'><article><p>Simmer for two hours.</p></article></div>"
+            "<div class='ads-wrapper'>Buy now</div>")
+    assert html_to_markdown(page) == "Simmer for two hours."
+
+
+def test_form_wrapping_the_page_keeps_main():
+    page = "<form id='aspnetForm'><nav>Home</nav><main><p>Serve with rice.</p></main></form>"
+    assert html_to_text(page) == "Serve with rice."
+
+
+def test_content_class_names_are_not_boilerplate():
+    page = ("<article><h2>Dumplings</h2><p class='recipe-share-count'>Serves 4</p>"
+            "<div class='related-tips-text'>Chill the dough first.</div></article>")
+    text = html_to_text(page)
+    assert "Serves 4" in text
+    assert "Chill the dough first." in text
+
+
+def test_boilerplate_is_still_skipped():
+    page = ("<body><nav>Menu</nav><div class='share-buttons'>Tweet</div><main><p>Body</p>"
+            "<div class='post-comments'>First!</div><div class='related'>More recipes</div></main>"
+            "<div id='sidebar'>Popular</div><footer>(c) footer</footer></body>")
+    assert html_to_text(page) == "Body"
@@ -7,6 +7,7 @@ from typing import List, Optional
 from agentica.utils.log import logger
 
 from agentica.tool import Toolkit
+from agentica.tools.http_client import get_http_client
 
 try:
     from apify_client import ApifyClient
@@ -32,6 +33,19 @@ class ApifyTool(Toolkit):
         if web_scraper:
             self.register(self.web_scrapper)
 
+    def _run_actor(self, actor_id: str, run_input: dict, timeout: Optional[int]) -> List[dict]:
+        """
+        Runs an actor and returns its dataset items. Runs with the same input are reused from the shared
+        HTTP cache, so an agent revisiting the same URLs does not start a new (billed) run.
+        """
+
+        def run_actor() -> List[dict]:
+            client = ApifyClient(self.api_key)
+            run = client.actor(actor_id).call(run_input=run_input, timeout_secs=timeout)
+            return list(client.dataset(run["defaultDatasetId"]).iterate_items())
+
+        return get_http_client().memoize(("apify", actor_id, run_input), run_actor)
+
     def website_content_crawler(self, urls: List[str], timeout: Optional[int] = 60) -> str:
         """
         Crawls a website using Apify's website-content-crawler actor.
@@ -47,14 +61,12 @@ class ApifyTool(Toolkit):
         if urls is None:
             return "No URLs provided"
 
-        client = ApifyClient(self.api_key)
         logger.debug(f"Crawling URLs: {urls}")
         formatted_urls = [{"url": url} for url in urls]
         run_input = {"startUrls": formatted_urls}
-        run = client.actor("apify/website-content-crawler").call(run_input=run_input, timeout_secs=timeout)
 
         results: str = ""
-        for item in client.dataset(run["defaultDatasetId"]).iterate_items():
+        for item in self._run_actor("apify/website-content-crawler", run_input, timeout):
             results += "Results for URL: " + item.get("url") + "\n"
             results += item.get("text") + "\n"
 
@@ -75,7 +87,6 @@ class ApifyTool(Toolkit):
         if urls is None:
             return "No URLs provided"
 
-        client = ApifyClient(self.api_key)
         logger.debug(f"Scrapping URLs: {urls}")
         formatted_urls = [{"url": url} for url in urls]
 
@@ -104,10 +115,8 @@ class ApifyTool(Toolkit):
             "startUrls": formatted_urls,
         }
 
-        run = client.actor("apify/web-scraper").call(run_input=run_input, timeout_secs=timeout)
-
         results: str = ""
-        for item in client.dataset(run["defaultDatasetId"]).iterate_items():
+        for item in self._run_actor("apify/web-scraper", run_input, timeout):
             results += "Results for URL: " + item.get("url") + "\n"
             results += item.get("pageTitle") + "\n"
             results += item.get("h1") + "\n"
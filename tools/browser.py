@@ -5,6 +5,8 @@ from pathlib import Path
 from bs4 import BeautifulSoup
 from selenium.webdriver.remote.webdriver import WebDriver
 
+from agentica.tools.html_extractor import html_to_text
+
 
 
 FILE_DIR = Path(__file__).parent.parent
@@ -82,14 +84,8 @@ def scrape_text_with_selenium(url: str, cfg: Config = None) -> tuple[WebDriver,
         Tuple[WebDriver, str]: The webdriver and the text scraped from the website
     """
     driver, page_source = get_pagesource_with_selenium(url, cfg.selenium_web_browser)
-    soup = BeautifulSoup(page_source, "html.parser")
-    for script in soup(["script", "style"]):
-        script.extract()
-
-    text = soup.get_text()
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    text = "\n".join(chunk for chunk in chunks if chunk)
+    # One block per line, without scripts, styles and navigation/footer boilerplate
+    text = html_to_text(page_source)
     return driver, text
 
 
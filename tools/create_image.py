@@ -5,10 +5,9 @@ import os
 import time
 from typing import Optional, cast
 
-import requests
-
 from agentica.llm import LLM, OpenAILLM
 from agentica.tool import Toolkit
+from agentica.tools.http_client import get_http_client
 
 
 class CreateImageTool(Toolkit):
@@ -102,7 +101,7 @@ class CreateImageTool(Toolkit):
         :param image_path: The path to the image.
         :type image_path: str
         """
-        image_data = requests.get(image_url).content
+        image_data = get_http_client().get(image_url).content
         os.makedirs(os.path.dirname(image_path), exist_ok=True)
         with open(image_path, "wb") as f:
             f.write(image_data)
@@ -5,6 +5,7 @@ import ssl
 from typing import Any, Optional
 
 from agentica.tool import Toolkit
+from agentica.tools.http_client import get_http_client
 from agentica.utils.log import logger
 
 try:
@@ -68,8 +69,9 @@ class DuckDuckGoTool(Toolkit):
             The result from DuckDuckGo.
         """
         logger.debug(f"Searching DDG for: {query}")
-        gen_res = self.ddgs.text(query, backend="lite", timelimit="d, w, m, y")
-        res = list(gen_res)[:max_results]
+        res = get_http_client().memoize(
+            ("ddg_text", query, max_results),
+            lambda: list(self.ddgs.text(query, backend="lite", timelimit="d, w, m, y"))[:max_results])
         return json.dumps(res, indent=2, ensure_ascii=False)
 
     def duckduckgo_news(self, query: str, max_results: int = 5) -> str:
@@ -83,8 +85,9 @@ class DuckDuckGoTool(Toolkit):
             The latest news from DuckDuckGo.
         """
         logger.debug(f"Searching DDG news for: {query}")
-        gen_res = self.ddgs.news(query, timelimit="d, w, m, y")
-        res = list(gen_res)[:max_results]
+        res = get_http_client().memoize(
+            ("ddg_news", query, max_results),
+            lambda: list(self.ddgs.news(query, timelimit="d, w, m, y"))[:max_results])
         return json.dumps(res, indent=2, ensure_ascii=False)
 
 
@@ -0,0 +1,366 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 22:40
+# Author:david yuan
+# @File:html_extractor.py
+# @Software:VeSync
+
+'''
+HTML to markdown and plain text, shared by the crawler and browser tools.
+
+The tree is walked with an explicit stack and the output is collected in a
+list joined once at the end, so conversion is linear in the page size and
+deeply nested pages cannot hit the recursion limit. Pages are parsed with
+lxml when it is installed (pip install lxml), otherwise with html.parser.
+Navigation, headers, footers, sidebars, forms and similar boilerplate are
+skipped by tag and by class/id, without modifying the parsed tree. Elements
+containing <article> or <main> are never skipped, whatever their class.
+'''
+import re
+from itertools import repeat
+from typing import List, Optional, Set, Tuple, Union
+from urllib.parse import urldefrag, urljoin
+
+try:
+    from bs4 import BeautifulSoup, NavigableString, Tag
+    from bs4.element import PreformattedString
+except ImportError:
+    raise ImportError("The `bs4` package is not installed. Please install it via `pip install beautifulsoup4`.")
+
+try:
+    import lxml  # noqa: F401
+
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+
+# Never rendered as content
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+             "head", "title", "meta", "link", "img", "picture", "video", "audio", "source", "input",
+             "select", "option", "textarea", "button"}
+# Page chrome rather than content; `header` only outside of article/main, where it holds the title
+BOILERPLATE_TAGS = {"nav", "footer", "aside", "form", "dialog", "menu"}
+BOILERPLATE_PATTERN = re.compile(
+    r"(?:^|[\s_-])(?:nav|navbar|navigation|menu|footer|sidebar|side-bar|breadcrumbs?|cookies?|consent|"
+    r"banner|social|advert|advertisement|sponsored|popup|modal|newsletter|subscribe|skip-link)(?:$|[\s_-])"
+    # Words also common in content class names (recipe-share-count): only at the end of a class
+    # name, optionally followed by a container suffix
+    r"|(?:^|[\s_-])(?:share|sharing|related|comments?|ads?)"
+    r"(?:[_-](?:wrapper|container|box|bar|block|area|section|widget|links|buttons|list|posts|slot|unit))?(?:$|\s)",
+    re.I)
+CONTENT_TAGS = {"article", "main"}
+
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+LISTS = {"ul", "ol", "dl"}
+# Separated from their surroundings by a blank line
+PARAGRAPH_TAGS = {"p", "blockquote", "pre", "table", "figure", "hr", "address", "details"} | set(HEADINGS)
+# Separated from their surroundings by a line break
+LINE_TAGS = {"div", "section", "article", "main", "header", "li", "tr", "dt", "dd", "figcaption", "caption",
+             "summary", "center", "fieldset", "legend"}
+
+# Separator strengths
+_LINE, _PARAGRAPH = 1, 2
+
+
+def parse_html(html: Union[str, bytes], parser: Optional[str] = None) -> BeautifulSoup:
+    """Parses a page with lxml if installed, otherwise with html.parser."""
+    return BeautifulSoup(html, parser or DEFAULT_PARSER)
+
+
+def _content_ancestors(root: Tag) -> Set[int]:
+    """ids of the <article>/<main> elements below `root` and of all their ancestors."""
+    protected: Set[int] = set()
+    for tag in root.find_all(sorted(CONTENT_TAGS)):
+        protected.add(id(tag))
+        for parent in tag.parents:
+            if id(parent) in protected:  # reached from an earlier content element
+                break
+            protected.add(id(parent))
+    return protected
+
+
+def _is_boilerplate(tag: Tag, in_content: bool) -> bool:
+    if tag.name in BOILERPLATE_TAGS or (tag.name == "header" and not in_content):
+        return True
+    attrs = tag.attrs
+    if not attrs:
+        return False
+    if "hidden" in attrs or attrs.get("aria-hidden") == "true" or attrs.get("role") in ("navigation", "banner"):
+        return True
+    classes = attrs.get("class")
+    names = " ".join(classes) if isinstance(classes, list) else (classes or "")
+    if attrs.get("id"):
+        names = f"{names} {attrs['id']}"
+    return bool(names) and BOILERPLATE_PATTERN.search(names) is not None
+
+
+class _Writer:
+    """
+    Output buffer that merges consecutive separators and whitespace, so every piece of text
+    is written once and nothing is stripped or re-concatenated afterwards.
+    """
+
+    def __init__(self, paragraph: str):
+        self.parts: List[str] = []
+        self.paragraph = paragraph
+        self.separator = 0
+        self.space = False
+        self.prefix = ""
+
+    def block(self, strength: int) -> None:
+        self.separator = max(self.separator, strength)
+        self.space = False
+
+    def write(self, text: str) -> None:
+        if self.parts:
+            if self.separator:
+                self.parts.append(self.paragraph if self.separator == _PARAGRAPH else "\n")
+            elif self.space:
+                self.parts.append(" ")
+        if self.prefix:
+            self.parts.append(self.prefix)
+            self.prefix = ""
+        self.parts.append(text)
+        self.separator = 0
+        self.space = False
+
+    def text(self, text: str) -> None:
+        """Writes a text node with its whitespace collapsed as a browser would render it."""
+        words = text.split()
+        if not words:
+            if text and self.parts:
+                self.space = True
+            return
+        if text[0].isspace():
+            self.space = True
+        self.write(" ".join(words))
+        self.space = text[-1].isspace()
+
+    def getvalue(self) -> str:
+        return "".join(self.parts)
+
+
+def _convert(root: Tag, markdown: bool, boilerplate: bool) -> str:
+    writer = _Writer("\n\n" if markdown else "\n")
+    list_depth = 0
+    content_depth = 0
+    pre_depth = 0
+    pre_start = 0
+    # A wrapper classed like a sidebar or ad slot may still hold the page's article
+    protected = _content_ancestors(root) if boilerplate else set()
+    # (node, exiting) pairs; children are pushed in reverse so they pop in document order
+    stack: List[Tuple[object, bool]] = [(child, False) for child in reversed(root.contents)]
+    while stack:
+        node, exiting = stack.pop()
+        if isinstance(node, NavigableString):
+            if isinstance(node, PreformattedString):  # comments, doctypes, CDATA, processing instructions
+                continue
+            if pre_depth:
+                writer.parts.append(str(node))  # verbatim, tidied up when the block closes
+            else:
+                writer.text(node)
+            continue
+        if not isinstance(node, Tag):
+            continue
+        name = node.name
+        if exiting:
+            if name in LISTS:
+                list_depth -= 1
+                writer.block(_LINE if list_depth else _PARAGRAPH)
+            elif name == "pre":
+                pre_depth -= 1
+                if not pre_depth:
+                    code = "".join(writer.parts[pre_start:]).strip("\n")
+                    del writer.parts[pre_start:]
+                    if code:
+                        writer.write(code)
+                    if markdown:
+                        writer.block(_LINE)
+                        writer.write("```")
+                writer.block(_PARAGRAPH)
+            else:
+                if name in CONTENT_TAGS:
+                    content_depth -= 1
+                if name == "li" or name in HEADINGS:
+                    writer.prefix = ""  # nothing was written, e.g. an empty list item
+                if name in PARAGRAPH_TAGS:
+                    writer.block(_PARAGRAPH)
+                elif name in LINE_TAGS:
+                    writer.block(_LINE)
+            continue
+
+        if name in SKIP_TAGS or (markdown and name == "a"):
+            continue
+        if boilerplate and id(node) not in protected and _is_boilerplate(node, content_depth > 0):
+            continue
+        if name == "br":
+            writer.block(_LINE)
+            continue
+        if name in LISTS:
+            writer.block(_LINE if list_depth else _PARAGRAPH)
+            list_depth += 1
+        elif name == "pre":
+            if not pre_depth:
+                writer.block(_PARAGRAPH)
+                if markdown:
+                    writer.write("```")
+                writer.block(_LINE)
+                pre_start = len(writer.parts)
+            pre_depth += 1
+        elif name in PARAGRAPH_TAGS:
+            writer.block(_PARAGRAPH)
+            if markdown and name in HEADINGS:
+                writer.prefix = "#" * HEADINGS[name] + " "
+        elif name in LINE_TAGS:
+            writer.block(_LINE)
+            if name in CONTENT_TAGS:
+                content_depth += 1
+            if markdown and name == "li":
+                writer.prefix = "  " * max(list_depth - 1, 0) + "* "
+        elif name in ("td", "th"):
+            writer.space = bool(writer.parts)
+        stack.append((node, True))
+        stack.extend(zip(reversed(node.contents), repeat(False)))
+    return writer.getvalue()
+
+
+def _root(html: Union[str, bytes, Tag], parser: Optional[str]) -> Tag:
+    root = html if isinstance(html, Tag) else parse_html(html, parser)
+    return root.body or root if isinstance(root, BeautifulSoup) else root
+
+
+def html_to_markdown(html: Union[str, bytes, Tag], boilerplate: bool = True, parser: Optional[str] = None) -> str:
+    """
+    Converts a page, or an already parsed element, to markdown: headings, paragraphs, nested lists and
+    code blocks, without images and links.
+
+    :param html: Page source or a BeautifulSoup element.
+    :param boilerplate: Skip navigation, headers, footers, sidebars, forms and the like.
+    :param parser: BeautifulSoup parser, lxml by default if installed.
+    :return: The markdown text.
+    """
+    root = _root(html, parser)
+    markdown = _convert(root, markdown=True, boilerplate=boilerplate)
+    if not markdown and boilerplate:  # everything looked like boilerplate, e.g. a page inside <nav>
+        markdown = _convert(root, markdown=True, boilerplate=False)
+    return markdown
+
+
+def html_to_text(html: Union[str, bytes, Tag], boilerplate: bool = True, parser: Optional[str] = None) -> str:
+    """
+    Converts a page, or an already parsed element, to plain text with one block per line, keeping link text.
+
+    :param html: Page source or a BeautifulSoup element.
+    :param boilerplate: Skip navigation, headers, footers, sidebars, forms and the like.
+    :param parser: BeautifulSoup parser, lxml by default if installed.
+    :return: The text.
+    """
+    root = _root(html, parser)
+    text = _convert(root, markdown=False, boilerplate=boilerplate)
+    if not text and boilerplate:
+        text = _convert(root, markdown=False, boilerplate=False)
+    return text
+
+
+def extract_links(soup: Tag, base_url: str) -> List[str]:
+    """Absolute, fragment-free URLs of all links of a page, boilerplate included, in document order."""
+    return [urldefrag(urljoin(base_url, link["href"]))[0] for link in soup.find_all("a", href=True)]
+
+
+def extract(html: Union[str, bytes], url: str, output_format: str = "markdown", boilerplate: bool = True,
+            parser: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Parses a page once into its content and links.
+
+    :param html: Page source.
+    :param url: URL of the page, to resolve relative links.
+    :param output_format: "markdown", "text", or anything else for the raw HTML.
+    :param boilerplate: Skip boilerplate in the content; links are always collected from the whole page.
+    :param parser: BeautifulSoup parser, lxml by default if installed.
+    :return: (content, links)
+    """
+    soup = parse_html(html, parser)
+    links = extract_links(soup, url)
+    if output_format == "markdown":
+        content = html_to_markdown(soup, boilerplate)
+    elif output_format == "text":
+        content = html_to_text(soup, boilerplate)
+    else:
+        content = str(soup)
+    return content, links
+
+
+if __name__ == '__main__':
+    # Benchmark: python html_extractor.py [saved_page.html ...]
+    # Without arguments, runs on a generated large article page and a deeply nested page.
+    import sys
+    import time
+
+    def legacy_markdown(element):
+        # The previous UrlCrawlerTool._convert_to_markdown: recursive, string concatenation, strip per level
+        markdown = ""
+        for child in element.children:
+            if isinstance(child, NavigableString):
+                text = child.strip()
+                if text:
+                    markdown += text
+            elif child.name in ["script", "style", "img", "a"]:
+                continue
+            elif child.name in ["p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol"]:
+                child_text = legacy_markdown(child).strip()
+                if child_text:
+                    markdown += f"\n\n{child_text}"
+            elif child.name == "li":
+                child_text = legacy_markdown(child).strip()
+                if child_text:
+                    markdown += f"\n* {child_text}"
+            else:
+                child_text = legacy_markdown(child).strip()
+                if child_text:
+                    markdown += child_text
+        return markdown.strip()
+
+    def generated_pages():
+        nav = "<nav><ul>" + "".join(f'<li><a href="/s{i}">Section {i}</a></li>' for i in range(200)) + "</ul></nav>"
+        sections = []
+        for i in range(3_000):
+            sections.append(f"<section><h2>Heading {i}</h2><div class='text'><p>Paragraph {i} with "
+                            f"<b>bold</b> and <a href='/x{i}'>a link</a> in it. " + "Filler text. " * 20 +
+                            f"</p><ul><li>Item {i}.1</li><li>Item {i}.2</li></ul></div></section>")
+        large = (f"<html><head><style>p {{}}</style></head><body>{nav}<main><article>"
+                 f"{''.join(sections)}</article></main><footer class='site-footer'>(c) footer</footer></body></html>")
+        # Nested sections each holding a paragraph: the old converter re-strips and re-copies the text
+        # below every level, and raises RecursionError beyond the recursion limit
+        nested = "<html><body>" + ("<div><p>" + "word " * 400 + "</p>") * 900 + "</div>" * 900 + "</body></html>"
+        deep = "<html><body>" + "<div><span>text</span>" * 5_000 + "</div>" * 5_000 + "</body></html>"
+        return [("generated-large", large), ("generated-nested", nested), ("generated-deep", deep)]
+
+    if len(sys.argv) > 1:
+        pages = []
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                pages.append((path, f.read()))
+    else:
+        pages = generated_pages()
+
+    sys.setrecursionlimit(3_000)
+    parsers = ["html.parser"] + (["lxml"] if DEFAULT_PARSER == "lxml" else [])
+    for label, page in pages:
+        print(f"{label}: {len(page) / 1e6:.2f} MB")
+        for parser in parsers:
+            start = time.perf_counter()
+            soup = parse_html(page, parser)
+            parse_s = time.perf_counter() - start
+            start = time.perf_counter()
+            try:
+                legacy_markdown(soup)
+                legacy = f"{time.perf_counter() - start:.3f}s"
+            except RecursionError:
+                legacy = "RecursionError"
+            start = time.perf_counter()
+            markdown = html_to_markdown(soup)
+            convert_s = time.perf_counter() - start
+            start = time.perf_counter()
+            text = html_to_text(soup)
+            text_s = time.perf_counter() - start
+            print(f"  {parser:<12} parse {parse_s:.3f}s | legacy markdown {legacy} | markdown {convert_s:.3f}s "
+                  f"({len(markdown)} chars) | text {text_s:.3f}s ({len(text)} chars)")
@@ -0,0 +1,516 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 23:20
+# Author:david yuan
+# @File:http_client.py
+# @Software:VeSync
+
+'''
+Shared HTTP layer for the web tools: pooled connections and an on-disk response cache.
+
+Responses are kept on disk for a TTL (the caller's, else the server's
+Cache-Control max-age, else the client default). Once stale, a response with
+an ETag or Last-Modified is revalidated with a conditional request, and a 304
+refreshes it without downloading the body again. Concurrent requests for the
+same resource are coalesced into one network request. Results of SDK calls
+that do not go through this client (Apify, Exa, DuckDuckGo) can be cached the
+same way with `memoize`. Hit rates are reported by `stats()`.
+'''
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+from agentica.utils.log import logger
+
+DEFAULT_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "agentica", "http"))
+# Request headers that do not change the response and are left out of the cache key
+IGNORED_KEY_HEADERS = {"user-agent", "accept-encoding", "connection", "if-none-match", "if-modified-since"}
+
+
+def _max_age(headers: httpx.Headers) -> Optional[float]:
+    """Freshness lifetime the server asked for, 0 for no-cache, None if it did not say."""
+    directives = {}
+    for directive in headers.get("cache-control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            return float(directives[name])
+    if "expires" in headers and "date" in headers:
+        try:
+            return max((parsedate_to_datetime(headers["expires"]) - parsedate_to_datetime(headers["date"])
+                        ).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+    return None
+
+
+def _no_store(headers: httpx.Headers) -> bool:
+    return "no-store" in headers.get("cache-control", "").lower()
+
+
+class HttpClient:
+    """
+    Pooled HTTP client with a persistent, revalidating response cache.
+
+    GET requests are cached; other methods only with `cache=True`, e.g. search APIs that take the
+    query as a POST body. The method, URL, body and request headers make up the cache key, so
+    different API keys or output formats are cached separately.
+
+    :param cache_dir: Directory of the response cache, None disables caching.
+    :param ttl: Seconds a response is served without revalidation when neither the caller nor the server says.
+    :param max_cache_bytes: Size of the cache directory above which the least recently used entries are evicted.
+    :param timeout: Request timeout in seconds.
+    :param max_connections: Connections pooled across all hosts.
+    """
+
+    evict_to = 0.8  # Eviction shrinks the cache to this fraction of max_cache_bytes
+
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, ttl: float = 3600,
+                 max_cache_bytes: int = 512 * 1024 * 1024, timeout: float = 30, max_connections: int = 20):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_cache_bytes = max_cache_bytes
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # httpx.Client is thread-safe, so one pool serves every tool and thread
+        self._client = httpx.Client(timeout=timeout, limits=self.limits, follow_redirects=True)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[tuple, asyncio.Future] = {}
+        self._cache_bytes: Optional[int] = None
+        self._stats = Counter()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------ cache entries
+
+    def _key(self, method: str, url: str, headers: Optional[dict], content: Optional[bytes]) -> str:
+        key_headers = sorted((k.lower(), v) for k, v in (headers or {}).items() if k.lower() not in IGNORED_KEY_HEADERS)
+        body = hashlib.sha256(content).hexdigest() if content else ""
+        return hashlib.sha256(json.dumps([method.upper(), url, key_headers, body]).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def _load(self, key: str) -> Optional[dict]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+            os.utime(path)  # recency for eviction
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.debug(f"Dropping unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def _save(self, key: str, entry: dict) -> None:
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        self._stats["stored"] += 1
+        with self._lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(os.path.getsize(p) for p, _ in self._entries())
+            else:
+                self._cache_bytes += size
+            over = self._cache_bytes > self.max_cache_bytes
+        if over:
+            self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".pkl"):
+                    path = os.path.join(root, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        continue
+
+    def _evict(self) -> None:
+        """Removes the least recently used entries until the cache is back under `evict_to` of its budget."""
+        entries = sorted(((stat.st_mtime, stat.st_size, path) for path, stat in self._entries()))
+        total = sum(size for _, size, _ in entries)
+        target = self.max_cache_bytes * self.evict_to
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+            self._stats["evicted"] += 1
+        with self._lock:
+            self._cache_bytes = total
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _fresh_until(self, now: float, ttl: Optional[float], headers: httpx.Headers) -> float:
+        if ttl is None:
+            ttl = _max_age(headers)
+        return now + (self.ttl if ttl is None else ttl)
+
+    def _entry(self, response: httpx.Response, ttl: Optional[float]) -> dict:
+        now = time.time()
+        return {
+            "url": str(response.url),
+            "status": response.status_code,
+            "headers": list(response.headers.multi_items()),
+            "content": response.content,
+            "stored_at": now,
+            "expires_at": self._fresh_until(now, ttl, response.headers),
+        }
+
+    @staticmethod
+    def _response(method: str, entry: dict, source: str) -> httpx.Response:
+        """Rebuilds a response from a cache entry; `response.extensions["cache"]` says where it came from."""
+        headers = [(k, v) for k, v in entry["headers"] if k.lower() not in ("content-encoding", "transfer-encoding")]
+        return httpx.Response(entry["status"], headers=headers, content=entry["content"],
+                              request=httpx.Request(method, entry["url"]), extensions={"cache": source})
+
+    @staticmethod
+    def _conditional_headers(headers: dict, entry: Optional[dict]) -> dict:
+        if entry is None:
+            return headers
+        cached = httpx.Headers(entry["headers"])
+        conditional = dict(headers)
+        if "etag" in cached:
+            conditional["If-None-Match"] = cached["etag"]
+        if "last-modified" in cached:
+            conditional["If-Modified-Since"] = cached["last-modified"]
+        return conditional
+
+    def _revalidatable(self, entry: Optional[dict]) -> bool:
+        return entry is not None and any(k.lower() in ("etag", "last-modified") for k, _ in entry["headers"])
+
+    def _handle(self, method: str, key: str, entry: Optional[dict], response: httpx.Response,
+                ttl: Optional[float], cache: bool) -> httpx.Response:
+        """Turns a network response into the caller's response, refreshing or storing the cache entry."""
+        if response.status_code == 304 and entry is not None:
+            self._stats["revalidated"] += 1
+            entry = dict(entry, stored_at=time.time(),
+                         expires_at=self._fresh_until(time.time(), ttl, response.headers))
+            # A 304 may carry updated validators
+            headers = httpx.Headers(entry["headers"])
+            for name in ("etag", "last-modified", "cache-control", "expires", "date"):
+                if name in response.headers:
+                    headers[name] = response.headers[name]
+            entry["headers"] = list(headers.multi_items())
+            self._save(key, entry)
+            return self._response(method, entry, "revalidated")
+        self._stats["misses"] += 1
+        if cache and response.status_code == 200 and not _no_store(response.headers):
+            try:
+                self._save(key, self._entry(response, ttl))
+            except Exception as e:
+                logger.warning(f"Failed to cache {response.url}: {e}")
+        return response
+
+    def _prepare(self, method: str, url: str, params: Optional[dict], headers: Optional[dict],
+                 content: Optional[bytes], json_body: Any, cache: Optional[bool]):
+        method = method.upper()
+        url = str(httpx.URL(url, params=params)) if params else url
+        headers = dict(headers or {})
+        if json_body is not None:
+            content = json.dumps(json_body, ensure_ascii=False, sort_keys=True).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        cache = (method == "GET" if cache is None else cache) and bool(self.cache_dir)
+        return method, url, headers, content, cache, self._key(method, url, headers, content)
+
+    def _lookup(self, method: str, key: str, cache: bool, refresh: bool):
+        """(fresh cached response or None, stored entry or None)."""
+        self._stats["requests"] += 1
+        if not cache:
+            return None, None
+        entry = self._load(key)
+        if entry is not None and not refresh and entry["expires_at"] > time.time():
+            self._stats["hits"] += 1
+            self._stats["bytes_from_cache"] += len(entry["content"])
+            return self._response(method, entry, "hit"), entry
+        return None, entry
+
+    # ------------------------------------------------------------------ sync API
+
+    def request(self, method: str, url: str, *, params: Optional[dict] = None, headers: Optional[dict] = None,
+                content: Optional[bytes] = None, json: Any = None, ttl: Optional[float] = None,
+                cache: Optional[bool] = None, refresh: bool = False, timeout: Optional[float] = None
+                ) -> httpx.Response:
+        """
+        Sends a request through the connection pool and the response cache.
+
+        :param ttl: Seconds the response stays fresh, overriding the server's Cache-Control.
+        :param cache: Cache this request; defaults to GET requests only.
+        :param refresh: Revalidate even if the cached response is still fresh.
+        :return: An `httpx.Response`; `response.extensions["cache"]` is "hit" or "revalidated" when
+                 the body came from the cache.
+        """
+        method, url, headers, content, cache, key = self._prepare(method, url, params, headers, content, json, cache)
+        cached, entry = self._lookup(method, key, cache, refresh)
+        if cached is not None:
+            return cached
+        if not cache:
+            return self._send(method, url, headers, content, timeout)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._stats["coalesced"] += 1
+            return future.result()
+        try:
+            send_headers = self._conditional_headers(headers, entry) if self._revalidatable(entry) else headers
+            response = self._handle(method, key, entry, self._send(method, url, send_headers, content, timeout),
+                                    ttl, cache)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _send(self, method: str, url: str, headers: dict, content: Optional[bytes],
+              timeout: Optional[float]) -> httpx.Response:
+        try:
+            return self._client.request(method, url, headers=headers, content=content,
+                                        timeout=self.timeout if timeout is None else timeout)
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def cached(self, url: str, method: str = "GET", headers: Optional[dict] = None) -> Optional[httpx.Response]:
+        """The fresh cached response of a request, without touching the network or the metrics."""
+        entry = self._load(self._key(method, url, headers, None)) if self.cache_dir else None
+        if entry is None or entry["expires_at"] <= time.time():
+            return None
+        return self._response(method, entry, "hit")
+
+    # ------------------------------------------------------------------ async API
+
+    async def arequest(self, method: str, url: str, *, client: Optional[httpx.AsyncClient] = None,
+                       params: Optional[dict] = None, headers: Optional[dict] = None, content: Optional[bytes] = None,
+                       json: Any = None, ttl: Optional[float] = None, cache: Optional[bool] = None,
+                       refresh: bool = False, timeout: Optional[float] = None) -> httpx.Response:
+        """
+        Async `request`. Async clients are bound to their event loop, so the network request goes
+        through the caller's pooled `client`, or a short-lived one if none is given.
+        """
+        method, url, headers, content, cache, key = self._prepare(method, url, params, headers, content, json, cache)
+        cached, entry = self._lookup(method, key, cache, refresh)
+        if cached is not None:
+            return cached
+        if not cache:
+            return await self._asend(client, method, url, headers, content, timeout)
+
+        loop = asyncio.get_running_loop()
+        inflight_key = (id(loop), key)
+        with self._lock:
+            future = self._ainflight.get(inflight_key)
+            leader = future is None
+            if leader:
+                future = self._ainflight[inflight_key] = loop.create_future()
+        if not leader:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(future)
+        try:
+            send_headers = self._conditional_headers(headers, entry) if self._revalidatable(entry) else headers
+            response = await self._asend(client, method, url, send_headers, content, timeout)
+            response = self._handle(method, key, entry, response, ttl, cache)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, so an exception nobody waited for is not logged
+            raise
+        finally:
+            with self._lock:
+                self._ainflight.pop(inflight_key, None)
+
+    async def _asend(self, client: Optional[httpx.AsyncClient], method: str, url: str, headers: dict,
+                     content: Optional[bytes], timeout: Optional[float]) -> httpx.Response:
+        try:
+            if client is not None:  # keeps the caller's timeout unless one is given
+                kwargs = {} if timeout is None else {"timeout": timeout}
+                return await client.request(method, url, headers=headers, content=content, **kwargs)
+            async with httpx.AsyncClient(follow_redirects=True) as own_client:
+                return await own_client.request(method, url, headers=headers, content=content,
+                                                timeout=self.timeout if timeout is None else timeout)
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    # ------------------------------------------------------------------ memoized calls
+
+    def memoize(self, key: Any, fn: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Returns the cached result of `fn()` for `key`, calling it once per TTL. For SDK calls that do
+        not go through this client; the result must be picklable. Concurrent calls are coalesced.
+
+        :param key: JSON-serializable identity of the call, e.g. ("exa", query, kwargs).
+        :param fn: The call to cache.
+        :param ttl: Seconds the result is reused, defaults to the client TTL.
+        """
+        key = hashlib.sha256(json.dumps(["memoize", key], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        self._stats["requests"] += 1
+        entry = self._load(key)
+        if entry is not None and entry["expires_at"] > time.time():
+            self._stats["hits"] += 1
+            return entry["value"]
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            self._stats["coalesced"] += 1
+            return future.result()
+        try:
+            self._stats["misses"] += 1
+            value = fn()
+            if self.cache_dir:
+                now = time.time()
+                self._save(key, {"value": value, "stored_at": now, "expires_at": now + (self.ttl if ttl is None else ttl)})
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            self._stats["errors"] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # ------------------------------------------------------------------ metrics and housekeeping
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters since creation. `hit_rate` counts fresh hits, 304 revalidations and coalesced requests
+        as served without downloading the body; `network` is the number of requests that went out.
+        """
+        stats = {name: self._stats[name] for name in ("requests", "hits", "revalidated", "coalesced", "misses",
+                                                      "errors", "stored", "evicted", "bytes_from_cache")}
+        served = stats["hits"] + stats["revalidated"] + stats["coalesced"]
+        stats["hit_rate"] = served / stats["requests"] if stats["requests"] else 0.0
+        stats["network"] = stats["misses"] + stats["revalidated"]
+        return stats
+
+    def clear(self) -> None:
+        """Removes every cached entry."""
+        if not self.cache_dir:
+            return
+        for path, _ in list(self._entries()):
+            self._remove(path)
+        with self._lock:
+            self._cache_bytes = 0
+
+    def close(self) -> None:
+        self._client.close()
+
+
+_default_client: Optional[HttpClient] = None
+_default_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """The process-wide client shared by the tools, created on first use."""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = HttpClient()
+    return _default_client
+
+
+if __name__ == '__main__':
+    # Demo against a local server with 100 ms responses and ETags: an agent loop revisiting pages,
+    # concurrent requests for one page, and revalidation of stale entries.
+    import http.server
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    served = Counter()
+
+    class FixtureHandler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(0.1)
+            etag = f'"{self.path}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                served["304"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            served["200"] += 1
+            body = f"<html><body><p>page {self.path}</p></body></html>".encode() * 200
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = HttpClient(cache_dir=cache_dir, ttl=60)
+        urls = [f"{base}/page/{i}" for i in range(10)]
+        start = time.perf_counter()
+        for step in range(10):  # ten agent steps revisiting the same ten pages
+            for url in urls:
+                client.get(url)
+        print(f"10 steps x 10 pages: {time.perf_counter() - start:.2f}s, server sent {served['200']} bodies")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            list(executor.map(lambda _: client.get(f"{base}/hot"), range(20)))
+        print(f"20 concurrent requests for one page: {time.perf_counter() - start:.2f}s, "
+              f"server sent {served['200'] - 10} bodies")
+
+        response = client.get(urls[0], refresh=True)  # as if the entry had gone stale
+        print(f"stale entry: {response.extensions.get('cache')}, server answered {served['304']} x 304")
+        print(client.stats())
+    server.shutdown()
@@ -9,8 +9,8 @@ Jina 有2个功能：
 """
 from os import getenv
 from typing import Optional
-import requests
 from agentica.tool import Toolkit
+from agentica.tools.http_client import get_http_client
 from agentica.utils.log import logger
 
 
@@ -20,8 +20,13 @@ class JinaTool(Toolkit):
             api_key: Optional[str] = None,
             jina_reader: bool = True,
             jina_search: bool = False,
+            cache_ttl: Optional[float] = None,
     ):
+        """
+        :param cache_ttl: Seconds a fetched page or search result is reused, defaults to the shared HTTP cache's TTL.
+        """
         super().__init__(name="jina_tool")
+        self.cache_ttl = cache_ttl
 
         self.api_key = api_key or getenv("JINA_API_KEY")
         if not self.api_key:
@@ -54,7 +59,9 @@ class JinaTool(Toolkit):
         if self.api_key:
             headers['Authorization'] = f'Bearer {self.api_key}'
         try:
-            response = requests.get(f'https://r.jina.ai/{url}', headers=headers)
+            # Cached and revalidated by the shared client, so revisiting a page does not re-crawl it
+            response = get_http_client().get(f'https://r.jina.ai/{url}', headers=headers, ttl=self.cache_ttl,
+                                             timeout=timeout + 10)
             if response.status_code != 200:
                 logger.error(f"Failed to fetch URL. HTTP status code: {response.status_code}")
             else:
@@ -85,7 +92,7 @@ class JinaTool(Toolkit):
         if self.api_key:
             headers['Authorization'] = f'Bearer {self.api_key}'
         try:
-            response = requests.get(f'https://s.jina.ai/{query}', headers=headers)
+            response = get_http_client().get(f'https://s.jina.ai/{query}', headers=headers, ttl=self.cache_ttl)
             if response.status_code != 200:
                 logger.error(f"Failed to fetch URL. HTTP status code: {response.status_code}")
             else:
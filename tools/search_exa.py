@@ -10,6 +10,7 @@ from os import getenv
 from typing import Optional, Dict, Any, List
 
 from agentica.tool import Toolkit
+from agentica.tools.http_client import get_http_client
 from agentica.utils.log import logger
 
 try:
@@ -62,6 +63,30 @@ class SearchExaTool(Toolkit):
 
         self.register(self.search_exa)
 
+    def _parse_results(self, exa_results) -> List[Dict[str, Any]]:
+        exa_results_parsed = []
+        for result in exa_results.results:
+            result_dict = {"url": result.url}
+            if result.title:
+                result_dict["title"] = result.title
+            if result.author and result.author != "":
+                result_dict["author"] = result.author
+            if result.published_date:
+                result_dict["published_date"] = result.published_date
+            if result.text:
+                _text = result.text
+                if self.text_length_limit:
+                    _text = _text[: self.text_length_limit]
+                result_dict["text"] = _text
+            if self.highlights:
+                try:
+                    if result.highlights:  # type: ignore
+                        result_dict["highlights"] = result.highlights  # type: ignore
+                except Exception as e:
+                    logger.debug(f"Failed to get highlights {e}")
+            exa_results_parsed.append(result_dict)
+        return exa_results_parsed
+
     def search_exa(self, query: str, num_results: int = 5) -> str:
         """Use this function to search Exa (a web search engine) for a query.
 
@@ -93,28 +118,10 @@ class SearchExaTool(Toolkit):
             }
             # Clean up the kwargs
             search_kwargs = {k: v for k, v in search_kwargs.items() if v is not None}
-            exa_results = exa.search_and_contents(query, **search_kwargs)
-            exa_results_parsed = []
-            for result in exa_results.results:
-                result_dict = {"url": result.url}
-                if result.title:
-                    result_dict["title"] = result.title
-                if result.author and result.author != "":
-                    result_dict["author"] = result.author
-                if result.published_date:
-                    result_dict["published_date"] = result.published_date
-                if result.text:
-                    _text = result.text
-                    if self.text_length_limit:
-                        _text = _text[: self.text_length_limit]
-                    result_dict["text"] = _text
-                if self.highlights:
-                    try:
-                        if result.highlights:  # type: ignore
-                            result_dict["highlights"] = result.highlights  # type: ignore
-                    except Exception as e:
-                        logger.debug(f"Failed to get highlights {e}")
-                exa_results_parsed.append(result_dict)
+            # Identical searches within the cache TTL are answered from the shared HTTP cache
+            exa_results_parsed = get_http_client().memoize(
+                ("exa", query, search_kwargs, self.text_length_limit),
+                lambda: self._parse_results(exa.search_and_contents(query, **search_kwargs)))
             parsed_results = json.dumps(exa_results_parsed, indent=2, ensure_ascii=False)
             if self.show_results:
                 logger.info(parsed_results)
@@ -3,8 +3,6 @@
 @author:XuMing(xuming624@qq.com)
 @description:
 """
-import http.client
-import json
 import os
 import ssl
 from typing import Dict, Optional
@@ -12,6 +10,7 @@ from typing import Dict, Optional
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 from agentica.tool import Toolkit
+from agentica.tools.http_client import get_http_client
 from agentica.utils.log import logger
 
 # Create a default context for HTTPS requests (not recommended for production)
@@ -24,6 +23,7 @@ class SerperWrapper(BaseModel):
     api_key: str
     payload: dict = Field(default_factory=lambda: {"page": 1, "num": 10})
     proxy: Optional[str] = None
+    cache_ttl: Optional[float] = None
 
     @model_validator(mode="before")
     @classmethod
@@ -43,16 +43,15 @@ class SerperWrapper(BaseModel):
         """Run query through Serper and parse result"""
         headers = self.get_headers()
 
-        conn = http.client.HTTPSConnection("google.serper.dev")
-        payload = json.dumps({
+        payload = {
             "q": query,
             "num": max_results,
-        })
+        }
         try:
-            conn.request("POST", "/search", payload, headers)
-            res = conn.getresponse()
-            data = res.read()
-            data = json.loads(data.decode("utf-8"))
+            # The query is the POST body, which is part of the cache key, so repeated searches are cached
+            response = get_http_client().post("https://google.serper.dev/search", json=payload, headers=headers,
+                                              cache=True, ttl=self.cache_ttl)
+            data = response.json()
             res = self._process_response(data, as_string=as_string)
         except Exception as e:
             logger.error(f"Failed to search {query} due to {e}")
@@ -4,6 +4,8 @@
 # @File:load_data.py
 # @Software:VeSync
 
+import bisect
+import itertools
 import os
 import argparse
 from tqdm import tqdm
@@ -12,40 +14,155 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..','..')))
 
 from vagents.manager.chroma_manager import ChromaManager
+from vagents.manager.ingest_pipeline import IngestCheckpoint, Record, StreamingPipeline
 
 class DocumentUtil:
-    def __init__(self):
-        self.db = ChromaManager('doc_db')
-
-    def embed_and_store_documents(self,documents_directory): 
-        documents = []
-        metadatas = []
-        files = os.listdir(documents_directory)
-        for filename in files:
-            with open(f"{documents_directory}/{filename}", "r") as file:
-                for line_number, line in enumerate(
-                        tqdm((file.readlines()), desc=f"Reading {filename}"), 1
-                ):
-                    line = line.strip()
-                    if len(line) == 0:
-                        continue
-                    documents.append(line)
-                    metadatas.append({"filename": filename, "line_number": line_number})
+    window_chunks = 8  # Chunks' worth of lines chunked together, bounds memory per file
 
+    def __init__(self, embedder=None, dedup=False, chunker=None):
+        self.db = ChromaManager('doc_db', embedder=embedder, dedup=dedup)
+        self.chunker = chunker
+
+    def iter_documents(self, documents_directory):
+        '''
+        Lazily yields one record per non-empty line of every file in the directory,
+        or with a chunker, one record per chunk of consecutive lines.
+        '''
+        for filename in sorted(os.listdir(documents_directory)):
+            path = os.path.join(documents_directory, filename)
+            if not os.path.isfile(path):
+                continue
+            lines = self._iter_lines(path)
+            if self.chunker is None:
+                for line_number, line in lines:
+                    yield Record(filename, line_number, line, {"filename": filename, "line_number": line_number})
+            else:
+                yield from self._iter_chunks(filename, lines)
+
+    @staticmethod
+    def _iter_lines(path):
+        with open(path, "r", encoding="utf-8", errors="ignore") as file:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if len(line) > 0:
+                    yield line_number, line
+
+    def _iter_chunks(self, filename, lines):
+        '''
+        Chunks windows of about `window_chunks` chunks of lines, so a file is never held in memory whole.
+        Chunks do not span windows. The checkpoint offset of a chunk is its ordinal within the file,
+        which is stable as long as the chunker settings are.
+        '''
+        window_chars = self.chunker.chunk_tokens * 4 * self.window_chunks
+        ordinal = 0
+        window, starts, size = [], [], 0  # lines, (char offset, line number) of each line, chars
+        for line_number, line in itertools.chain(lines, [(None, None)]):
+            if line is not None:
+                starts.append((size, line_number))
+                window.append(line)
+                size += len(line) + 1
+                if size < window_chars:
+                    continue
+            if not window:
+                break
+            for chunk in self.chunker.chunk_text("\n".join(window), source=filename):
+                ordinal += 1
+                first_line = starts[bisect.bisect_right(starts, (chunk.start, float("inf"))) - 1][1]
+                yield Record(filename, ordinal, chunk.text,
+                             {"filename": filename, "line_number": first_line, "chunk": ordinal})
+            window, starts, size = [], [], 0
+
+    def migrate_line_ids(self, batch_size=1000):
+        '''
+        Re-keys documents stored under the sequential IDs of earlier versions ("0", "1", ...) by content
+        hash, keeping their embeddings, so re-ingesting the same files does not store every line twice.
+
+        Returns:
+            int: Number of migrated documents.
+        '''
         collection = self.db.load_collection()
+        legacy = []
+        for offset in range(0, collection.count(), batch_size):
+            legacy.extend(doc_id for doc_id in collection.get(limit=batch_size, offset=offset, include=[])["ids"]
+                          if doc_id.isdigit())
+        for start in range(0, len(legacy), batch_size):
+            batch = collection.get(ids=legacy[start:start + batch_size],
+                                   include=["documents", "metadatas", "embeddings"])
+            records = {}
+            for document, metadata, embedding in zip(batch["documents"], batch["metadatas"], batch["embeddings"]):
+                embedding = embedding.tolist() if hasattr(embedding, "tolist") else embedding
+                records.setdefault(self.db.content_id(document), (document, metadata, embedding))
+            ids = list(records)
+            self.db.upsert_records(ids=ids,
+                                   documents=[records[doc_id][0] for doc_id in ids],
+                                   embeddings=[records[doc_id][2] for doc_id in ids],
+                                   metadatas=[records[doc_id][1] for doc_id in ids])
+            self.db.delete_records(batch["ids"])
+        if legacy:
+            self.db.commit()
+            print(f"Migrated {len(legacy)} documents to content-hash IDs")
+        return len(legacy)
 
+    def embed_and_store_documents(self, documents_directory, batch_size=100, queue_size=4, resume=True):
+        '''
+        Streams the documents through read -> chunk -> embed -> write stages with bounded queues,
+        so memory stays flat regardless of corpus size. Progress is checkpointed per file
+        after every written batch; with `resume` a restarted run continues where it stopped.
+        Without an embedder the collection's own embedding function embeds the documents
+        as they are written, as in `ChromaManager.store_text_to_collection`.
+        '''
+        collection = self.db.load_collection()
+        if collection.get(ids=["0"], include=[])["ids"]:
+            self.migrate_line_ids()
         count = collection.count()
         print(f"Collection already contains {count} documents")
-        ids = [str(i) for i in range(count, count + len(documents))]
 
-        for i in tqdm(
-                range(0, len(documents), 100), desc="Adding documents", unit_scale=100
-        ):
-            collection.add(
-                ids=ids[i: i + 100],
-                documents=documents[i: i + 100],
-                metadatas=metadatas[i: i + 100],  # type: ignore
-            )
+        checkpoint = IngestCheckpoint(os.path.join(self.db.get_persist_directory(), "ingest_checkpoint.json"))
+        if not resume:
+            checkpoint.reset()
+
+        progress = tqdm(desc="Adding documents", unit="doc")
+
+        def write(records, embeddings):
+            ids, documents, metadatas, vectors = [], [], [], []
+            seen = set()
+            for i, record in enumerate(records):
+                doc_id = self.db.content_id(record.text)
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                ids.append(doc_id)
+                documents.append(record.text)
+                metadatas.append(record.metadata)
+                if embeddings is not None:
+                    vectors.append(embeddings[i])
+            self.db.upsert_records(ids=ids, documents=documents, embeddings=vectors if embeddings is not None else None,
+                                   metadatas=metadatas)
+            self.db.commit_batch()
+            progress.update(len(records))
+
+        def drop_duplicates(records):
+            # Exact and near duplicates of stored lines are dropped before they are embedded
+            kept = self.db.deduplicate([self.db.content_id(record.text) for record in records],
+                                       [record.text for record in records],
+                                       [record.metadata for record in records])
+            return [records[i] for i in kept]
+
+        pipeline = StreamingPipeline(
+            embed_fn=(lambda texts: self.db.generate_embeddings(texts)[1]) if self.db.embedder is not None else None,
+            write_fn=write,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            checkpoint=checkpoint,
+            filter_fn=drop_duplicates if self.db.dedup else None,
+        )
+        try:
+            stats = pipeline.run(self.iter_documents(documents_directory))
+        finally:
+            progress.close()
+            self.db.commit()  # persists the keyword and dedup indexes and pending provenance
 
         new_count = collection.count()
-        print(f"Added {new_count - count} documents")
+        print(f"Added {new_count - count} documents, skipped {stats['resumed']} already ingested lines "
+              f"and {stats['filtered']} duplicates in {stats['seconds']:.1f}s")
+        return stats
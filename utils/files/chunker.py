@@ -0,0 +1,201 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 20:30
+# Author:david yuan
+# @File:chunker.py
+# @Software:VeSync
+
+'''
+Token-aware text chunking.
+
+Text is split into sentences on Chinese and English boundaries, sentences are
+packed into chunks of at most `chunk_tokens` tokens, and consecutive chunks
+share up to `overlap_tokens` tokens of trailing sentences. Chunks are yielded
+lazily; several files are chunked in parallel in a process pool.
+'''
+import hashlib
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# A sentence ends after Chinese terminators, after English terminators followed by whitespace,
+# or at a line break; closing quotes and brackets stay with their sentence.
+_SENTENCE_END = re.compile(r"([。！？；…!?]+[”’」』)）\"']*|[.;]+[”’\"')]*(?=\s)|\n+)")
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+# Extensions read directly; anything else goes through unstructured (PDF, Word, HTML, ...)
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".csv", ".json", ".jsonl", ".log", ".rst", ".yaml", ".yml"}
+
+
+class Chunk(NamedTuple):
+    text: str
+    source: Optional[str]
+    index: int  # Position of the chunk within its source
+    start: int  # Character offset of the chunk within the source text
+    tokens: int
+
+
+def split_sentences(text: str) -> List[str]:
+    """Splits text into sentences, keeping terminators and the whitespace that follows them."""
+    sentences, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        end = match.end()
+        while end < len(text) and text[end] in " \t":
+            end += 1
+        if end > start:
+            sentences.append(text[start:end])
+        start = end
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+class TextChunker:
+    """
+    Packs sentences into token-bounded, overlapping chunks.
+
+    :param chunk_tokens: Maximum tokens per chunk.
+    :param overlap_tokens: Tokens of trailing sentences repeated at the start of the next chunk.
+    :param encoding_name: tiktoken encoding used to count tokens, if tiktoken is installed.
+    """
+
+    def __init__(self, chunk_tokens: int = 500, overlap_tokens: int = 50, encoding_name: str = "cl100k_base"):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.encoding_name = encoding_name
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding {encoding_name} unavailable, estimating tokens: {e}")
+
+    def __getstate__(self):
+        # tiktoken encodings are rebuilt in worker processes rather than pickled
+        state = self.__dict__.copy()
+        state["_encoding"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(state["chunk_tokens"], state["overlap_tokens"], state["encoding_name"])
+
+    def count_tokens(self, text: str) -> int:
+        """Returns the token count, estimated as one per CJK character plus ~4 other chars per token."""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        cjk = len(_CJK.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def chunk_text(self, text: str, source: Optional[str] = None) -> Iterator[Chunk]:
+        """Yields the chunks of a text in order."""
+        window: List[tuple] = []  # (offset, sentence, tokens) of the chunk being built
+        window_tokens = 0
+        index = 0
+        offset = 0
+        for sentence in split_sentences(text):
+            for piece_offset, piece, tokens in self._pieces(sentence, offset):
+                if window and window_tokens + tokens > self.chunk_tokens:
+                    yield self._chunk(window, source, index)
+                    index += 1
+                    window, window_tokens = self._overlap(window, tokens)
+                window.append((piece_offset, piece, tokens))
+                window_tokens += tokens
+            offset += len(sentence)
+        if window and any(piece.strip() for _, piece, _ in window):
+            yield self._chunk(window, source, index)
+
+    def _pieces(self, sentence: str, offset: int):
+        """Yields a sentence as one piece, or hard-split into chunk-sized pieces if it is too long."""
+        tokens = self.count_tokens(sentence)
+        if tokens <= self.chunk_tokens:
+            yield offset, sentence, tokens
+            return
+        if self._encoding is not None:
+            ids = self._encoding.encode(sentence, disallowed_special=())
+            for start in range(0, len(ids), self.chunk_tokens):
+                piece = self._encoding.decode(ids[start:start + self.chunk_tokens])
+                yield offset, piece, min(self.chunk_tokens, len(ids) - start)
+                offset += len(piece)
+            return
+        step = max(1, len(sentence) * self.chunk_tokens // tokens)
+        for start in range(0, len(sentence), step):
+            piece = sentence[start:start + step]
+            yield offset + start, piece, self.count_tokens(piece)
+
+    def _overlap(self, window: List[tuple], incoming_tokens: int):
+        """Trailing sentences of the previous chunk that fit into the overlap and leave room for the next one."""
+        budget = min(self.overlap_tokens, self.chunk_tokens - incoming_tokens)
+        kept, kept_tokens = [], 0
+        for item in reversed(window):
+            if kept_tokens + item[2] > budget:
+                break
+            kept.append(item)
+            kept_tokens += item[2]
+        kept.reverse()
+        return kept, kept_tokens
+
+    @staticmethod
+    def _chunk(window: List[tuple], source: Optional[str], index: int) -> Chunk:
+        text = "".join(piece for _, piece, _ in window).strip()
+        return Chunk(text, source, index, window[0][0], sum(tokens for _, _, tokens in window))
+
+
+def read_text(path: str) -> str:
+    """Reads a file as text; non-text formats are converted with unstructured (pip install unstructured)."""
+    if os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    from unstructured.partition.auto import partition
+    return "\n\n".join(str(element) for element in partition(filename=path))
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_file(path: str, chunker: Optional[TextChunker] = None) -> Iterator[Chunk]:
+    """Yields the chunks of one file."""
+    chunker = chunker or TextChunker()
+    return chunker.chunk_text(read_text(path), source=path)
+
+
+def _chunk_file_list(path: str, chunker: TextChunker) -> List[Chunk]:
+    return list(chunk_file(path, chunker))
+
+
+def chunk_files(paths: Iterable[str], chunker: Optional[TextChunker] = None,
+                max_workers: Optional[int] = None) -> Iterator[Chunk]:
+    """
+    Yields the chunks of many files, reading and chunking them in parallel in a process pool.
+    Chunks of one file stay together and in order; files are yielded as they complete.
+
+    :param max_workers: Worker processes, defaults to the CPU count; 1 chunks in this process.
+    """
+    chunker = chunker or TextChunker()
+    paths = list(paths)
+    if len(paths) <= 1 or max_workers == 1:
+        for path in paths:
+            yield from chunk_file(path, chunker)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_chunk_file_list, path, chunker): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                yield from future.result()
+            except Exception as e:
+                logger.error(f"Failed to chunk {futures[future]}: {e}")
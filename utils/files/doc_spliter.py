@@ -7,45 +7,82 @@
 '''
 pip install langchain
 '''
-from langchain.document_loaders import UnstructuredFileLoader
-from langchain.chains.summarize import load_summarize_chain
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.vectorstores import Chroma
-from langchain.text_splitter import CharacterTextSplitter
+from langchain.docstore.document import Document
 from langchain import OpenAI
-from langchain.document_loaders import DirectoryLoader
 from langchain.chains import RetrievalQA
-from langchain.vectorstores import Chroma
+from pydantic import PrivateAttr
 from vagents.vagentic.files.base import File
+from vagents.vagentic.files.chunker import TextChunker, chunk_files, file_hash
+import hashlib
 import os
+
+# Vector stores opened in this process, keyed by persist directory
+_stores = {}
+
+
 class DocSpliter(File):
+    '''
+    Splits a file into token-aware chunks and answers questions over it.
+    Nothing is read until chunks are needed, and the vector index of a file is persisted under
+    `persist_path` keyed by the file's content hash, the chunking settings and the embedding model,
+    so asking again about an unchanged file reuses its embeddings instead of re-embedding the whole
+    document, and changing any of them builds a new index.
+    '''
+    chunk_tokens: int = 500
+    overlap_tokens: int = 50
+    persist_path: str = 'vector_store'
+    _embeddings: object = PrivateAttr(default=None)
 
-    def __init__(self, txt_path):
-        self.loader = UnstructuredFileLoader(txt_path)
-        # 将文本转成 Document 对象
-        self.documents = self.loader.load()
+    def __init__(self, txt_path, **kwargs):
+        super().__init__(data_path=txt_path, name=os.path.basename(txt_path), **kwargs)
+
+    @property
+    def embeddings(self):
         # 初始化 openai 的 embeddings 对象
-        self.embeddings = OpenAIEmbeddings()
-        print(f'documents: {len(self.documents)}')
-        self.persist_path = 'vector_store'
+        if self._embeddings is None:
+            self._embeddings = OpenAIEmbeddings()
+        return self._embeddings
 
-    def get_spilt_docs(self):
-        # 初始化文本分割器
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size = 500,
-            chunk_overlap = 0
-        )
+    def iter_chunks(self):
+        '''
+        Lazily yields the chunks of the file.
+        '''
+        chunker = TextChunker(self.chunk_tokens, self.overlap_tokens)
+        return chunk_files([self.data_path], chunker)
 
+    def get_spilt_docs(self):
         # 切分文本
-        split_documents = text_splitter.split_documents(self.documents)
+        split_documents = [
+            Document(page_content=chunk.text,
+                     metadata={"source": chunk.source, "chunk": chunk.index, "start": chunk.start})
+            for chunk in self.iter_chunks()
+        ]
         print(f'documents: {len(split_documents)}')
         return split_documents
 
+    @classmethod
+    def split_files(cls, paths, chunk_tokens=500, overlap_tokens=50, max_workers=None):
+        '''
+        Yields the chunks of many files, chunked in parallel across a process pool.
+        '''
+        return chunk_files(paths, TextChunker(chunk_tokens, overlap_tokens), max_workers=max_workers)
 
-    def qa_result(self,split_documents,query_text):
-        # 将 document 通过 openai 的 embeddings 对象计算 embedding 向量信息并临时存入 Chroma 向量数据库，用于后续匹配查询
-        docsearch = Chroma.from_documents(split_documents, self.embeddings)
+    def get_persist_directory(self):
+        '''
+        Index directory of the current file content, chunking settings and embedding model; a change
+        to any of them gets a new index.
+        '''
+        embeddings = self.embeddings
+        model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        settings = f"{self.chunk_tokens}:{self.overlap_tokens}:{model}"
+        settings_key = hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.persist_path, f"{file_hash(self.data_path)[:32]}-{settings_key}")
+
+    def qa_result(self, split_documents=None, query_text=None):
+        # 复用按文件内容持久化的向量库，只有新文件才计算 embedding
+        docsearch = self.load_chroma(split_documents)
 
         # 创建问答对象
         qa = RetrievalQA.from_chain_type(llm=OpenAI(), chain_type="stuff", retriever=docsearch.as_retriever(),
@@ -55,16 +92,23 @@ class DocSpliter(File):
         print(result)
         return result
 
-
-    def chroma_save(self):
+    def chroma_save(self, split_documents=None):
         # 持久化数据
-        docsearch = Chroma.from_documents(self.documents, self.embeddings, persist_directory=self.persist_path)
+        persist_directory = self.get_persist_directory()
+        docsearch = Chroma.from_documents(split_documents or self.get_spilt_docs(), self.embeddings,
+                                          persist_directory=persist_directory)
         docsearch.persist()
-
-    def load_chroma(self):
-        # 加载数据
-        docsearch = Chroma(persist_directory=self.persist_path, embedding_function=self.embeddings)
+        _stores[persist_directory] = docsearch
         return docsearch
 
-
-
+    def load_chroma(self, split_documents=None):
+        # 加载数据，不存在时先切分并持久化
+        persist_directory = self.get_persist_directory()
+        docsearch = _stores.get(persist_directory)
+        if docsearch is not None:
+            return docsearch
+        if not os.path.isdir(persist_directory):
+            return self.chroma_save(split_documents)
+        docsearch = Chroma(persist_directory=persist_directory, embedding_function=self.embeddings)
+        _stores[persist_directory] = docsearch
+        return docsearch
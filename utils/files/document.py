@@ -34,7 +34,17 @@ class Document(BaseModel):
         if hasattr(_embedder, "get_embedding_and_usage"):
             self.embedding, self.usage = _embedder.get_embedding_and_usage(self.content)
         else:
-            self.embedding = _embedder.get_embedding(self.content)
+            self.embedding = _embedder.get_embeddings([self.content])[0].tolist()
+
+    @classmethod
+    def embed_documents(cls, documents: List["Document"], embedder: Emb, batch_size: int = 32) -> None:
+        """Embed many documents with a single batched call to the embedder"""
+
+        if len(documents) == 0:
+            return
+        embeddings = embedder.get_embeddings([document.content for document in documents], batch_size=batch_size)
+        for document, embedding in zip(documents, embeddings):
+            document.embedding = embedding.tolist()
 
     def to_dict(self) -> Dict[str, Any]:
         """Returns a dictionary representation of the document"""
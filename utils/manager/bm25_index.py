@@ -0,0 +1,183 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 19:00
+# Author:david yuan
+# @File:bm25_index.py
+# @Software:VeSync
+
+'''
+In-process BM25 inverted index kept next to a vector collection.
+
+Latin tokens keep model numbers such as "LV-PUR131S" whole. Chinese text is
+segmented with jieba when it is installed, otherwise indexed as character
+unigrams plus bigrams.
+'''
+import math
+import os
+import pickle
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*|[一-鿿]+")
+_CJK = re.compile(r"[一-鿿]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; CJK runs are segmented with jieba or split into unigrams and bigrams."""
+    tokens: List[str] = []
+    for match in _TOKEN.findall(text.lower()):
+        if not _CJK.match(match):
+            tokens.append(match)
+            # Also index the parts of compound tokens so "pur131s" matches "LV-PUR131S"
+            parts = re.split(r"[-_.]", match)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+        elif jieba is not None:
+            tokens.extend(word for word in jieba.lcut_for_search(match) if word.strip())
+        else:
+            tokens.extend(match)
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    BM25 (Okapi) index over documents identified by string IDs.
+
+    :param path: Pickle file the index is persisted to, None keeps it in memory.
+    :param k1: Term frequency saturation.
+    :param b: Document length normalization.
+
+    `version` is free for the owner to record which state of the documents the index reflects; it is
+    persisted with the index.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_terms: List[Optional[Dict[str, int]]] = []
+        self._doc_lengths: List[int] = []
+        self._row_of: Dict[str, int] = {}
+        self._total_length = 0
+        self.version = 0
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str]) -> None:
+        """Indexes documents, replacing earlier versions of the same IDs."""
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                if doc_id in self._row_of:
+                    self.delete([doc_id])
+                terms = Counter(tokenize(text or ""))
+                row = len(self._doc_ids)
+                self._doc_ids.append(doc_id)
+                self._doc_terms.append(dict(terms))
+                length = sum(terms.values())
+                self._doc_lengths.append(length)
+                self._total_length += length
+                self._row_of[doc_id] = row
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[row] = tf
+            self._dirty = True
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                row = self._row_of.pop(doc_id, None)
+                if row is None:
+                    continue
+                for term in self._doc_terms[row]:
+                    posting = self._postings.get(term)
+                    if posting is not None:
+                        posting.pop(row, None)
+                        if not posting:
+                            del self._postings[term]
+                self._total_length -= self._doc_lengths[row]
+                self._doc_ids[row] = None
+                self._doc_terms[row] = None
+                self._doc_lengths[row] = 0
+                self._dirty = True
+
+    def search(self, query: str, n_results: int = 10,
+               allowed: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns the best matching (id, score) pairs, highest score first.
+
+        :param allowed: Restrict results to these IDs.
+        """
+        with self._lock:
+            n_docs = len(self._row_of)
+            if n_docs == 0:
+                return []
+            allowed_rows = {self._row_of[doc_id] for doc_id in allowed if doc_id in self._row_of} \
+                if allowed is not None else None
+            avg_length = self._total_length / n_docs
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for row, tf in posting.items():
+                    if allowed_rows is not None and row not in allowed_rows:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[row] / avg_length)
+                    scores[row] = scores.get(row, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+            return [(self._doc_ids[row], score) for row, score in best]
+
+    def persist(self) -> None:
+        """Writes the index to `path` if it changed since the last persist."""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            self._compact()
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"k1": self.k1, "b": self.b, "ids": self._doc_ids, "terms": self._doc_terms,
+                             "version": self.version}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def _compact(self) -> None:
+        if len(self._row_of) == len(self._doc_ids):
+            return
+        live = [(doc_id, terms) for doc_id, terms in zip(self._doc_ids, self._doc_terms) if doc_id is not None]
+        self._rebuild([doc_id for doc_id, _ in live], [terms for _, terms in live])
+
+    def _rebuild(self, ids: List[str], doc_terms: List[Dict[str, int]]) -> None:
+        self._postings = {}
+        self._doc_ids = list(ids)
+        self._doc_terms = list(doc_terms)
+        self._doc_lengths = [sum(terms.values()) for terms in doc_terms]
+        self._total_length = sum(self._doc_lengths)
+        self._row_of = {doc_id: row for row, doc_id in enumerate(ids)}
+        for row, terms in enumerate(doc_terms):
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[row] = tf
+
+    @classmethod
+    def open(cls, path: str, **kwargs) -> "BM25Index":
+        """Loads the index persisted at `path`, or returns an empty one."""
+        index = cls(path, **kwargs)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            index.k1, index.b = state["k1"], state["b"]
+            index.version = state.get("version", 0)
+            index._rebuild(state["ids"], state["terms"])
+        return index
@@ -3,21 +3,39 @@
 # Author:david yuan
 # @File:chrome_util.py
 # @Software:VeSync
+import hashlib
 import json
-import chromadb
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from vagents.vagentic.config import Config
-from tqdm import tqdm  # Import tqdm
 import os
 '''
 pip install chromadb
-pip install tqdm
 '''
 from vagents.vagentic.llms.simple_client import OpenAIChatBot
 from vagents.vagentic.llms.azure_client import AzureOpenAIChatBot
+from vagents.vagentic.emb.batcher import EmbeddingBatcher
+from vagents.manager.query_cache import collection_versions
+from vagents.manager.chroma_pool import chroma_pool
+from vagents.manager.ingest_pipeline import IngestCheckpoint, Record, StreamingPipeline, iter_json_object_items
+from vagents.manager.bm25_index import BM25Index
+from vagents.manager.quantization import truncate
+from vagents.manager.dedup import NearDuplicateIndex
+
+_write_count_lock = threading.Lock()
 
 
 class ChromaManager:
-    def __init__(self, collection_name, use_azure=True):
+    embedding_model = "text-embedding-3-small"
+    write_batch_size = 1000  # Records per collection write
+    provenance_keys = ("duplicate_count", "duplicate_sources")  # Metadata maintained by deduplication
+    max_duplicate_sources = 20  # Sources listed in a chunk's duplicate_sources
+    index_persist_interval = 300  # Seconds between keyword/dedup index persists in bulk ingestion
+
+    def __init__(self, collection_name, use_azure=True, max_batch_tokens=100_000, max_batch_size=256,
+                 max_concurrency=4, embedder=None, backend="chroma", index_params=None, query_cache=None,
+                 keyword_index=False, index_dimensions=None, dedup=False, dedup_threshold=0.85):
         """
         Initializes the EmbeddingStorageManager with a specific collection for embeddings.
         Allows selection between AzureOpenAIChatBot and OpenAIChatBot based on the `use_azure` flag.
@@ -25,19 +43,66 @@ class ChromaManager:
         Args:
             collection_name (str): The name of the collection to store embeddings.
             use_azure (bool): A flag to choose between AzureOpenAIChatBot (True) or OpenAIChatBot (False).
+            max_batch_tokens (int): Token budget of a single embedding request.
+            max_batch_size (int): Maximum number of texts in a single embedding request.
+            max_concurrency (int): Number of embedding requests in flight at once.
+            embedder (Emb, optional): Embedder used instead of the chatbot's embeddings endpoint,
+                e.g. a Text2VecEmb for local ingestion.
+            backend (str): "chroma" for a Chroma PersistentClient, or "local" for the built-in
+                LocalVectorIndex (memory-mapped vectors, exact or IVF search).
+            index_params (dict, optional): Keyword arguments for LocalVectorIndex, e.g.
+                {"index_type": "ivf", "n_probe": 16} or {"quantization": "binary", "rescore": 10}.
+                Managers opening the same local collection must not pass conflicting settings.
+            query_cache (QueryCache, optional): Cache of query results, invalidated on every write
+                to the collection. May be shared between managers.
+            keyword_index (bool): Keep a BM25 index of the documents in sync with every write,
+                used by `hybrid_query`. It is also enabled by the first `hybrid_query`.
+            index_dimensions (int, optional): Store and search embeddings truncated to this many
+                leading dimensions and renormalized, e.g. 256 or 512 for text-embedding-3-* models.
+                Must stay the same for the lifetime of a collection.
+            dedup (bool): Drop exact and near-duplicate chunks in `ingest_texts` and `deduplicate`,
+                recording what was merged in the kept chunk's metadata.
+            dedup_threshold (float): Estimated Jaccard similarity above which chunks are near duplicates.
         """
         self.system_message = None  # Placeholder for system message
         self.collection_name = collection_name
-
-        # Select the appropriate chatbot based on the use_azure flag
+        if backend not in ("chroma", "local"):
+            raise ValueError(f"Unsupported backend: {backend}")
+        self.backend = backend
+        self.index_params = index_params or {}
+        self.query_cache = query_cache
+        self.keyword_index = keyword_index
+        self.index_dimensions = index_dimensions
+        self.dedup = dedup
+        self.dedup_threshold = dedup_threshold
+        self._dedup = None
+        self._provenance_pending = set()
+        self._bm25 = None
+        self._indexes_persisted_at = time.monotonic()
+
+        # Select the appropriate chatbot based on the use_azure flag. Each manager has its own chatbot
+        # (and message history); AzureOpenAIChatBot draws its API client from the shared client_pool.
         self.chatbot = AzureOpenAIChatBot(system_message=self.system_message) if use_azure else OpenAIChatBot(
             system_message=self.system_message)
 
         self.client = self.chatbot.get_client()
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.batcher = EmbeddingBatcher(
+            self._embed_batch,
+            max_batch_tokens=max_batch_tokens,
+            max_batch_size=max_batch_size,
+            max_concurrency=max_concurrency,
+        )
         self.vector_client = None
         self.persist_directory = None
         self.collection = None
+        self._held = None  # (backend, persist_directory) referenced in the pool
         self._initialize_storage()
+        if keyword_index:
+            self._keyword_index()
+        if dedup:
+            self._dedup_index()
 
 
 
@@ -55,6 +120,8 @@ class ChromaManager:
         '''
         Check if the collection is properly connected and operational.
         '''
+        if self.backend == "local":
+            return self.collection is not None
         try:
             collections = self.vector_client.list_collections()
             if self.collection_name in collections:
@@ -66,55 +133,423 @@ class ChromaManager:
 
     def generate_embeddings(self, texts):
         '''
-        Generate embeddings for a list of texts using OpenAI's API with a progress bar.
+        Generate embeddings for a list of texts using OpenAI's API.
+        Texts are packed into token-bounded batches that are sent concurrently;
+        embeddings are returned in the same order as the texts.
         '''
-        embeddings = []
-        for text in tqdm(texts, desc="Generating embeddings"):  # tqdm wraps the iterable and displays progress
-            response = self.client.embeddings.create(
-                input=[text.replace("\n", " ")],
-                model="text-embedding-3-small"
-            )
-            embeddings.append(response.data[0].embedding)
-        return texts, embeddings
+        inputs = [text.replace("\n", " ") for text in texts]
+        if self.embedder is not None:
+            embeddings = self.embedder.get_embeddings(inputs, batch_size=self.max_batch_size)
+        else:
+            embeddings = self.batcher.embed(inputs)
+        return texts, self._index_vectors(embeddings)
+
+    def _index_vectors(self, embeddings):
+        '''
+        Truncates embeddings to `index_dimensions` when set; returns lists as the collections expect.
+        '''
+        if self.index_dimensions is not None and len(embeddings):
+            return truncate(embeddings, self.index_dimensions).tolist()
+        return embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings
+
+    def _embed_batch(self, texts):
+        '''
+        Embed one batch of texts with a single API request.
+        '''
+        kwargs = {}
+        if self.index_dimensions is not None and self.embedding_model.startswith("text-embedding-3"):
+            kwargs["dimensions"] = self.index_dimensions  # the API truncates and renormalizes server-side
+        response = self.client.embeddings.create(
+            input=texts,
+            model=self.embedding_model,
+            **kwargs
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
     def store_embeddings_to_collection(self, texts, embeddings):
         '''
         Bulk store texts along with their embeddings in ChromaDB.
+        IDs are derived from the text content, so storing the same texts again overwrites
+        them in place instead of colliding with unrelated documents.
         '''
-        self.collection.add(
-            documents=texts,  # Assuming the API can handle lists directly
-            embeddings=embeddings,
-            metadatas=[{"text": text[3:]} for text in texts if len(text) > 3],  # Truncate first 3 characters
-            ids=[f"text_{i}" for i in range(len(texts))]  # List of unique IDs
+        unique = self._unique_by_id(texts)
+        self.upsert_records(
+            ids=[doc_id for doc_id, _ in unique],
+            documents=[texts[i] for _, i in unique],
+            embeddings=[embeddings[i] for _, i in unique],
+            metadatas=[self._text_metadata(texts[i]) for _, i in unique]
         )
+        self.commit()
 
     def store_text_to_collection(self, texts):
         '''
         Bulk store texts along with their embeddings in ChromaDB.
+        Without an embedder the collection's own embedding function is used.
         '''
-        self.collection.add(
-            documents=texts,  # Assuming the API can handle lists directly
-            metadatas=[{"text": text[3:]} for text in texts if len(text) > 3],  # Truncate first 3 characters
-            ids=[f"text_{i}" for i in range(len(texts))]  # List of unique IDs
+        if self.embedder is not None:
+            texts, embeddings = self.generate_embeddings(texts)
+            return self.store_embeddings_to_collection(texts, embeddings)
+        unique = self._unique_by_id(texts)
+        self.upsert_records(
+            ids=[doc_id for doc_id, _ in unique],
+            documents=[texts[i] for _, i in unique],
+            metadatas=[self._text_metadata(texts[i]) for _, i in unique]
         )
+        self.commit()
+
+    def ingest_texts(self, texts, metadatas=None, source=None, delete_missing=False):
+        '''
+        Incrementally ingest texts, embedding and writing only what changed.
+
+        Each text gets an ID hashed from its source and content, so a chunk found in several
+        sources is stored once per source and each source owns its copies. Texts already stored
+        with the same metadata are skipped, texts whose metadata changed are updated without
+        re-embedding, and new texts are embedded and upserted. With `delete_missing`, chunks
+        previously ingested from the same `source` that are no longer present are deleted.
+
+        Args:
+            texts (list[str]): The chunks to ingest.
+            metadatas (list[dict], optional): Metadata aligned with `texts`.
+            source (str, optional): Source identifier (e.g. file path) stored in each chunk's metadata.
+            delete_missing (bool): Delete stale chunks of `source` that are not in `texts`.
+
+        Returns:
+            dict: Counts of "added", "updated", "skipped", "duplicates" (dropped by dedup) and "deleted" chunks.
+        '''
+        if metadatas is not None and len(metadatas) != len(texts):
+            raise ValueError(f"Got {len(metadatas)} metadatas for {len(texts)} texts")
+
+        records = {}
+        for i, text in enumerate(texts):
+            metadata = dict(metadatas[i]) if metadatas is not None else {}
+            metadata["source"] = source or metadata.get("source", "")
+            records.setdefault(self.content_id(text, metadata["source"]), (text, metadata))
+
+        existing = self._get_existing_metadatas(list(records))
+        to_add = [doc_id for doc_id in records if doc_id not in existing]
+        to_update = [doc_id for doc_id in records
+                     if doc_id in existing and self._strip_provenance(existing[doc_id]) != records[doc_id][1]]
+        duplicates = 0
+        if self.dedup and to_add:
+            kept = self.deduplicate(to_add, [records[doc_id][0] for doc_id in to_add],
+                                    [records[doc_id][1] for doc_id in to_add])
+            duplicates = len(to_add) - len(kept)
+            to_add = [to_add[i] for i in kept]
+        report = {
+            "added": len(to_add),
+            "updated": len(to_update),
+            "skipped": len(records) - len(to_add) - len(to_update) - duplicates,
+            "duplicates": duplicates,
+            "deleted": 0,
+        }
+
+        for start in range(0, len(to_update), self.write_batch_size):
+            chunk = to_update[start:start + self.write_batch_size]
+            # Provenance of merged duplicates survives metadata updates
+            self.collection.update(ids=chunk, metadatas=[
+                {**records[doc_id][1], **{key: value for key, value in (existing[doc_id] or {}).items()
+                                          if key in self.provenance_keys}}
+                for doc_id in chunk
+            ])
+
+        if to_add:
+            _, embeddings = self.generate_embeddings([records[doc_id][0] for doc_id in to_add])
+            self.upsert_records(
+                ids=to_add,
+                documents=[records[doc_id][0] for doc_id in to_add],
+                embeddings=embeddings,
+                metadatas=[records[doc_id][1] for doc_id in to_add]
+            )
+
+        if delete_missing and source:
+            stored = self.collection.get(where={"source": source}, include=[])["ids"]
+            stale = [doc_id for doc_id in stored if doc_id not in records]
+            self.delete_records(stale)
+            report["deleted"] = len(stale)
+
+        self.commit()
+        print(f"=====> Ingested into {self.collection_name}: {report}")
+        return report
+
+    def deduplicate(self, ids, texts, metadatas=None):
+        '''
+        Filters exact and near duplicates of stored chunks and of earlier chunks of the same call.
+        Kept chunks are indexed for later calls. Each dropped chunk is recorded as merged into the
+        chunk it duplicates, whose metadata gets "duplicate_count" and "duplicate_sources" on the
+        next `commit`.
+
+        Args:
+            ids (list[str]): Content IDs of the chunks.
+            texts (list[str]): The chunks.
+            metadatas (list[dict], optional): Metadata whose "source" (or "filename") is kept as provenance.
+
+        Returns:
+            list[int]: Positions of the chunks to keep.
+        '''
+        index = self._dedup_index()
+        kept = []
+        for i, (doc_id, text) in enumerate(zip(ids, texts)):
+            metadata = (metadatas[i] if metadatas is not None else None) or {}
+            duplicate_of = index.check(doc_id, text, source=metadata.get("source") or metadata.get("filename"))
+            if duplicate_of is None:
+                kept.append(i)
+            else:
+                self._provenance_pending.add(duplicate_of)
+        return kept
+
+    def dedup_stats(self):
+        '''
+        Returns counts of checked, exact-duplicate, near-duplicate and indexed chunks, or None without dedup.
+        '''
+        index = self._dedup or chroma_pool.get_shared(("dedup", self.collection_name), store=self._held)
+        return index.stats() if index is not None else None
+
+    def upsert_records(self, ids, documents, embeddings=None, metadatas=None):
+        '''
+        Upserts records in chunks of `write_batch_size` and keeps the keyword index in sync.
+        All writes of documents should go through here; call `commit` once afterwards.
+        Without embeddings the collection's own embedding function is used, or on the local
+        backend, whose pooled index has none, `generate_embeddings`.
+        '''
+        if embeddings is not None:
+            embeddings = self._index_vectors(embeddings)
+        elif self.backend == "local":
+            _, embeddings = self.generate_embeddings(documents)
+        for start in range(0, len(ids), self.write_batch_size):
+            end = start + self.write_batch_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                embeddings=embeddings[start:end] if embeddings is not None else None,
+                metadatas=metadatas[start:end] if metadatas is not None else None
+            )
+        writes = self._count_write()
+        keyword_index = self._bm25 or chroma_pool.get_shared(("bm25", self.collection_name), store=self._held)
+        if keyword_index is not None:
+            keyword_index.add(ids, documents)
+            if keyword_index.version == writes - 1:
+                keyword_index.version = writes
+        dedup_index = self._dedup or chroma_pool.get_shared(("dedup", self.collection_name), store=self._held)
+        if dedup_index is not None:
+            for doc_id, document in zip(ids, documents):
+                dedup_index.add(doc_id, document or "")
+
+    def delete_records(self, ids):
+        '''
+        Deletes records in chunks of `write_batch_size` and drops them from the keyword index.
+        '''
+        for start in range(0, len(ids), self.write_batch_size):
+            self.collection.delete(ids=ids[start:start + self.write_batch_size])
+        writes = self._count_write()
+        keyword_index = self._bm25 or chroma_pool.get_shared(("bm25", self.collection_name), store=self._held)
+        if keyword_index is not None:
+            keyword_index.delete(ids)
+            if keyword_index.version == writes - 1:
+                keyword_index.version = writes
+        dedup_index = self._dedup or chroma_pool.get_shared(("dedup", self.collection_name), store=self._held)
+        if dedup_index is not None:
+            for doc_id in ids:
+                dedup_index.remove(doc_id)
+
+    def _write_count(self):
+        '''
+        Number of document writes made to the collection through `upsert_records` and `delete_records`,
+        kept in the persist directory. The keyword index records the count it reflects.
+        '''
+        try:
+            with open(os.path.join(self.persist_directory, f"{self.collection_name}.writes")) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _count_write(self):
+        '''
+        Increments the collection's write count and returns it.
+        '''
+        path = os.path.join(self.persist_directory, f"{self.collection_name}.writes")
+        with _write_count_lock:
+            writes = self._write_count() + 1
+            os.makedirs(self.persist_directory, exist_ok=True)
+            with open(f"{path}.tmp", "w") as f:
+                f.write(str(writes))
+            os.replace(f"{path}.tmp", path)
+        return writes
+
+    @staticmethod
+    def content_id(text, source=None):
+        '''
+        Stable ID of a chunk, derived from its content and, when given, the source it belongs to.
+        '''
+        key = f"{source}\x00{text}" if source else text
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _strip_provenance(self, metadata):
+        return {key: value for key, value in (metadata or {}).items() if key not in self.provenance_keys}
+
+    def _flush_provenance(self):
+        '''
+        Writes the provenance of merged duplicates into the metadata of the chunks they were merged into.
+        Chunks that are not stored yet stay pending until a later commit.
+        '''
+        if not self._provenance_pending:
+            return
+        index = self._dedup_index()
+        existing = self._get_existing_metadatas(list(self._provenance_pending))
+        ids = list(existing)
+        metadatas = []
+        for doc_id in ids:
+            merged = index.provenance(doc_id)
+            sources = sorted({source for source in merged.values() if source})
+            metadata = dict(existing[doc_id] or {})
+            metadata["duplicate_count"] = len(merged)
+            metadata["duplicate_sources"] = "; ".join(sources[:self.max_duplicate_sources])
+            metadatas.append(metadata)
+        for start in range(0, len(ids), self.write_batch_size):
+            self.collection.update(ids=ids[start:start + self.write_batch_size],
+                                   metadatas=metadatas[start:start + self.write_batch_size])
+        self._provenance_pending.difference_update(ids)
+
+    @staticmethod
+    def _text_metadata(text):
+        return {"text": text[3:]}  # Truncate first 3 characters
+
+    def _unique_by_id(self, texts):
+        '''
+        Returns (id, index) pairs for the first occurrence of each distinct text.
+        '''
+        seen = {}
+        for i, text in enumerate(texts):
+            seen.setdefault(self.content_id(text), i)
+        return list(seen.items())
+
+    def _get_existing_metadatas(self, ids):
+        '''
+        Returns {id: metadata} for the given IDs that already exist in the collection.
+        '''
+        existing = {}
+        for start in range(0, len(ids), self.write_batch_size):
+            result = self.collection.get(ids=ids[start:start + self.write_batch_size], include=["metadatas"])
+            existing.update(zip(result["ids"], result["metadatas"]))
+        return existing
 
 
     def load_collection(self):
-        self.collection = self.vector_client.get_collection(self.collection_name)
         return self.collection
 
+    def close(self):
+        '''
+        Releases this manager's hold on the pooled client so it can be closed when idle.
+        '''
+        if self._held is not None:
+            chroma_pool.release(*self._held)
+            self._held = None
+        self.collection = None
+        self._bm25 = None
+        self._dedup = None
+        self._provenance_pending = set()
+
+    @property
+    def collection_key(self):
+        '''
+        Identifies the current collection in the process-wide version registry.
+        '''
+        return f"{self.persist_directory}::{self.collection_name}"
+
+    def commit(self, persist_indexes=True):
+        '''
+        Marks the end of a write: writes the provenance of merged duplicates, flushes the collection,
+        persists the keyword and dedup indexes and bumps the collection version, which invalidates
+        cached query results.
+
+        Args:
+            persist_indexes (bool): Also write provenance and persist the keyword and dedup indexes.
+                Both indexes are rewritten whole, so bulk ingestion does it only every
+                `index_persist_interval` seconds (see `commit_batch`); after a crash, indexes
+                out of step with the collection are rebuilt from it.
+        '''
+        if persist_indexes:
+            self._flush_provenance()
+        self.persist()
+        if persist_indexes:
+            keyword_index = self._bm25 or chroma_pool.get_shared(("bm25", self.collection_name), store=self._held)
+            if keyword_index is not None:
+                keyword_index.persist()
+            dedup_index = self._dedup or chroma_pool.get_shared(("dedup", self.collection_name), store=self._held)
+            if dedup_index is not None:
+                dedup_index.persist()
+            self._indexes_persisted_at = time.monotonic()
+        collection_versions.bump(self.collection_key)
+
+    def commit_batch(self):
+        '''
+        Commits one batch of a bulk ingestion. The collection is flushed every time, provenance and
+        the keyword and dedup indexes every `index_persist_interval` seconds; call `commit` at the end.
+        '''
+        self.commit(persist_indexes=time.monotonic() - self._indexes_persisted_at >= self.index_persist_interval)
+
+    def query_cache_stats(self):
+        '''
+        Returns hit-rate statistics of the query cache, or None without one.
+        '''
+        return self.query_cache.stats() if self.query_cache is not None else None
+
+    def persist(self):
+        '''
+        Flushes the collection to disk. Chroma persists on every write, the local index on demand.
+        '''
+        if self.backend == "local":
+            self.collection.persist()
+
 
-    def query_similar_texts(self, query_text, n_results=1):
+    def query_similar_texts(self, query_text, n_results=1, where=None):
         '''
         Query the collection for similar texts using the generated embeddings.
         '''
+        return self.query_similar_batch([query_text], n_results=n_results, where=where)
+
+    def query_similar_batch(self, queries, n_results=1, where=None):
+        '''
+        Query the collection for many query texts at once.
+        All queries are embedded in one batched call and searched in a single vectorized query.
+        With a query cache, only the queries without a valid cached result are embedded and searched.
+
+        Args:
+            queries (list[str]): The query texts.
+            n_results (int): Number of results per query.
+            where (dict, optional): Metadata filter applied to every query.
+
+        Returns:
+            list[list[str]]: The similar documents of each query, aligned with `queries`.
+        '''
+        if not queries:
+            return []
         try:
-            query_text, query_embeddings = self.generate_embeddings([query_text])
-            results = self.collection.query(
-                query_embeddings=query_embeddings[0],  # Assuming the first (and only) embedding
-                n_results=n_results
-            )
-            return results['documents']
+            documents = [None] * len(queries)
+            pending = list(range(len(queries)))
+            keys = None
+            version = collection_versions.get(self.collection_key)
+            if self.query_cache is not None:
+                keys = [self.query_cache.make_key(self.collection_key, query, n_results, where) for query in queries]
+                pending = []
+                for i, key in enumerate(keys):
+                    cached = self.query_cache.get(key)
+                    if cached is None:
+                        pending.append(i)
+                    else:
+                        documents[i] = cached
+
+            if pending:
+                _, query_embeddings = self.generate_embeddings([queries[i] for i in pending])
+                results = self.collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=n_results,
+                    where=where
+                )
+                for i, docs in zip(pending, results['documents']):
+                    documents[i] = docs
+                    if keys is not None:
+                        self.query_cache.put(keys[i], docs, version=version)
+            return documents
         except Exception as e:
             print(f"An error occurred: {e}")
             return None  # Or appropriate error handling/return
@@ -124,6 +559,10 @@ class ChromaManager:
         Query the collection for similar texts using the generated embeddings.
         '''
         try:
+            if self.backend == "local":
+                # The pooled local index is shared between managers and has no embedding function
+                _, query_embeddings = self.generate_embeddings([query_text])
+                return self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
             results = self.collection.query(
                 query_texts=[query_text],  # Assuming the first (and only) embedding
                 n_results=n_results
@@ -132,35 +571,166 @@ class ChromaManager:
         except Exception as e:
             print(f"An error occurred: {e}")
             return None  # Or appropriate error handling/return
-        
-        
 
-    def update_the_collection(self, collection_name):
-        """
-        Updates the current collection to a new collection.
+    def hybrid_query(self, query_text, n_results=5, where=None, dense_weight=1.0, sparse_weight=1.0,
+                     rrf_k=60, candidates=None):
+        '''
+        Hybrid retrieval: the vector search and a BM25 keyword search run concurrently and their
+        rankings are merged with weighted reciprocal rank fusion, score = sum(weight / (rrf_k + rank)).
+        Keyword search recovers exact matches such as model numbers and product names that
+        embeddings tend to blur.
 
         Args:
-            collection_name (str): The name of the new collection to switch to.
-        """
-        self.collection_name = collection_name
-        self.persist_directory = self._get_persist_directory(collection_name)
-        self.collection = self.vector_client.get_or_create_collection(name=self.collection_name)
-        print(f"=====> Updated to new collection: {self.collection_name}")
-        print(f"=====> Persist directory updated to: {self.persist_directory}")
+            query_text (str): The query.
+            n_results (int): Number of fused results.
+            where (dict, optional): Metadata filter applied to both searches.
+            dense_weight (float): Weight of the vector ranking.
+            sparse_weight (float): Weight of the keyword ranking.
+            rrf_k (int): Rank offset of reciprocal rank fusion; larger values flatten the rankings.
+            candidates (int, optional): Results taken from each search before fusion,
+                by default max(4 * n_results, 20).
 
+        Returns:
+            dict: "ids", "documents", "metadatas" and fused "scores", best first.
+        '''
+        candidates = candidates or max(4 * n_results, 20)
+        key = version = None
+        if self.query_cache is not None:
+            version = collection_versions.get(self.collection_key)
+            key = self.query_cache.make_key(
+                self.collection_key, query_text, n_results,
+                {"hybrid": [dense_weight, sparse_weight, rrf_k, candidates], "where": where}
+            )
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            keyword_index = self._keyword_index()
+            executor = chroma_pool.shared(("executor", "hybrid"), lambda: ThreadPoolExecutor(max_workers=8))
+            dense_future = executor.submit(self._dense_search, query_text, candidates, where)
+            sparse_future = executor.submit(self._sparse_search, keyword_index, query_text, candidates, where)
+            dense, sparse = dense_future.result(), sparse_future.result()
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+
+        scores = {}
+        for weight, ranking in ((dense_weight, dense["ids"]), (sparse_weight, sparse)):
+            for rank, doc_id in enumerate(ranking, 1):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight / (rrf_k + rank)
+        fused = sorted(scores, key=scores.get, reverse=True)[:n_results]
+
+        records = {doc_id: (document, metadata) for doc_id, document, metadata
+                   in zip(dense["ids"], dense["documents"], dense["metadatas"])}
+        missing = [doc_id for doc_id in fused if doc_id not in records]
+        if missing:
+            result = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            records.update(zip(result["ids"], zip(result["documents"], result["metadatas"])))
+        fused = [doc_id for doc_id in fused if doc_id in records]
+        result = {
+            "ids": fused,
+            "documents": [records[doc_id][0] for doc_id in fused],
+            "metadatas": [records[doc_id][1] for doc_id in fused],
+            "scores": [scores[doc_id] for doc_id in fused],
+        }
+        if key is not None:
+            self.query_cache.put(key, result, version=version)
+        return result
+
+    def _dense_search(self, query_text, n_results, where):
+        '''
+        Vector search returning the ranked ids with their documents and metadatas.
+        '''
+        n_results = min(n_results, self.collection.count())
+        if n_results == 0:
+            return {"ids": [], "documents": [], "metadatas": []}
+        _, query_embeddings = self.generate_embeddings([query_text])
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas"]
+        )
+        return {"ids": results["ids"][0], "documents": results["documents"][0], "metadatas": results["metadatas"][0]}
 
+    def _sparse_search(self, keyword_index, query_text, n_results, where):
+        '''
+        BM25 search returning ranked ids. The keyword index holds no metadata, so with a filter
+        the search is restricted to the IDs the collection matches.
+        '''
+        if where is None:
+            return [doc_id for doc_id, _ in keyword_index.search(query_text, n_results)]
+        allowed = self.collection.get(where=where, include=[])["ids"]
+        if not allowed:
+            return []
+        return [doc_id for doc_id, _ in keyword_index.search(query_text, n_results, allowed=allowed)]
+
+    def _keyword_index(self):
+        '''
+        Returns the BM25 index of the current collection, shared by all managers of the collection.
+        It is loaded from the persist directory and rebuilt from the stored documents when it is
+        missing or out of step with the collection, i.e. its version is not the collection's write
+        count, e.g. after writes made without a keyword index or not persisted before a crash.
+        '''
+        if self._bm25 is not None:
+            return self._bm25
+        path = os.path.join(self.persist_directory, f"{self.collection_name}.bm25")
+
+        def load():
+            index = BM25Index.open(path)
+            count = self.collection.count()
+            writes = self._write_count()
+            if len(index) != count or index.version != writes:
+                print(f"=====> Building keyword index for {self.collection_name} ({count} documents)")
+                index = BM25Index(path)
+                for offset in range(0, count, self.write_batch_size):
+                    page = self.collection.get(limit=self.write_batch_size, offset=offset, include=["documents"])
+                    index.add(page["ids"], page["documents"])
+                index.version = writes
+                index.persist()
+            return index
+
+        self._bm25 = chroma_pool.shared(("bm25", self.collection_name), load, store=self._held)
+        self.keyword_index = True
+        return self._bm25
+
+    def _dedup_index(self):
+        '''
+        Returns the near-duplicate index of the current collection, shared by all managers of the
+        collection, loaded from the persist directory or rebuilt from the stored documents.
+        '''
+        if self._dedup is not None:
+            return self._dedup
+        path = os.path.join(self.persist_directory, f"{self.collection_name}.dedup")
+
+        def load():
+            index = NearDuplicateIndex.open(path, threshold=self.dedup_threshold)
+            count = self.collection.count()
+            if len(index) != count:
+                print(f"=====> Building dedup index for {self.collection_name} ({count} documents)")
+                index = NearDuplicateIndex(self.dedup_threshold, path=path)
+                for offset in range(0, count, self.write_batch_size):
+                    page = self.collection.get(limit=self.write_batch_size, offset=offset, include=["documents"])
+                    for doc_id, document in zip(page["ids"], page["documents"]):
+                        index.add(doc_id, document or "")
+                index.persist()
+            return index
+
+        self._dedup = chroma_pool.shared(("dedup", self.collection_name), load, store=self._held)
+        self.dedup = True
+        return self._dedup
 
     def update_the_collection(self, collection_name):
         """
         Updates the current collection to a new collection.
+        Clients and collections come from the process-wide pool, so switching back and forth is cheap.
 
         Args:
             collection_name (str): The name of the new collection to switch to.
         """
         self.collection_name = collection_name
         self.persist_directory = self._get_persist_directory(collection_name)
-        self.vector_client = self._initialize_client(self.persist_directory)  # Reinitialize client for new directory
-        self.collection = self.vector_client.get_or_create_collection(name=self.collection_name)
+        self._open_collection()
         print(f"=====> Updated to new collection: {self.collection_name}")
         print(f"=====> Persist directory updated to: {self.persist_directory}")
 
@@ -169,14 +739,30 @@ class ChromaManager:
         Initializes storage directories and vector client for managing embeddings.
         """
         self.persist_directory = os.path.join(os.getcwd(), 'knowledgebase', f'storage_{self.collection_name}')
-        self.vector_client = chromadb.PersistentClient(path=self.persist_directory)
-        self.collection = self.vector_client.get_or_create_collection(name=self.collection_name)
+        self._open_collection()
         print(f"=====> Persist directory set up at: {self.persist_directory}")
 
+    def _open_collection(self):
+        """
+        Opens (or creates) the current collection in the current persist directory on the configured backend.
+        """
+        self.close()
+        if self.backend == "local":
+            self.vector_client = None
+            self.collection = chroma_pool.acquire_local_index(
+                self.persist_directory,
+                self.collection_name,
+                **self.index_params
+            )
+        else:
+            self.vector_client = self._initialize_client(self.persist_directory)
+            self.collection = chroma_pool.acquire_collection(self.persist_directory, self.collection_name)
+        self._held = (self.backend, self.persist_directory)
+
 
     def _initialize_client(self, persist_directory):
         """
-        Initializes the PersistentClient for the given directory.
+        Returns the pooled PersistentClient for the given directory, creating it on first use.
 
         Args:
             persist_directory (str): The directory to store embeddings.
@@ -184,7 +770,7 @@ class ChromaManager:
         Returns:
             PersistentClient: An instance of the PersistentClient.
         """
-        return chromadb.PersistentClient(path=persist_directory)
+        return chroma_pool.get_client(persist_directory)
     
 
 
@@ -232,7 +818,7 @@ class ChromaManager:
                 ingredients_embedding = self.generate_embeddings([ingredients])[1][0]
 
                 # Store embeddings in the collection
-                self.collection.add(
+                self.upsert_records(
                     documents=[recipe_name, steps, ingredients],
                     embeddings=[name_embedding, steps_embedding, ingredients_embedding],
                     metadatas=[
@@ -249,10 +835,85 @@ class ChromaManager:
         except Exception as e:
             print(f"Error processing JSON file: {str(e)}")
 
+        self.commit()
         print(f"Total recipes processed: {processed_recipes}")
         return processed_recipes
 
-    
+    def process_recipe_json_bulk(self, json_file_path, recipes_per_batch=500, resume=True):
+        """
+        Bulk variant of `process_recipe_json` for large catalogs.
 
+        The JSON file is parsed incrementally, the name/steps/ingredients texts of many recipes are
+        embedded together in large concurrent batches, and each batch is written to the collection
+        with one upsert while the next one is being embedded. Progress is checkpointed after every
+        written batch, so a restarted run resumes after the last stored recipe.
 
+        Args:
+            json_file_path (str): Path to the JSON file containing recipe data.
+            recipes_per_batch (int): Recipes embedded and written together.
+            resume (bool): Continue from the checkpoint of a previous run of the same file.
 
+        Returns:
+            dict: Recipes processed, resumed and skipped as malformed, elapsed seconds and
+                throughput in recipes/s.
+        """
+        source = os.path.abspath(json_file_path)
+        checkpoint = IngestCheckpoint(os.path.join(self.persist_directory, "recipes_checkpoint.json"))
+        if not resume:
+            checkpoint.reset()
+
+        skipped = []
+
+        def records():
+            for ordinal, (recipe_name, recipe_data) in enumerate(iter_json_object_items(json_file_path), 1):
+                try:
+                    steps = ' '.join(recipe_data['steps'])
+                    ingredients = ' '.join(recipe_data['ingredients'])
+                    if not steps.strip() or not ingredients.strip():
+                        raise ValueError("empty steps or ingredients")
+                except (KeyError, TypeError, ValueError) as e:
+                    # One malformed recipe must not abort the run; ones before the checkpoint were reported already
+                    if ordinal > checkpoint.get(source):
+                        skipped.append(recipe_name)
+                        print(f"Skipping malformed recipe {recipe_name}: {e!r}")
+                    continue
+                # All three records of a recipe share its ordinal, which is what the checkpoint tracks
+                for kind, text in (("name", recipe_name), ("steps", steps), ("ingredients", ingredients)):
+                    doc_type = "recipe_name" if kind == "name" else kind
+                    yield Record(source, ordinal, text,
+                                 {"id": f"{recipe_name}_{kind}", "type": doc_type, "recipe": recipe_name})
+
+        progress = {"recipes": 0, "start": time.perf_counter()}
+
+        def write(batch, embeddings):
+            self.upsert_records(
+                ids=[record.metadata["id"] for record in batch],
+                documents=[record.text for record in batch],
+                embeddings=embeddings,
+                metadatas=[{"type": record.metadata["type"], "recipe": record.metadata["recipe"]}
+                           for record in batch]
+            )
+            self.commit_batch()
+            progress["recipes"] += len(batch) // 3
+            elapsed = time.perf_counter() - progress["start"]
+            print(f"=====> Stored {progress['recipes']} recipes ({progress['recipes'] / elapsed:.1f} recipes/s)")
+
+        pipeline = StreamingPipeline(
+            embed_fn=lambda texts: self.generate_embeddings(texts)[1],
+            write_fn=write,
+            batch_size=recipes_per_batch * 3,  # whole recipes per batch keeps the checkpoint exact
+            checkpoint=checkpoint,
+        )
+        try:
+            stats = pipeline.run(records())
+        finally:
+            self.commit()
+        report = {
+            "recipes": progress["recipes"],
+            "resumed": stats["resumed"] // 3,
+            "skipped": len(skipped),
+            "seconds": stats["seconds"],
+            "recipes_per_second": progress["recipes"] / stats["seconds"] if stats["seconds"] else 0.0,
+        }
+        print(f"Total recipes processed: {report}")
+        return report
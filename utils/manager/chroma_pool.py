@@ -0,0 +1,179 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 17:30
+# Author:david yuan
+# @File:chroma_pool.py
+# @Software:VeSync
+
+'''
+Process-wide registry of vector store handles.
+
+PersistentClients are cached by directory and collections by (directory, name),
+opened lazily and shared by every ChromaManager in the process. Clients that
+no manager holds are closed least-recently-used first once more than
+`max_clients` are open, which releases their SQLite handles. Objects attached
+to a store, such as its keyword and dedup indexes, are persisted and dropped
+along with it.
+'''
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import chromadb
+
+from vagents.manager.vector_index import LocalVectorIndex
+
+
+class _Entry:
+    def __init__(self, handle: Any):
+        self.handle = handle
+        self.refs = 0
+        self.collections: Dict[str, Any] = {}
+        self.shared: Dict[Any, Any] = {}  # Objects attached to this store, see `ChromaClientPool.shared`
+
+
+class ChromaClientPool:
+    """
+    LRU pool of PersistentClients, their collections, and LocalVectorIndex instances.
+
+    :param max_clients: Number of open stores above which unreferenced ones are closed.
+    """
+
+    def __init__(self, max_clients: int = 32):
+        self.max_clients = max_clients
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._shared: Dict[Any, Any] = {}
+        self._lock = threading.RLock()
+        self.opened = 0
+        self.closed = 0
+
+    def acquire_collection(self, persist_directory: str, name: str) -> Any:
+        """Returns the (cached) Chroma collection and holds a reference to its client until `release`."""
+        with self._lock:
+            entry = self._entry(("chroma", persist_directory), lambda: chromadb.PersistentClient(path=persist_directory))
+            collection = entry.collections.get(name)
+            if collection is None:
+                collection = entry.handle.get_or_create_collection(name=name)
+                entry.collections[name] = collection
+            entry.refs += 1
+            self._evict(keep=("chroma", persist_directory))
+            return collection
+
+    def acquire_local_index(self, persist_directory: str, name: str, **kwargs) -> LocalVectorIndex:
+        """
+        Returns the (cached) LocalVectorIndex of a directory and holds a reference until `release`.
+
+        The index is shared, so `kwargs` must not hold per-caller state such as an embedding function,
+        and raise ValueError when they conflict with the settings of the already open index.
+        """
+        with self._lock:
+            entry = self._entry(("local", persist_directory),
+                                lambda: LocalVectorIndex.open(name, persist_directory, **kwargs))
+            conflicts = {key: getattr(entry.handle, key, None) for key, value in kwargs.items()
+                         if value is not None and getattr(entry.handle, key, None) != value}
+            if conflicts:
+                raise ValueError(f"Index {persist_directory} is already open with {conflicts}, not {kwargs}")
+            entry.refs += 1
+            self._evict(keep=("local", persist_directory))
+            return entry.handle
+
+    def get_client(self, persist_directory: str) -> Any:
+        """Returns the cached PersistentClient of a directory without holding a reference."""
+        with self._lock:
+            entry = self._entry(("chroma", persist_directory),
+                                lambda: chromadb.PersistentClient(path=persist_directory))
+            self._evict(keep=("chroma", persist_directory))
+            return entry.handle
+
+    def release(self, backend: str, persist_directory: str) -> None:
+        """Drops one reference taken by `acquire_*`; unreferenced stores become eligible for closing."""
+        with self._lock:
+            entry = self._entries.get((backend, persist_directory))
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+            self._evict()
+
+    def shared(self, key: Any, factory: Callable[[], Any], store: Optional[Tuple[str, str]] = None) -> Any:
+        """
+        Returns the object for `key`, creating it once.
+
+        :param store: (backend, persist_directory) of an acquired store the object belongs to, e.g. the
+                      keyword index of one of its collections. It is persisted and dropped when the store
+                      is closed. Without it the object lives as long as the process, e.g. a thread pool,
+                      so only a fixed set of keys should be used.
+        """
+        with self._lock:
+            objects = self._entries[store].shared if store is not None else self._shared
+            if key not in objects:
+                objects[key] = factory()
+            return objects[key]
+
+    def get_shared(self, key: Any, store: Optional[Tuple[str, str]] = None) -> Optional[Any]:
+        """Returns the object for `key` (attached to `store`) if it was created, else None."""
+        with self._lock:
+            if store is None:
+                return self._shared.get(key)
+            entry = self._entries.get(store)
+            return entry.shared.get(key) if entry is not None else None
+
+    def _entry(self, key: Tuple[str, str], factory: Callable[[], Any]) -> _Entry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(factory())
+            self._entries[key] = entry
+            self.opened += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self, keep: Optional[Tuple[str, str]] = None) -> None:
+        if len(self._entries) <= self.max_clients:
+            return
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_clients:
+                break
+            entry = self._entries[key]
+            if entry.refs == 0 and key != keep:
+                del self._entries[key]
+                self._close(key, entry)
+
+    def _close(self, key: Tuple[str, str], entry: _Entry) -> None:
+        backend, persist_directory = key
+        self.closed += 1
+        for name, obj in entry.shared.items():
+            if hasattr(obj, "persist"):
+                try:
+                    obj.persist()
+                except Exception as e:
+                    print(f"Failed to persist {name} of {persist_directory}: {e}")
+        entry.shared.clear()
+        if backend == "local":
+            entry.handle.persist()
+            return
+        try:
+            try:
+                from chromadb.api.shared_system_client import SharedSystemClient
+            except ImportError:
+                from chromadb.api.client import SharedSystemClient
+            # PersistentClients of one path share a System; stopping it closes the SQLite connection
+            system = SharedSystemClient._identifier_to_system.pop(persist_directory, None)
+            if system is not None:
+                system.stop()
+        except Exception as e:
+            print(f"Failed to close vector client for {persist_directory}: {e}")
+
+    def close_all(self) -> None:
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                self._close(key, entry)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            return {
+                "open": len(self._entries),
+                "in_use": sum(1 for entry in self._entries.values() if entry.refs),
+                "opened": self.opened,
+                "closed": self.closed,
+            }
+
+
+chroma_pool = ChromaClientPool()
@@ -0,0 +1,252 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 21:10
+# Author:david yuan
+# @File:dedup.py
+# @Software:VeSync
+
+'''
+Exact and near-duplicate detection for text chunks and pages.
+
+Exact duplicates are found by a hash of the normalized text. Near duplicates
+are found with MinHash signatures over character shingles, bucketed by LSH
+bands, so each lookup only compares against the few candidates sharing a band
+instead of every stored text. Merged duplicates are remembered per kept key
+as provenance.
+'''
+import hashlib
+import os
+import pickle
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHIFT = np.uint64(32)
+_trapezoid = getattr(np, "trapezoid", None) or np.trapz  # renamed in NumPy 2.0
+
+
+def normalize_text(text: str) -> str:
+    """Folds width and case and collapses whitespace, so formatting differences do not matter."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text).lower()).strip()
+
+
+def shingle_hashes(text: str, size: int = 5) -> np.ndarray:
+    """32-bit hashes of the distinct character shingles of the normalized text."""
+    text = normalize_text(text)
+    if len(text) <= size:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64,
+                       count=len(shingles))
+
+
+class MinHasher:
+    """
+    MinHash signatures estimating the Jaccard similarity of shingle sets.
+
+    :param num_perm: Hash permutations, i.e. signature length.
+    :param shingle_size: Characters per shingle; works for Chinese and English alike.
+    :param seed: Seed of the permutations; signatures are only comparable with the same seed.
+    """
+
+    chunk_rows = 4096  # Shingles hashed per step, bounds temporary memory
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # Multiply-shift hashing: (a * h + b) mod 2^64, keeping the high 32 bits; a must be odd
+        self._a = rng.randint(0, 1 << 63, size=num_perm, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text, self.shingle_size)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(hashes), self.chunk_rows):
+            block = hashes[start:start + self.chunk_rows, None]
+            permuted = (block * self._a + self._b) >> _SHIFT
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+
+def _lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) minimizing the false positive plus false negative probability mass around `threshold`."""
+    similarities = np.linspace(0.0, 1.0, 201)
+    best, best_error = (num_perm, 1), float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        probability = 1 - (1 - similarities ** rows) ** bands
+        below = similarities < threshold
+        false_positive = _trapezoid(probability[below], similarities[below])
+        false_negative = _trapezoid(1 - probability[~below], similarities[~below])
+        if false_positive + false_negative < best_error:
+            best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    Index of texts for exact and near-duplicate lookups.
+
+    :param threshold: Estimated Jaccard similarity of shingle sets above which two texts are duplicates.
+    :param num_perm: MinHash signature length; more is more accurate and slower.
+    :param shingle_size: Characters per shingle.
+    :param path: Pickle file the index is persisted to, None keeps it in memory.
+    """
+
+    max_provenance = 1000  # Merged duplicates remembered per kept key
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5,
+                 path: Optional[str] = None):
+        self.threshold = threshold
+        self.path = path
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = _lsh_params(threshold, num_perm)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._digests: Dict[str, str] = {}
+        self._by_digest: Dict[str, str] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(self.bands)]
+        self._merged: Dict[str, Dict[str, Optional[str]]] = {}
+        self._lock = threading.RLock()
+        self._dirty = False
+        self.checked = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, text: str, signature: Optional[np.ndarray] = None) -> None:
+        """Indexes a text under `key`; a key that is already indexed is left as is."""
+        with self._lock:
+            if key in self._signatures:
+                return
+            signature = self.hasher.signature(text) if signature is None else signature
+            digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+            self._signatures[key] = signature
+            self._digests[key] = digest
+            self._by_digest.setdefault(digest, key)
+            for band, band_key in self._band_keys(signature):
+                self._buckets[band].setdefault(band_key, set()).add(key)
+            self._dirty = True
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                return
+            digest = self._digests.pop(key)
+            if self._by_digest.get(digest) == key:
+                del self._by_digest[digest]
+            for band, band_key in self._band_keys(signature):
+                bucket = self._buckets[band].get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band][band_key]
+            self._merged.pop(key, None)
+            self._dirty = True
+
+    def query(self, text: str, signature: Optional[np.ndarray] = None) -> Optional[Tuple[str, float]]:
+        """Returns (key, estimated similarity) of the most similar indexed duplicate of `text`, or None."""
+        with self._lock:
+            digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+            if digest in self._by_digest:
+                return self._by_digest[digest], 1.0
+            signature = self.hasher.signature(text) if signature is None else signature
+            candidates: Set[str] = set()
+            for band, band_key in self._band_keys(signature):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            best = None
+            for candidate in candidates:
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (candidate, similarity)
+            return best
+
+    def check(self, key: str, text: str, source: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the key `text` duplicates, recording it as merged into that key, or indexes
+        `text` under `key` and returns None if it is new. A key that is already indexed is not
+        a duplicate of itself.
+        """
+        with self._lock:
+            self.checked += 1
+            if key in self._signatures:
+                return None
+            signature = self.hasher.signature(text)
+            match = self.query(text, signature)
+            if match is None:
+                self.add(key, text, signature)
+                return None
+            kept, similarity = match
+            if similarity == 1.0:
+                self.exact_duplicates += 1
+            else:
+                self.near_duplicates += 1
+            merged = self._merged.setdefault(kept, {})
+            if key not in merged and len(merged) < self.max_provenance:
+                merged[key] = source
+                self._dirty = True
+            return kept
+
+    def provenance(self, key: str) -> Dict[str, Optional[str]]:
+        """Keys and sources of the duplicates merged into `key`."""
+        with self._lock:
+            return dict(self._merged.get(key, {}))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "exact_duplicates": self.exact_duplicates,
+                "near_duplicates": self.near_duplicates,
+                "indexed": len(self._signatures),
+            }
+
+    def persist(self) -> None:
+        """Writes the index to `path` if it changed since the last persist."""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"threshold": self.threshold, "num_perm": self.hasher.num_perm,
+                             "shingle_size": self.hasher.shingle_size, "signatures": self._signatures,
+                             "digests": self._digests, "merged": self._merged}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    @classmethod
+    def open(cls, path: str, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5
+             ) -> "NearDuplicateIndex":
+        """Loads the index persisted at `path` if it was built with the same settings, or returns an empty one."""
+        index = cls(threshold, num_perm, shingle_size, path=path)
+        if not os.path.exists(path):
+            return index
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if (state["threshold"], state["num_perm"], state["shingle_size"]) != (threshold, num_perm, shingle_size):
+            return index
+        for key, signature in state["signatures"].items():
+            index._signatures[key] = signature
+            index._digests[key] = state["digests"][key]
+            index._by_digest.setdefault(state["digests"][key], key)
+            for band, band_key in index._band_keys(signature):
+                index._buckets[band].setdefault(band_key, set()).add(key)
+        index._merged = state["merged"]
+        return index
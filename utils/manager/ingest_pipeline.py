@@ -0,0 +1,266 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 14:10
+# Author:david yuan
+# @File:ingest_pipeline.py
+# @Software:VeSync
+
+'''
+Streaming ingestion: read -> batch -> embed -> write.
+
+The stages run in their own threads and are connected by bounded queues, so
+memory stays flat regardless of corpus size and embedding overlaps with
+writes. Batches are committed in order and each committed batch advances a
+per-source checkpoint, so a crashed run resumes after the last written record.
+'''
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class Record(NamedTuple):
+    source: str  # e.g. file name, the checkpoint is tracked per source
+    offset: int  # position within the source, increasing
+    text: str
+    metadata: Dict[str, Any]
+
+
+class IngestCheckpoint:
+    """
+    Per-source offsets of the last committed record, persisted as JSON.
+
+    :param path: JSON file holding the checkpoint.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.offsets = json.load(f)
+
+    def get(self, source: str) -> int:
+        return self.offsets.get(source, 0)
+
+    def update(self, offsets: Dict[str, int]) -> None:
+        """Advances the given sources and writes the file atomically."""
+        for source, offset in offsets.items():
+            self.offsets[source] = max(offset, self.offsets.get(source, 0))
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.offsets, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset(self) -> None:
+        self.offsets = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def iter_json_object_items(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, Any]]:
+    """
+    Yields the (key, value) pairs of a top-level JSON object without loading the whole file.
+
+    Uses ijson when it is installed, otherwise decodes one value at a time from a sliding buffer.
+    """
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.kvitems(f, "", use_float=True)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer, pos, eof = "", 0, False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip(chars: str) -> None:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in chars:
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return
+
+        def decode() -> Any:
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number at the end of the buffer may continue in the next chunk
+                    if end == len(buffer) and not eof and fill():
+                        continue
+                    pos = end
+                    return value
+                except json.JSONDecodeError:
+                    if eof or not fill():
+                        raise
+
+        skip(" \t\r\n\ufeff")
+        if pos >= len(buffer) or buffer[pos] != "{":
+            raise ValueError(f"{path} does not contain a JSON object")
+        pos += 1
+        while True:
+            skip(" \t\r\n,")
+            if pos >= len(buffer):
+                raise ValueError(f"Unexpected end of {path}")
+            if buffer[pos] == "}":
+                return
+            key = decode()
+            skip(" \t\r\n")
+            if pos >= len(buffer) or buffer[pos] != ":":
+                raise ValueError(f"Expected ':' after key {key!r} in {path}")
+            pos += 1
+            skip(" \t\r\n")
+            yield key, decode()
+
+
+_DONE = object()
+
+
+class StreamingPipeline:
+    """
+    Runs records through embed and write stages connected by bounded queues.
+
+    :param embed_fn: Takes a list of texts and returns one embedding per text; None when `write_fn`
+        embeds itself, e.g. with the collection's own embedding function.
+    :param write_fn: Takes (records, embeddings) and persists them; embeddings are None without `embed_fn`.
+    :param batch_size: Records per batch.
+    :param queue_size: Batches buffered between two stages; bounds memory.
+    :param checkpoint: Checkpoint advanced after each written batch.
+    :param filter_fn: Optional stage between batching and embedding, returns the records to keep.
+    """
+
+    def __init__(
+            self,
+            embed_fn: Optional[Callable[[List[str]], List[List[float]]]],
+            write_fn: Callable[[List[Record], Optional[List[List[float]]]], None],
+            batch_size: int = 100,
+            queue_size: int = 4,
+            checkpoint: Optional[IngestCheckpoint] = None,
+            filter_fn: Optional[Callable[[List[Record]], List[Record]]] = None,
+    ):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.checkpoint = checkpoint
+        self.filter_fn = filter_fn
+
+    def run(self, records: Iterable[Record]) -> Dict[str, Any]:
+        """
+        Consumes `records` and returns run statistics.
+
+        Records at or before their source's checkpoint offset are skipped.
+        Any stage error stops the pipeline and is re-raised here.
+        """
+        embed_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        write_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        stats = {"read": 0, "resumed": 0, "filtered": 0, "written": 0, "batches": 0}
+
+        def embed_stage():
+            try:
+                while True:
+                    batch = embed_queue.get()
+                    if batch is _DONE or stop.is_set():
+                        break
+                    kept = self.filter_fn(batch) if self.filter_fn else batch
+                    stats["filtered"] += len(batch) - len(kept)
+                    embeddings = None
+                    if kept and self.embed_fn is not None:
+                        embeddings = self.embed_fn([record.text for record in kept])
+                    self._put(write_queue, (batch, kept, embeddings), stop)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                self._put(write_queue, _DONE, stop, force=True)
+
+        def write_stage():
+            try:
+                while True:
+                    item = write_queue.get()
+                    if item is _DONE:
+                        break
+                    batch, kept, embeddings = item
+                    if kept:
+                        self.write_fn(kept, embeddings)
+                    stats["written"] += len(kept)
+                    stats["batches"] += 1
+                    if self.checkpoint is not None:
+                        offsets: Dict[str, int] = {}
+                        for record in batch:
+                            offsets[record.source] = max(record.offset, offsets.get(record.source, 0))
+                        self.checkpoint.update(offsets)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                # Keep draining so the embed stage never blocks on a full queue
+                while write_queue.get() is not _DONE:
+                    pass
+
+        workers = [threading.Thread(target=embed_stage, daemon=True),
+                   threading.Thread(target=write_stage, daemon=True)]
+        for worker in workers:
+            worker.start()
+
+        start = time.perf_counter()
+        batch: List[Record] = []
+        try:
+            for record in records:
+                if stop.is_set():
+                    break
+                stats["read"] += 1
+                if self.checkpoint is not None and record.offset <= self.checkpoint.get(record.source):
+                    stats["resumed"] += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._put(embed_queue, batch, stop)
+                    batch = []
+            if batch and not stop.is_set():
+                self._put(embed_queue, batch, stop)
+        finally:
+            self._put(embed_queue, _DONE, stop, force=True)
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise errors[0]
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+    @staticmethod
+    def _put(q: "queue.Queue", item: Any, stop: threading.Event, force: bool = False) -> None:
+        """Blocking put that gives up once the pipeline is stopping, unless `force` is set."""
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if stop.is_set() and not force:
+                    return
+                if stop.is_set():
+                    # Make room for the sentinel, the pending batches are being abandoned anyway
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
@@ -0,0 +1,282 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 19:40
+# Author:david yuan
+# @File:quantization.py
+# @Software:VeSync
+
+'''
+Compact vector codes for the first pass of a similarity search.
+
+"int8" keeps one byte per dimension (4x smaller than float32), "binary" one
+bit per dimension (32x smaller) and "matryoshka" the renormalized first
+`coarse_dimensions` values of embeddings trained with Matryoshka
+representation learning, such as text-embedding-3-*. All of them approximate
+inner products, so the best candidates are rescored against the
+full-precision vectors afterwards.
+'''
+from typing import Dict, Optional, Type
+
+import numpy as np
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def truncate(vectors, dimensions: int) -> np.ndarray:
+    """Keeps the first `dimensions` values of each vector and renormalizes them to unit length."""
+    vectors = np.array(np.asarray(vectors, dtype=np.float32)[..., :dimensions], ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    """Number of set bits in each row of a uint8 matrix."""
+    if hasattr(np, "bitwise_count"):
+        if bits.shape[1] % 8 == 0 and bits.flags.c_contiguous:
+            bits = bits.view(np.uint64)
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT8[bits].sum(axis=1, dtype=np.int32)
+
+
+class Quantizer:
+    """
+    Base class of the quantizers: `train` on sample vectors, `encode` vectors to codes and
+    compute approximate inner-product `scores` of float queries against codes.
+    """
+
+    kind = ""
+    dtype = np.uint8
+    default_rescore = 4  # Candidates rescored at full precision per requested result
+    chunk_rows = 4_096  # Codes decoded per step, keeps the temporaries cache-sized
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def code_width(self) -> int:
+        """Code values per vector."""
+        raise NotImplementedError
+
+    def train(self, vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def state(self) -> Dict[str, np.ndarray]:
+        raise NotImplementedError
+
+    @classmethod
+    def from_state(cls, dimensions: int, state: Dict[str, np.ndarray]) -> "Quantizer":
+        quantizer = cls(dimensions)
+        for key, value in state.items():
+            setattr(quantizer, key, np.asarray(value, dtype=np.float32))
+        return quantizer
+
+
+class ScalarQuantizer(Quantizer):
+    """
+    int8 scalar quantization with a per-dimension offset and scale:
+    v ~ offset + scale * code, so q.v ~ q.offset + (q * scale).code.
+    """
+
+    kind = "int8"
+    dtype = np.int8
+    default_rescore = 4
+
+    def __init__(self, dimensions: int):
+        super().__init__(dimensions)
+        self.offset = np.zeros(dimensions, dtype=np.float32)
+        self.scale = np.ones(dimensions, dtype=np.float32)
+
+    def code_width(self) -> int:
+        return self.dimensions
+
+    def train(self, vectors: np.ndarray) -> None:
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        self.offset = ((high + low) / 2).astype(np.float32)
+        self.scale = np.maximum((high - low) / 254, 1e-12).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scaled = queries * self.scale
+        bias = queries @ self.offset
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        buffer = np.empty((min(self.chunk_rows, len(codes)), self.dimensions), dtype=np.float32)
+        for start in range(0, len(codes), self.chunk_rows):
+            chunk = codes[start:start + self.chunk_rows]
+            decoded = buffer[:len(chunk)]
+            np.copyto(decoded, chunk, casting="unsafe")
+            scores[:, start:start + len(chunk)] = scaled @ decoded.T
+        return scores + bias[:, None]
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+
+class BinaryQuantizer(Quantizer):
+    """
+    One bit per dimension: whether the value is above the dimension's mean. Scores are
+    d - 2 * hamming(q, v), which ranks like the inner product of the centered sign vectors.
+    """
+
+    kind = "binary"
+    dtype = np.uint8
+    default_rescore = 10
+
+    def __init__(self, dimensions: int):
+        super().__init__(dimensions)
+        self.mean = np.zeros(dimensions, dtype=np.float32)
+
+    def code_width(self) -> int:
+        return (self.dimensions + 7) // 8
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.mean = vectors.mean(axis=0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(vectors, dtype=np.float32) > self.mean, axis=1)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        query_codes = self.encode(queries)
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for q, query_code in enumerate(query_codes):
+            for start in range(0, len(codes), self.chunk_rows):
+                chunk = np.bitwise_xor(codes[start:start + self.chunk_rows], query_code)
+                scores[q, start:start + len(chunk)] = self.dimensions - 2 * _popcount_rows(chunk)
+        return scores
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"mean": self.mean}
+
+
+class MatryoshkaQuantizer(Quantizer):
+    """
+    Coarse float32 vectors made of the first `coarse_dimensions` values, renormalized.
+    Only meaningful for Matryoshka embeddings, whose leading dimensions carry most of the signal.
+    """
+
+    kind = "matryoshka"
+    dtype = np.float32
+    default_rescore = 10
+
+    def __init__(self, dimensions: int, coarse_dimensions: Optional[int] = None):
+        super().__init__(dimensions)
+        self.coarse_dimensions = min(coarse_dimensions or 256, dimensions)
+
+    def code_width(self) -> int:
+        return self.coarse_dimensions
+
+    def train(self, vectors: np.ndarray) -> None:
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return truncate(vectors, self.coarse_dimensions)
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return self.encode(queries) @ codes.T
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"coarse_dimensions": np.array(self.coarse_dimensions)}
+
+    @classmethod
+    def from_state(cls, dimensions: int, state: Dict[str, np.ndarray]) -> "Quantizer":
+        return cls(dimensions, int(state["coarse_dimensions"]))
+
+
+QUANTIZERS: Dict[str, Type[Quantizer]] = {
+    ScalarQuantizer.kind: ScalarQuantizer,
+    BinaryQuantizer.kind: BinaryQuantizer,
+    MatryoshkaQuantizer.kind: MatryoshkaQuantizer,
+}
+
+
+if __name__ == '__main__':
+    # Benchmark: latency and recall@k of every first-pass mode against exact search.
+    # python quantization.py [--collection DIR] runs on the vectors of a persisted LocalVectorIndex;
+    # without it, on synthetic unit vectors whose variance decays over the dimensions like
+    # text-embedding-3-small output.
+    import argparse
+    import os
+    import tempfile
+    import time
+
+    from vagents.manager.vector_index import LocalVectorIndex
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", help="Directory of a persisted LocalVectorIndex")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    k = args.k
+    if args.collection:
+        source = LocalVectorIndex.load(args.collection)
+        vectors = np.asarray(source.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+    else:
+        n_rows, dims = 100_000, 1536
+        decay = (1.0 / np.sqrt(1.0 + np.arange(dims) / 32.0)).astype(np.float32)
+        centers = rng.standard_normal((2_000, dims)).astype(np.float32)
+        vectors = (centers[rng.integers(0, len(centers), n_rows)]
+                   + 0.8 * rng.standard_normal((n_rows, dims)).astype(np.float32)) * decay
+    n_rows, dims = vectors.shape
+    queries = vectors[rng.choice(n_rows, min(args.queries, n_rows), replace=False)]
+    queries = queries + 0.3 * np.std(vectors) * rng.standard_normal(queries.shape).astype(np.float32)
+    ids = [str(i) for i in range(n_rows)]
+
+    def run(index, batch=queries):
+        result = index.query(query_embeddings=batch, n_results=k, include=[])  # also trains the quantizer
+        # Retrieval serves one query at a time, so latency is measured unbatched
+        start = time.perf_counter()
+        for query in batch[:50]:
+            index.query(query_embeddings=query, n_results=k, include=[])
+        return result["ids"], (time.perf_counter() - start) / len(batch[:50]) * 1000
+
+    def recall(found):
+        return np.mean([len(set(a) & set(b)) / k for a, b in zip(found, truth)])
+
+    def memory_mb(index):
+        return sum(index.memory_usage().values()) / 2 ** 20
+
+    exact = LocalVectorIndex("bench")
+    exact.add(ids=ids, embeddings=vectors)
+    truth, exact_ms = run(exact)
+    print(f"{n_rows} vectors x {dims} dimensions; quantized indexes are persisted and loaded, so their")
+    print("full-precision vectors are memory-mapped and only the codes count as memory")
+    print(f"{'mode':<16}{'rescore':>8}{'bytes/vec':>11}{'memory MB':>11}{'ms/query':>10}{'recall@' + str(k):>11}")
+    print(f"{'float32':<16}{'-':>8}{dims * 4:>11}{memory_mb(exact):>11.1f}{exact_ms:>10.2f}{1.0:>11.3f}")
+
+    # Storing truncated embeddings only (ChromaManager index_dimensions), no full-precision rerank
+    for coarse in (256, 512):
+        if coarse >= dims:
+            continue
+        truncated = LocalVectorIndex("bench")
+        truncated.add(ids=ids, embeddings=truncate(vectors, coarse))
+        found, ms = run(truncated, truncate(queries, coarse))
+        print(f"{'truncate-' + str(coarse):<16}{'-':>8}{coarse * 4:>11}{memory_mb(truncated):>11.1f}"
+              f"{ms:>10.2f}{recall(found):>11.3f}")
+
+    settings = [("int8", None, (1, 4)), ("binary", None, (4, 10, 20)),
+                ("matryoshka", 128, (4, 10, 20)), ("matryoshka", 256, (4, 10)), ("matryoshka", 512, (4,))]
+    with tempfile.TemporaryDirectory() as directory:
+        for kind, coarse, rescores in settings:
+            label = kind if coarse is None else f"{kind}-{coarse}"
+            built = LocalVectorIndex("bench", os.path.join(directory, label), quantization=kind,
+                                     coarse_dimensions=coarse)
+            built.add(ids=ids, embeddings=vectors)
+            built.build_quantizer()
+            built.persist()
+            del built
+            for rescore in rescores:
+                index = LocalVectorIndex.load(os.path.join(directory, label), rescore=rescore)
+                found, ms = run(index)
+                quantizer = index._quantizer
+                code_bytes = quantizer.code_width() * np.dtype(quantizer.dtype).itemsize
+                print(f"{label:<16}{rescore:>8}{code_bytes:>11}{memory_mb(index):>11.1f}{ms:>10.2f}"
+                      f"{recall(found):>11.3f}")
+                del index
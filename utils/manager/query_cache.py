@@ -0,0 +1,129 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 16:40
+# Author:david yuan
+# @File:query_cache.py
+# @Software:VeSync
+
+'''
+Query-result cache for similarity search.
+
+Entries are keyed on (collection, normalized query, n_results, filter) and
+remember the collection version they were computed at. Every write to a
+collection bumps its version in the process-wide `collection_versions`
+registry, which invalidates all cached results of that collection.
+'''
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class CollectionVersions:
+    """Process-wide write counters, one per collection."""
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, collection: str) -> int:
+        return self._versions.get(collection, 0)
+
+    def bump(self, collection: str) -> int:
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+            return self._versions[collection]
+
+
+collection_versions = CollectionVersions()
+
+_PUNCTUATION = re.compile(r"[\s\?？!！。\.,，;；:：]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryCache:
+    """
+    LRU + TTL cache of query results with version-based invalidation.
+
+    :param max_items: Maximum number of cached queries.
+    :param ttl: Seconds a result stays valid, None for no expiry.
+    """
+
+    def __init__(self, max_items: int = 10_000, ttl: Optional[float] = 300):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Folds width/case, collapses whitespace and drops trailing punctuation."""
+        query = unicodedata.normalize("NFKC", query).lower().strip()
+        query = _WHITESPACE.sub(" ", query)
+        return _PUNCTUATION.sub("", query)
+
+    def make_key(self, collection: str, query: str, n_results: int, where: Optional[Dict[str, Any]] = None) -> Tuple:
+        filter_key = json.dumps(where, sort_keys=True, ensure_ascii=False) if where else ""
+        return collection, self.normalize_query(query), n_results, filter_key
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Returns the cached result, or None if missing, expired or computed at an older collection version."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            version, stored_at, value = entry
+            if version != collection_versions.get(key[0]):
+                del self._entries[key]
+                self.invalidated += 1
+                self.misses += 1
+                return None
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Tuple, value: Any, version: Optional[int] = None) -> None:
+        """
+        Stores a result.
+
+        :param version: Collection version the result was computed at; read it before searching
+            so a write that lands during the search invalidates the entry.
+        """
+        if version is None:
+            version = collection_versions.get(key[0])
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
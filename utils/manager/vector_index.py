@@ -0,0 +1,735 @@
+# -*- coding = utf-8 -*-
+# @time:2026/10/18 15:30
+# Author:david yuan
+# @File:vector_index.py
+# @Software:VeSync
+
+'''
+Local vector index with the same API as a Chroma collection.
+
+Vectors live in one float32 matrix that is memory-mapped from disk once the
+index was persisted or loaded; rows added later are appended to the mapped
+file, so full-precision vectors never have to fit in memory. Search is exact (NumPy brute force, block-wise) or IVF approximate
+(k-means coarse quantizer probing the `n_probe` closest lists). Queries are
+batched and `where` filters are applied before scoring.
+
+With `quantization`, the first pass scores compact codes held in memory (int8,
+binary, or the leading `coarse_dimensions` of Matryoshka embeddings) and only
+the best `rescore * n_results` candidates are rescored against the
+full-precision vectors, which stay on disk.
+'''
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from vagents.manager.quantization import QUANTIZERS, MatryoshkaQuantizer
+
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+INDEX_FILE = "index.json"
+IVF_FILE = "ivf.npz"
+CODES_FILE = "codes.bin"
+QUANTIZER_FILE = "quantizer.npz"
+
+
+def _matches(metadata: Optional[Dict[str, Any]], where: Dict[str, Any]) -> bool:
+    """Evaluates a Chroma-style `where` filter against one metadata dict."""
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > expected:
+                        return False
+                    if op == "$gte" and not value >= expected:
+                        return False
+                    if op == "$lt" and not value < expected:
+                        return False
+                    if op == "$lte" and not value <= expected:
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the column indices of the k largest scores of each row, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class LocalVectorIndex:
+    """
+    A persistent vector collection with Chroma's collection API
+    (`add`, `upsert`, `update`, `get`, `query`, `delete`, `count`) plus `persist` and `load`.
+
+    :param name: Collection name.
+    :param persist_directory: Directory holding the index files, None keeps it in memory.
+    :param metric: "cosine", "ip" or "l2", with Chroma's distance conventions.
+    :param index_type: "flat" for exact search or "ivf" for approximate search.
+    :param n_lists: Number of IVF lists, defaults to ~sqrt(N) when the index is built.
+    :param n_probe: IVF lists scanned per query.
+    :param embedding_function: Callable turning texts into vectors, needed for `query_texts`.
+    :param quantization: None, "int8", "binary" or "matryoshka" codes for the first search pass
+        ("cosine" and "ip" only).
+    :param rescore: Candidates rescored at full precision per result, defaults to the quantizer's
+        (4 for int8, 10 for binary and matryoshka). Higher values trade speed for recall.
+    :param coarse_dimensions: Leading dimensions searched in the first pass with "matryoshka", default 256.
+    """
+
+    block_rows = 131_072  # Rows scored per block in exact search, bounds temporary memory
+    ivf_min_rows = 10_000  # IVF is only used once the index has this many rows
+
+    def __init__(
+            self,
+            name: str,
+            persist_directory: Optional[str] = None,
+            metric: str = "cosine",
+            index_type: str = "flat",
+            n_lists: Optional[int] = None,
+            n_probe: int = 8,
+            embedding_function: Optional[Callable[[List[str]], Any]] = None,
+            quantization: Optional[str] = None,
+            rescore: Optional[int] = None,
+            coarse_dimensions: Optional[int] = None,
+    ):
+        if metric not in ("cosine", "ip", "l2"):
+            raise ValueError(f"Unsupported metric: {metric}")
+        if index_type not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported index type: {index_type}")
+        if quantization is not None and quantization not in QUANTIZERS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        if quantization is not None and metric == "l2":
+            raise ValueError("Quantization supports the cosine and ip metrics only")
+        self.name = name
+        self.persist_directory = persist_directory
+        self.metric = metric
+        self.index_type = index_type
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self.rescore = rescore
+        self.coarse_dimensions = coarse_dimensions
+
+        self.dimensions: Optional[int] = None
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._size = 0
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._row_of: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._lists: Optional[List[np.ndarray]] = None
+        self._quantizer = None
+        self._codes: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+        # Persistence state: rows already on disk, size of the records file, and whether
+        # rows on disk were modified since (which forces a full rewrite)
+        self._persisted_rows = 0
+        self._records_bytes = 0
+        self._dirty = False
+        self._ivf_changed = False
+        self._quantizer_changed = False
+
+    # ------------------------------------------------------------------ writes
+
+    def count(self) -> int:
+        return len(self._row_of)
+
+    def add(self, ids: Sequence[str], embeddings=None, documents=None, metadatas=None) -> None:
+        """Adds new records; IDs that already exist are ignored, as in Chroma."""
+        with self._lock:
+            keep = [i for i, doc_id in enumerate(ids) if doc_id not in self._row_of]
+            if keep:
+                self._write(ids, embeddings, documents, metadatas, keep)
+
+    def upsert(self, ids: Sequence[str], embeddings=None, documents=None, metadatas=None) -> None:
+        """Adds new records and overwrites existing ones."""
+        with self._lock:
+            self._write(ids, embeddings, documents, metadatas, range(len(ids)))
+
+    def update(self, ids: Sequence[str], embeddings=None, documents=None, metadatas=None) -> None:
+        """Overwrites the given fields of existing records; unknown IDs are ignored."""
+        with self._lock:
+            vectors = self._prepare(embeddings, documents, len(ids), required=False)
+            if vectors is not None:
+                self._write(ids, vectors, documents, metadatas,
+                            [i for i, doc_id in enumerate(ids) if doc_id in self._row_of])
+                return
+            for i, doc_id in enumerate(ids):
+                row = self._row_of.get(doc_id)
+                if row is None:
+                    continue
+                self._dirty = True
+                if documents is not None:
+                    self._documents[row] = documents[i]
+                if metadatas is not None:
+                    self._metadatas[row] = metadatas[i]
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        """Deletes records by ID and/or metadata filter. Rows are reclaimed on `persist`."""
+        with self._lock:
+            self._delete_rows(self._select_rows(ids, where))
+
+    def _delete_rows(self, rows: np.ndarray) -> None:
+        for row in rows:
+            self._row_of.pop(self._ids[row], None)
+            self._ids[row] = None
+            self._documents[row] = None
+            self._metadatas[row] = None
+        self._alive[rows] = False
+        self._lists = None
+        self._dirty = self._dirty or len(rows) > 0
+
+    def _prepare(self, embeddings, documents, n: int, required: bool = True) -> Optional[np.ndarray]:
+        if embeddings is None:
+            if documents is not None and self.embedding_function is not None:
+                embeddings = self.embedding_function(list(documents))
+            elif required:
+                raise ValueError("embeddings are required when no embedding_function is set")
+            else:
+                return None
+        vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+        if vectors.shape[0] != n:
+            raise ValueError(f"Got {vectors.shape[0]} embeddings for {n} ids")
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dimensions}")
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1.0, norms)
+        return vectors
+
+    def _write(self, ids, embeddings, documents, metadatas, positions) -> None:
+        """
+        Appends the records at `positions` as new rows. Rows of IDs that already exist are deleted and
+        their document and metadata carried over unless given, so stored vectors are never written twice.
+        """
+        vectors = self._prepare(embeddings, documents, len(ids))
+        # Duplicate IDs within one call: the last occurrence wins
+        last: Dict[str, int] = {}
+        for i in positions:
+            last[ids[i]] = i
+        positions = list(last.values())
+        if not positions:
+            return
+        new_documents, new_metadatas, replaced = [], [], []
+        for i in positions:
+            row = self._row_of.get(ids[i])
+            if row is not None:
+                replaced.append(row)
+            new_documents.append(documents[i] if documents is not None
+                                 else self._documents[row] if row is not None else None)
+            new_metadatas.append(metadatas[i] if metadatas is not None
+                                 else self._metadatas[row] if row is not None else None)
+        self._delete_rows(np.asarray(replaced, dtype=np.int64))
+
+        start, end = self._size, self._size + len(positions)
+        self._reserve(end)
+        self._store_vectors(start, vectors[positions])
+        for offset, i in enumerate(positions):
+            self._row_of[ids[i]] = start + offset
+        self._ids.extend(ids[i] for i in positions)
+        self._documents.extend(new_documents)
+        self._metadatas.extend(new_metadatas)
+        self._size = end
+        self._alive[start:end] = True
+        self._assign_rows(np.arange(start, end))
+        self._encode_rows(np.arange(start, end))
+
+    def _store_vectors(self, start: int, vectors: np.ndarray) -> None:
+        """
+        Stores new rows from `start`. Memory-mapped vectors are appended to their file and remapped, so
+        full-precision rows never move into memory; the header only counts them once they are persisted.
+        """
+        if isinstance(self._vectors, np.memmap):
+            path = self._vectors.filename
+            with open(path, "r+b") as f:
+                f.seek(start * self.dimensions * 4)
+                f.write(np.ascontiguousarray(vectors).tobytes())
+            self._map_vectors(path, start + len(vectors))
+        else:
+            self._vectors[start:start + len(vectors)] = vectors
+
+    def _map_vectors(self, path: str, rows: int) -> None:
+        if rows:
+            self._vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self.dimensions))
+        else:
+            self._vectors = np.empty((0, self.dimensions or 0), dtype=np.float32)
+
+    def _reserve(self, rows: int) -> None:
+        """Grows the per-row arrays, and vectors held in memory, geometrically so appends are amortized O(1)."""
+        capacity = len(self._alive)
+        if rows > capacity:
+            capacity = max(rows, capacity + capacity // 4, 1024)
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._alive = alive
+            assignments = np.full(capacity, -1, dtype=np.int32)
+            assignments[:self._size] = self._assignments[:self._size]
+            self._assignments = assignments
+            if self._codes is not None:
+                codes = np.zeros((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+                codes[:self._size] = self._codes[:self._size]
+                self._codes = codes
+        if not isinstance(self._vectors, np.memmap) and rows > self._vectors.shape[0]:
+            grown = np.empty((capacity, self.dimensions), dtype=np.float32)
+            if self._size:
+                grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes of full-precision vectors held in memory (0 while memory-mapped) and of quantized codes."""
+        with self._lock:
+            return {
+                "vectors": 0 if isinstance(self._vectors, np.memmap) else self._vectors.nbytes,
+                "codes": self._codes.nbytes if self._codes is not None else 0,
+            }
+
+    # ------------------------------------------------------------------ reads
+
+    def _select_rows(self, ids: Optional[Sequence[str]], where: Optional[Dict[str, Any]]) -> np.ndarray:
+        if ids is not None:
+            rows = [self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of]
+        else:
+            rows = np.flatnonzero(self._alive[:self._size]).tolist()
+        if where:
+            rows = [row for row in rows if _matches(self._metadatas[row], where)]
+        return np.asarray(rows, dtype=np.int64)
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, offset: int = 0,
+            include: Sequence[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        """Returns records by ID and/or metadata filter, in Chroma's `get` result format."""
+        with self._lock:
+            rows = self._select_rows(ids, where)
+            rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            return self._records(rows, include)
+
+    def _records(self, rows: np.ndarray, include: Sequence[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"ids": [self._ids[row] for row in rows]}
+        result["documents"] = [self._documents[row] for row in rows] if "documents" in include else None
+        result["metadatas"] = [self._metadatas[row] for row in rows] if "metadatas" in include else None
+        result["embeddings"] = self._vectors[rows] if "embeddings" in include else None
+        return result
+
+    def query(self, query_embeddings=None, query_texts: Optional[Sequence[str]] = None, n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict[str, Any]:
+        """
+        Finds the `n_results` nearest records of every query, in Chroma's `query` result format.
+
+        :param query_embeddings: One embedding or a (Q, dims) batch.
+        :param query_texts: Texts embedded with `embedding_function` instead of `query_embeddings`.
+        :param n_results: Results per query.
+        :param where: Metadata filter applied before scoring.
+        """
+        if query_embeddings is None:
+            if query_texts is None or self.embedding_function is None:
+                raise ValueError("query_embeddings, or query_texts with an embedding_function, are required")
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = np.array(query_embeddings, dtype=np.float32, ndmin=2)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries /= np.where(norms == 0, 1.0, norms)
+
+        with self._lock:
+            if self.quantization is not None and self._quantizer is None and self.count():
+                self.build_quantizer()
+            candidates = self._select_rows(None, where) if where else None
+            if self._size == 0 or (candidates is not None and len(candidates) == 0):
+                rows = np.empty((len(queries), 0), dtype=np.int64)
+                scores = np.empty((len(queries), 0), dtype=np.float32)
+            elif self._use_ivf():
+                rows, scores = self._search_ivf(queries, n_results, candidates)
+            else:
+                rows, scores = self._search_exact(queries, n_results, candidates)
+            return self._query_result(queries, rows, scores, include)
+
+    def _query_result(self, queries: np.ndarray, rows: List[np.ndarray], scores: List[np.ndarray],
+                      include: Sequence[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        for q, (row_ids, row_scores) in enumerate(zip(rows, scores)):
+            records = self._records(row_ids, include)
+            result["ids"].append(records["ids"])
+            result["documents"].append(records["documents"])
+            result["metadatas"].append(records["metadatas"])
+            result["embeddings"].append(records["embeddings"])
+            result["distances"].append(self._distances(queries[q], row_scores).tolist())
+        for key in ("documents", "metadatas", "embeddings", "distances"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def _scores(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """Similarity scores, larger is closer, for every (query, vector) pair."""
+        scores = queries @ vectors.T
+        if self.metric == "l2":
+            scores = 2 * scores - np.einsum("ij,ij->i", vectors, vectors)[None, :]
+        return scores
+
+    def _distances(self, query: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        if self.metric == "l2":
+            return np.maximum(float(query @ query) - scores, 0.0)
+        return 1.0 - scores
+
+    def _search_exact(self, queries: np.ndarray, k: int, candidates: Optional[np.ndarray]):
+        """Brute force search; with quantization over the codes, followed by a full-precision rescore."""
+        if self._quantizer is None:
+            return self._scan(queries, k, candidates, lambda block: self._scores(queries, self._vectors[block]))
+        rows, _ = self._scan(queries, k * self._rescore_factor(), candidates,
+                             lambda block: self._quantizer.scores(queries, self._codes[block]))
+        return self._rerank(queries, rows, k)
+
+    def _rerank(self, queries: np.ndarray, rows: List[np.ndarray], k: int):
+        """Rescores each query's candidate rows against the full-precision vectors."""
+        all_rows, all_scores = [], []
+        for q, candidate_rows in enumerate(rows):
+            candidate_rows = np.sort(candidate_rows)  # sequential reads from the memory map
+            scores = self._scores(queries[q:q + 1], self._vectors[candidate_rows])
+            top = _top_k(scores, k)[0]
+            all_rows.append(candidate_rows[top])
+            all_scores.append(scores[0, top])
+        return all_rows, all_scores
+
+    def _scan(self, queries: np.ndarray, k: int, candidates: Optional[np.ndarray],
+              score_block: Callable[[Any], np.ndarray]):
+        """Block-wise scan of all (or the candidate) rows, keeping a running top-k per query."""
+        if candidates is None and self.count() == self._size:
+            rows = None
+            total = self._size
+        else:
+            rows = candidates if candidates is not None else np.flatnonzero(self._alive[:self._size])
+            total = len(rows)
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, total, self.block_rows):
+            if rows is None:
+                block_rows = np.arange(start, min(start + self.block_rows, total))
+                scores = score_block(slice(start, start + len(block_rows)))
+            else:
+                block_rows = rows[start:start + self.block_rows]
+                scores = score_block(block_rows)
+            top = _top_k(scores, k)
+            merged_rows = np.concatenate([best_rows, block_rows[top]], axis=1)
+            merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            keep = _top_k(merged_scores, k)
+            best_rows = np.take_along_axis(merged_rows, keep, axis=1)
+            best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        return list(best_rows), list(best_scores)
+
+    # ------------------------------------------------------------------ IVF
+
+    def _use_ivf(self) -> bool:
+        return self.index_type == "ivf" and self.count() >= self.ivf_min_rows
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, sample_size: int = 100_000,
+                  seed: int = 0) -> None:
+        """Trains the IVF coarse quantizer with k-means on a sample and assigns every row to a list."""
+        with self._lock:
+            alive = np.flatnonzero(self._alive[:self._size])
+            if len(alive) == 0:
+                return
+            n_lists = n_lists or self.n_lists or max(1, int(np.sqrt(len(alive))))
+            n_lists = min(n_lists, len(alive))
+            rng = np.random.default_rng(seed)
+            sample = self._vectors[rng.choice(alive, size=min(sample_size, len(alive)), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(self._scores(sample, centroids), axis=1)
+                for c in range(n_lists):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                if self.metric == "cosine":
+                    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+                    centroids /= np.where(norms == 0, 1.0, norms)
+            self.n_lists = n_lists
+            self._centroids = centroids
+            self._assign_rows(np.arange(self._size))
+            self._ivf_changed = True
+
+    def _assign_rows(self, rows: np.ndarray) -> None:
+        if self._centroids is None or len(rows) == 0:
+            return
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            self._assignments[block] = np.argmax(self._scores(self._vectors[block], self._centroids), axis=1)
+        self._lists = None
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            alive = np.flatnonzero(self._alive[:self._size])
+            labels = self._assignments[alive]
+            order = np.argsort(labels, kind="stable")
+            bounds = np.searchsorted(labels[order], np.arange(len(self._centroids) + 1))
+            self._lists = [alive[order[bounds[c]:bounds[c + 1]]] for c in range(len(self._centroids))]
+        return self._lists
+
+    def _search_ivf(self, queries: np.ndarray, k: int, candidates: Optional[np.ndarray]):
+        if self._centroids is None:
+            self.build_ivf()
+        lists = self._inverted_lists()
+        probes = _top_k(self._scores(queries, self._centroids), self.n_probe)
+        allowed = None
+        if candidates is not None:
+            allowed = np.zeros(self._size, dtype=bool)
+            allowed[candidates] = True
+        all_rows, all_scores = [], []
+        for q, probe in enumerate(probes):
+            rows = np.concatenate([lists[c] for c in probe])
+            if allowed is not None:
+                rows = rows[allowed[rows]]
+            if self._quantizer is not None and len(rows) > k * self._rescore_factor():
+                approx = self._quantizer.scores(queries[q:q + 1], self._codes[rows])
+                rows = np.sort(rows[_top_k(approx, k * self._rescore_factor())[0]])
+            scores = self._scores(queries[q:q + 1], self._vectors[rows])
+            top = _top_k(scores, k)[0]
+            all_rows.append(rows[top])
+            all_scores.append(scores[0, top])
+        return all_rows, all_scores
+
+    # ------------------------------------------------------------------ quantization
+
+    def build_quantizer(self, sample_size: int = 100_000, seed: int = 0) -> None:
+        """Trains the quantizer on a sample of the vectors and encodes every row."""
+        with self._lock:
+            alive = np.flatnonzero(self._alive[:self._size])
+            if self.quantization is None or len(alive) == 0:
+                return
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(alive, size=min(sample_size, len(alive)), replace=False))
+            quantizer = self._new_quantizer()
+            quantizer.train(self._vectors[sample])
+            self._quantizer = quantizer
+            self._codes = np.zeros((len(self._alive), quantizer.code_width()), dtype=quantizer.dtype)
+            self._encode_rows(np.arange(self._size))
+            self._quantizer_changed = True
+
+    def _new_quantizer(self):
+        if self.quantization == MatryoshkaQuantizer.kind:
+            return MatryoshkaQuantizer(self.dimensions, self.coarse_dimensions)
+        return QUANTIZERS[self.quantization](self.dimensions)
+
+    def _encode_rows(self, rows: np.ndarray) -> None:
+        if self._quantizer is None or len(rows) == 0:
+            return
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            self._codes[block] = self._quantizer.encode(self._vectors[block])
+
+    def _rescore_factor(self) -> int:
+        return self.rescore or self._quantizer.default_rescore
+
+    # ------------------------------------------------------------------ persistence
+
+    def persist(self, persist_directory: Optional[str] = None) -> None:
+        """
+        Writes the index to `persist_directory`.
+
+        When records were only appended since the last persist, the new rows are appended to the
+        vector and record files; after updates or deletes the index is compacted and rewritten.
+        Vectors are copied block-wise and memory-mapped afterwards, so only the per-row state and
+        the quantized codes stay in memory. The header is replaced last, so a crash while appending
+        leaves the previous state loadable.
+        """
+        directory = persist_directory or self.persist_directory
+        if directory is None:
+            raise ValueError("No persist_directory set")
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            vectors_path = os.path.join(directory, VECTORS_FILE)
+            records_path = os.path.join(directory, RECORDS_FILE)
+            mapped = isinstance(self._vectors, np.memmap)
+            rewrite = (self._dirty or directory != self.persist_directory or self.count() != self._size
+                       or not os.path.exists(vectors_path) or not os.path.exists(records_path))
+            if rewrite:
+                alive = np.flatnonzero(self._alive[:self._size])
+                # Mapped vectors of this directory already hold every row unless some were deleted
+                if not (mapped and directory == self.persist_directory and len(alive) == self._size):
+                    self._copy_vectors(alive, vectors_path)
+                self._compact(alive)
+                first_row, records_bytes = 0, 0
+            else:
+                first_row, records_bytes = self._persisted_rows, self._records_bytes
+                if first_row == self._size and not self._ivf_changed and not self._quantizer_changed:
+                    return
+                with open(vectors_path, "r+b") as f:
+                    if not mapped:
+                        f.seek(first_row * (self.dimensions or 0) * 4)
+                        f.truncate()
+                        f.write(np.ascontiguousarray(self._vectors[first_row:self._size]).tobytes())
+                        f.flush()
+                    os.fsync(f.fileno())
+
+            with open(records_path, "wb" if rewrite else "r+b") as f:
+                f.seek(records_bytes)
+                f.truncate()
+                for row in range(first_row, self._size):
+                    record = {"id": self._ids[row], "document": self._documents[row],
+                              "metadata": self._metadatas[row]}
+                    f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+                records_bytes = f.tell()
+                f.flush()
+                os.fsync(f.fileno())
+
+            ivf_path = os.path.join(directory, IVF_FILE)
+            if self._centroids is not None:
+                np.savez(ivf_path, centroids=self._centroids, assignments=self._assignments[:self._size])
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+
+            codes_path = os.path.join(directory, CODES_FILE)
+            quantizer_path = os.path.join(directory, QUANTIZER_FILE)
+            if self._quantizer is not None:
+                # Codes are appended like the vectors unless the quantizer was retrained
+                codes_from = 0 if rewrite or self._quantizer_changed or not os.path.exists(codes_path) else first_row
+                with open(codes_path, "r+b" if codes_from else "wb") as f:
+                    f.seek(codes_from * self._codes.shape[1] * self._codes.itemsize)
+                    f.truncate()
+                    f.write(np.ascontiguousarray(self._codes[codes_from:self._size]).tobytes())
+                if self._quantizer_changed or not os.path.exists(quantizer_path):
+                    np.savez(quantizer_path, kind=self._quantizer.kind, **self._quantizer.state())
+            else:
+                for path in (codes_path, quantizer_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            header = {
+                "name": self.name,
+                "metric": self.metric,
+                "index_type": self.index_type,
+                "n_lists": self.n_lists,
+                "n_probe": self.n_probe,
+                "quantization": self.quantization,
+                "rescore": self.rescore,
+                "coarse_dimensions": self.coarse_dimensions,
+                "dimensions": self.dimensions,
+                "count": self._size,
+                "records_bytes": records_bytes,
+            }
+            tmp_path = os.path.join(directory, f"{INDEX_FILE}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(header, f)
+            os.replace(tmp_path, os.path.join(directory, INDEX_FILE))
+
+            self.persist_directory = directory
+            self._persisted_rows = self._size
+            self._records_bytes = records_bytes
+            self._dirty = False
+            self._ivf_changed = False
+            self._quantizer_changed = False
+            # From now on new rows are appended to the vector file instead of held in memory
+            self._map_vectors(vectors_path, self._size)
+
+    def _copy_vectors(self, rows: np.ndarray, path: str) -> None:
+        """Writes the vectors of `rows` to `path` block-wise, through a temporary file."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for start in range(0, len(rows), self.block_rows):
+                f.write(np.ascontiguousarray(self._vectors[rows[start:start + self.block_rows]]).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        # A mapping of the replaced file stays readable until it is remapped
+        os.replace(tmp_path, path)
+
+    def _compact(self, alive: np.ndarray) -> None:
+        """Drops deleted rows from the per-row state; vectors are compacted by `_copy_vectors`."""
+        if len(alive) == self._size:
+            return
+        self._assignments = self._assignments[alive]
+        if self._codes is not None:
+            self._codes = self._codes[alive]
+        self._ids = [self._ids[row] for row in alive]
+        self._documents = [self._documents[row] for row in alive]
+        self._metadatas = [self._metadatas[row] for row in alive]
+        self._size = len(alive)
+        self._alive = np.ones(self._size, dtype=bool)
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._lists = None
+
+    @classmethod
+    def load(cls, persist_directory: str, embedding_function: Optional[Callable[[List[str]], Any]] = None,
+             **kwargs) -> "LocalVectorIndex":
+        """Opens a persisted index; its vectors stay memory-mapped, also when records are added."""
+        with open(os.path.join(persist_directory, INDEX_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        params = {key: header.get(key) for key in ("metric", "index_type", "n_lists", "n_probe", "quantization",
+                                                   "rescore", "coarse_dimensions")}
+        params.update(kwargs)
+        index = cls(header["name"], persist_directory=persist_directory, embedding_function=embedding_function,
+                    **params)
+        index.dimensions = header["dimensions"]
+        size = header["count"]
+        with open(os.path.join(persist_directory, RECORDS_FILE), "rb") as f:
+            for line in f.read(header["records_bytes"]).splitlines():
+                record = json.loads(line)
+                index._ids.append(record["id"])
+                index._documents.append(record["document"])
+                index._metadatas.append(record["metadata"])
+        index._size = size
+        index._row_of = {doc_id: row for row, doc_id in enumerate(index._ids)}
+        index._alive = np.ones(size, dtype=bool)
+        index._assignments = np.full(size, -1, dtype=np.int32)
+        index._map_vectors(os.path.join(persist_directory, VECTORS_FILE), size)
+        ivf_path = os.path.join(persist_directory, IVF_FILE)
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            if len(ivf["assignments"]) == size:
+                index._centroids = ivf["centroids"]
+                index._assignments = ivf["assignments"].astype(np.int32)
+        quantizer_path = os.path.join(persist_directory, QUANTIZER_FILE)
+        codes_path = os.path.join(persist_directory, CODES_FILE)
+        if index.quantization is not None and os.path.exists(quantizer_path) and os.path.exists(codes_path):
+            state = dict(np.load(quantizer_path))
+            if str(state.pop("kind")) == index.quantization:
+                quantizer = QUANTIZERS[index.quantization].from_state(index.dimensions, state)
+                width = quantizer.code_width()
+                codes = np.fromfile(codes_path, dtype=quantizer.dtype)
+                # Codes of different settings (e.g. another coarse_dimensions) are rebuilt on first query
+                if width == index._new_quantizer().code_width() and len(codes) >= size * width:
+                    index._quantizer = quantizer
+                    index._codes = codes[:size * width].reshape(size, width)
+        index._persisted_rows = size
+        index._records_bytes = header["records_bytes"]
+        return index
+
+    @classmethod
+    def open(cls, name: str, persist_directory: str, **kwargs) -> "LocalVectorIndex":
+        """Loads the index from `persist_directory` if it exists, otherwise creates an empty one."""
+        if os.path.exists(os.path.join(persist_directory, INDEX_FILE)):
+            embedding_function = kwargs.pop("embedding_function", None)
+            return cls.load(persist_directory, embedding_function=embedding_function, **kwargs)
+        return cls(name, persist_directory=persist_directory, **kwargs)